@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of each stage of the conversion over the bundled samples.
+
+For every sample (a .will file or an unzipped WILL tree) and every scale
+factor, it times separately: the zip read (readWillProtobuff), the framing
+(index_strokes), the per message decode (decodeMessagePacket), the varint
+decoding of the packed arrays (python and numpy), the StrokeSet decode, the
+computation of its stroke bounding boxes and of the spatial index, the load of
+its binary form (StrokeSet.load), the stroke simplification, the Bezier fit,
+the variable width outlines, the PNG rendering (will_raster, numpy rasterizer)
+and the SVG emission (XYLineDataToSVG, and with the numbers at the stroke
+precision, absolute and relative). Scaled samples are synthetic notebooks
+whose paths.protobuf repeats the sample strokes, written to a temporary .will.
+Each case runs in a fresh process so its peak RSS can be reported.
+
+Results can be saved as a baseline and later runs compared against it, so
+regressions show up as a diff.
+
+@author: ninguem
+"""
+from concurrent.futures import ProcessPoolExecutor
+from zipfile import ZipFile, ZIP_DEFLATED
+import os
+import io
+import sys
+import json
+import time
+import resource
+import tempfile
+import shutil
+import argparse
+
+import will_reader
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SAMPLES = ['WCM0006.will', 'WCM0007.will', 'IntuosProPaper.will', 'IntuosProPaper']
+
+SIMPLIFY_TOLERANCE = 0.05
+
+FIT_TOLERANCE = 0.5
+
+
+def bestTime(function, repeat):
+    """ bestTime(function, repeat)
+Returns the minimum time in seconds of repeat calls to function and the
+result of the last call.
+    """
+
+    best = float('inf')
+    for n in range(repeat):
+        startTime = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - startTime)
+
+    return (best, result)
+
+
+def makeSyntheticWill(sample, scale, directory):
+    """ makeSyntheticWill(sample, scale, directory)
+Writes a .will file whose paths.protobuf is the one of sample repeated scale
+times, and returns its name.
+
+sample    : .will file or unzipped WILL tree
+scale     : number of copies of the strokes
+directory : where to write the file
+    """
+
+    outputFile = os.path.join(directory, f'{os.path.basename(sample.rstrip(os.sep))}_x{scale}.will')
+    with ZipFile(outputFile, 'w', ZIP_DEFLATED) as output_zip:
+        output_zip.writestr(will_reader.PATHS_MEMBER, readSample(sample)*scale)
+
+    return outputFile
+
+
+def readSample(sample):
+    """ readSample(sample)
+Returns the paths.protobuf bytes of a .will file or of an unzipped WILL tree.
+    """
+
+    if os.path.isdir(sample):
+        with open(os.path.join(sample, will_reader.PATHS_MEMBER), 'rb') as f:
+            return f.read()
+
+    return will_reader.readWillProtobuff(sample)
+
+
+def benchmarkCase(sample, repeat):
+    """ benchmarkCase(sample, repeat)
+Times every stage on one sample and returns a dictionary with the number of
+strokes and points, the best time of each stage, the points/s of each stage
+and the peak RSS in KB of the process.
+    """
+
+    stages = {}
+
+    stages['read'], buffer = bestTime(lambda: readSample(sample), repeat)
+    stages['framing'], index = bestTime(lambda: will_reader.index_strokes(buffer), repeat)
+    messages = [buffer[start:start+length] for start, length in index]
+    stages['decode_messages'], strokes = bestTime(lambda: [will_reader.decodeMessagePacket(m) for m in messages], repeat)
+
+    packed = []
+    for messageBytes in messages:
+        values = will_reader.decodeStrokeFields(messageBytes, will_reader.GEOMETRY_FIELDS)
+        packed.extend((values['points'], values['strokeWidths']))
+    stages['varint_python'], _ = bestTime(lambda: [will_reader.decodeVarintArrayPython(p) for p in packed], repeat)
+    if will_reader.importNumpy() is not None:
+        stages['varint_numpy'], _ = bestTime(lambda: will_reader.decodeVarintArraysNumpy(packed), repeat)
+        stages['decode_strokeset'], strokeSet = bestTime(lambda: will_reader.decodeStrokeSet(buffer), repeat)
+        stages['bounding_boxes'], _ = bestTime(strokeSet.computeBoxes, repeat)
+        from will_index import StrokeIndex
+        stages['build_index'], _ = bestTime(lambda: StrokeIndex.fromStrokeSet(strokeSet), repeat)
+        stagesFile = os.path.join(tempfile.gettempdir(), f'bench_stages_{os.getpid()}.strokes')
+        try:
+            strokeSet.save(stagesFile)
+            stages['load_strokeset'], _ = bestTime(lambda: will_reader.StrokeSet.load(stagesFile), repeat)
+        finally:
+            os.remove(stagesFile)
+
+        from will_simplify import StrokeSimplifier
+        stages['simplify'], _ = bestTime(lambda: list(StrokeSimplifier(SIMPLIFY_TOLERANCE).simplify(strokes)), repeat)
+        from will_fit import strokesPathData
+        stages['fit'], _ = bestTime(lambda: strokesPathData([(x, y) for x, y, lineWidth in strokes], FIT_TOLERANCE), repeat)
+        from will_outline import outlinePathData
+        stages['outline'], _ = bestTime(lambda: outlinePathData([(x, y, width*will_reader.STROKE_WIDTH_SCALE) for x, y, width in strokeSet]), repeat)
+        from will_raster import rasterizeStrokes, encodePNG
+        stages['raster_png'], _ = bestTime(lambda: encodePNG(rasterizeStrokes(strokeSet, backend='numpy')), repeat)
+
+    xData = [x for x, y, lineWidth in strokes]
+    yData = [y for x, y, lineWidth in strokes]
+    lineData = [lineWidth for x, y, lineWidth in strokes]
+    stages['svg'], svgStr = bestTime(lambda: will_reader.XYLineDataToSVG(xData, yData, lineData), repeat)
+    precisionStrokes = [will_reader.decodeMessagePacket(m, withPrecision=True) for m in messages]
+    stages['svg_compact'], _ = bestTime(lambda: will_reader.writeSVG(io.StringIO(), precisionStrokes), repeat)
+    stages['svg_relative'], _ = bestTime(lambda: will_reader.writeSVG(io.StringIO(), precisionStrokes, relative=True), repeat)
+
+    numPoints = sum(len(x) for x in xData)
+
+    return {
+        'strokes': len(strokes),
+        'points': numPoints,
+        'bytes': len(buffer),
+        'svg_bytes': len(svgStr),
+        'seconds': stages,
+        'points_per_second': {stage: numPoints/seconds if seconds > 0 else 0 for stage, seconds in stages.items()},
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def runBenchmarks(samples, scales, repeat):
+    """ runBenchmarks(samples, scales, repeat)
+Runs benchmarkCase for every sample and scale, each one in a fresh process,
+and returns a dictionary case name -> result.
+    """
+
+    results = {}
+    tempDir = tempfile.mkdtemp()
+    try:
+        for sample in samples:
+            for scale in scales:
+                caseFile = sample if scale == 1 else makeSyntheticWill(sample, scale, tempDir)
+                caseName = f'{os.path.basename(sample.rstrip(os.sep))} x{scale}'
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    results[caseName] = executor.submit(benchmarkCase, caseFile, repeat).result()
+                printCase(caseName, results[caseName])
+    finally:
+        shutil.rmtree(tempDir)
+
+    return results
+
+
+def printCase(caseName, result):
+    """ printCase(caseName, result)
+Prints the timings of one case.
+    """
+
+    print(f'{caseName}: {result["strokes"]} strokes, {result["points"]} points, {result["bytes"]} bytes, peak RSS {result["peak_rss_kb"]/1024:.1f} MB')
+    for stage, seconds in result['seconds'].items():
+        print(f'  {stage:18s} {seconds*1000:10.2f} ms {result["points_per_second"][stage]/1e6:10.2f} Mpoints/s')
+
+
+def compareResults(baseline, results, threshold):
+    """ compareResults(baseline, results, threshold)
+Prints the change of every stage time against the baseline and returns the
+number of stages slower than the baseline by more than threshold (a fraction).
+    """
+
+    numRegressions = 0
+    print(f'\nchange against the baseline (regression above {threshold*100:.0f}%):')
+    for caseName, result in results.items():
+        if caseName not in baseline:
+            continue
+        for stage, seconds in result['seconds'].items():
+            baseSeconds = baseline[caseName]['seconds'].get(stage)
+            if not baseSeconds:
+                continue
+            change = seconds/baseSeconds - 1
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                numRegressions += 1
+            print(f'  {caseName:24s} {stage:18s} {baseSeconds*1000:10.2f} -> {seconds*1000:10.2f} ms {change*100:+7.1f}%{flag}')
+        baseRss = baseline[caseName].get('peak_rss_kb')
+        if baseRss:
+            print(f'  {caseName:24s} {"peak_rss":18s} {baseRss/1024:10.1f} -> {result["peak_rss_kb"]/1024:10.1f} MB {(result["peak_rss_kb"]/baseRss - 1)*100:+7.1f}%')
+
+    return numRegressions
+
+
+if __name__=='__main__':
+
+    parser = argparse.ArgumentParser(description='Time each stage of the WILL to SVG conversion on the bundled samples.')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='number of runs of each stage, the best is reported (default: 3)')
+    parser.add_argument('-s', '--scales', default='1,10,100', help='comma separated scale factors of the synthetic notebooks (default: 1,10,100)')
+    parser.add_argument('--save', default=None, help='save the results as a baseline JSON file')
+    parser.add_argument('--compare', default=None, help='compare the results with a baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown fraction reported as a regression (default: 0.2)')
+    parser.add_argument(dest='samples', nargs='*', default=[os.path.join(CODE_DIR, sample) for sample in DEFAULT_SAMPLES], help='.will files or unzipped WILL trees (default: the bundled samples)')
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.samples, [int(scale) for scale in args.scales.split(',')], args.repeat)
+
+    if args.save:
+        with open(args.save, 'wt') as f:
+            json.dump(results, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compareResults(baseline, results, args.threshold) else 0)
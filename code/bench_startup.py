@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup time benchmark of will_reader.
+
+Measures, in fresh interpreters, the time to import will_reader and the time
+of a complete conversion of a sample file, and checks that the conversion path
+imports neither matplotlib nor numpy (only the plots and the vectorized paths
+need them). Exits with 1 if a limit is exceeded, so it can be used to guard
+against regressions.
+
+@author: ninguem
+"""
+import os
+import sys
+import subprocess
+import tempfile
+import shutil
+import statistics
+import argparse
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# modules that the import and the default conversion must not load
+HEAVY_MODULES = ('matplotlib', 'numpy')
+
+# default limits of the minimum times, a few times what they take on a laptop
+MAX_IMPORT_MS = 100.0
+MAX_CONVERT_MS = 600.0
+
+IMPORT_SNIPPET = '''
+import sys, time
+t = time.perf_counter()
+import will_reader
+print(time.perf_counter() - t)
+print(','.join(sorted(set(sys.argv[1].split(',')) & set(sys.modules))) or '-')
+'''
+
+CONVERT_SNIPPET = '''
+import sys, time
+t = time.perf_counter()
+import will_reader
+will_reader.convertFile(sys.argv[2], sys.argv[3])
+print(time.perf_counter() - t)
+print(','.join(sorted(set(sys.argv[1].split(',')) & set(sys.modules))) or '-')
+'''
+
+
+def runSnippet(snippet, *args):
+    """ runSnippet(snippet, *args)
+Runs the snippet in a new interpreter and returns its (seconds, heavyModules)
+output, heavyModules being the set of the HEAVY_MODULES it imported.
+
+snippet : python code that prints the elapsed time and the heavy modules that
+          got imported
+args    : extra command line arguments for the snippet
+    """
+
+    result = subprocess.run([sys.executable, '-c', snippet, ','.join(HEAVY_MODULES)] + list(args), cwd=CODE_DIR,
+                            capture_output=True, text=True, check=True)
+    seconds, heavyModules = result.stdout.split()
+
+    return (float(seconds), set(heavyModules.split(',')) - {'-'})
+
+
+def benchmark(snippet, repeat, *args):
+    """ benchmark(snippet, repeat, *args)
+Runs the snippet repeat times and returns the (min, median) time in seconds and
+the set of the heavy modules imported in any run.
+    """
+
+    times = []
+    heavyModules = set()
+    for n in range(repeat):
+        seconds, imported = runSnippet(snippet, *args)
+        times.append(seconds)
+        heavyModules |= imported
+
+    return (min(times), statistics.median(times), heavyModules)
+
+
+if __name__=='__main__':
+
+    parser = argparse.ArgumentParser(description='Measure the startup time of will_reader in fresh interpreters.')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='number of runs (default: 5)')
+    parser.add_argument('--sample', default=os.path.join(CODE_DIR, 'WCM0007.will'), help='.will file converted in the conversion run')
+    parser.add_argument('--max-import-ms', type=float, default=MAX_IMPORT_MS, help=f'fail if the minimum import time exceeds this (default: {MAX_IMPORT_MS:g}, 0 for no limit)')
+    parser.add_argument('--max-convert-ms', type=float, default=MAX_CONVERT_MS, help=f'fail if the minimum conversion time exceeds this (default: {MAX_CONVERT_MS:g}, 0 for no limit)')
+    args = parser.parse_args()
+
+    failed = False
+
+    minTime, medianTime, heavyModules = benchmark(IMPORT_SNIPPET, args.repeat)
+    print(f'import will_reader:  min {minTime*1000:7.1f} ms   median {medianTime*1000:7.1f} ms')
+    for module in sorted(heavyModules):
+        print(f'  FAIL: importing will_reader imports {module}')
+        failed = True
+    if args.max_import_ms and minTime*1000 > args.max_import_ms:
+        print(f'  FAIL: above {args.max_import_ms} ms')
+        failed = True
+
+    tempDir = tempfile.mkdtemp()
+    try:
+        outputFile = os.path.join(tempDir, 'out.svg')
+        minTime, medianTime, heavyModules = benchmark(CONVERT_SNIPPET, args.repeat, args.sample, outputFile)
+    finally:
+        shutil.rmtree(tempDir)
+    print(f'import + convert:    min {minTime*1000:7.1f} ms   median {medianTime*1000:7.1f} ms   ({os.path.basename(args.sample)})')
+    for module in sorted(heavyModules):
+        print(f'  FAIL: the conversion imports {module}')
+        failed = True
+    if args.max_convert_ms and minTime*1000 > args.max_convert_ms:
+        print(f'  FAIL: above {args.max_convert_ms} ms')
+        failed = True
+
+    sys.exit(1 if failed else 0)
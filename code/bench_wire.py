@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the wire format decoding.
+
+Compares, on the bundled samples, the protobuf private decoder the readers
+used to import (google.protobuf.internal.decoder._DecodeVarint32, skipped if
+protobuf is not installed) with will_wire, for the message framing and for the
+packed varint arrays, and with the numpy decoder of will_reader.
+
+@author: ninguem
+"""
+import os
+import time
+import argparse
+
+import will_wire
+import will_reader
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def bestTime(function, repeat):
+    """ bestTime(function, repeat)
+Returns the minimum time in seconds of repeat calls to function.
+    """
+
+    times = []
+    for n in range(repeat):
+        startTime = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - startTime)
+
+    return min(times)
+
+
+def framingWith(decodeVarint32):
+    """ framingWith(decodeVarint32)
+Returns a function that splits a buffer in messages with the given varint
+decoder, as processBuffer does.
+    """
+
+    def framing(buffer):
+        messages = []
+        buffPos = 0
+        while buffPos < len(buffer):
+            messageLength, buffPos = decodeVarint32(buffer, buffPos)
+            messages.append(buffer[buffPos:buffPos+messageLength])
+            buffPos += messageLength
+        return messages
+
+    return framing
+
+
+def packedWith(decodeVarint32):
+    """ packedWith(decodeVarint32)
+Returns a function that decodes a packed varint array one value at a time with
+the given varint decoder, as decodeVarintArray used to do.
+    """
+
+    def packed(strBytes):
+        values = []
+        nextPos = 0
+        while nextPos < len(strBytes):
+            value, nextPos = decodeVarint32(strBytes, nextPos)
+            values.append(value)
+        return values
+
+    return packed
+
+
+def packedFields(messages):
+    """ packedFields(messages)
+Returns all the length-delimited fields (points, widths, colors) of the
+messages.
+    """
+
+    fields = []
+    for messageBytes in messages:
+        pos = 0
+        while pos < len(messageBytes):
+            tag, pos = will_wire.decodeVarint(messageBytes, pos)
+            field, wireType = will_wire.unpackTag(tag)
+            if wireType == will_wire.WIRETYPE_LENGTH_DELIMITED:
+                value, pos = will_wire.decodeLengthDelimited(messageBytes, pos)
+                fields.append(value)
+            else:
+                pos = will_wire.skipField(messageBytes, pos, wireType)
+
+    return fields
+
+
+if __name__=='__main__':
+
+    parser = argparse.ArgumentParser(description='Compare protobuf internals, will_wire and numpy varint decoding.')
+    parser.add_argument('-n', '--repeat', type=int, default=20, help='number of runs, the best is reported (default: 20)')
+    parser.add_argument(dest='files', nargs='*', default=[os.path.join(CODE_DIR, 'WCM0006.will'), os.path.join(CODE_DIR, 'WCM0007.will')], help='.will files (default: WCM0006.will WCM0007.will)')
+    args = parser.parse_args()
+
+    startTime = time.perf_counter()
+    try:
+        from google.protobuf.internal.decoder import _DecodeVarint32
+    except ImportError:
+        _DecodeVarint32 = None
+    protobufImportTime = time.perf_counter() - startTime
+    if _DecodeVarint32 is None:
+        print('protobuf not installed, only will_wire and numpy are measured')
+    else:
+        print(f'import google.protobuf.internal.decoder: {protobufImportTime*1000:.1f} ms')
+
+    for fileName in args.files:
+        buffer = will_reader.readWillProtobuff(fileName)
+        messages = framingWith(will_wire.decodeVarint32)(buffer)
+        fields = packedFields(messages)
+        numBytes = sum(len(f) for f in fields)
+        print(f'\n{os.path.basename(fileName)}: {len(buffer)} bytes, {len(messages)} messages, {numBytes} bytes of packed varints')
+
+        results = []
+        if _DecodeVarint32 is not None:
+            results.append(('framing   protobuf _DecodeVarint32', bestTime(lambda: framingWith(_DecodeVarint32)(buffer), args.repeat)))
+        results.append(('framing   will_wire.decodeVarint32', bestTime(lambda: framingWith(will_wire.decodeVarint32)(buffer), args.repeat)))
+        if _DecodeVarint32 is not None:
+            packed = packedWith(_DecodeVarint32)
+            results.append(('packed    protobuf _DecodeVarint32', bestTime(lambda: [packed(f) for f in fields], args.repeat)))
+        results.append(('packed    will_wire.decodePackedVarints', bestTime(lambda: [will_wire.decodePackedVarints(f) for f in fields], args.repeat)))
+        if will_reader.importNumpy() is not None:
+            results.append(('packed    numpy decodeVarintArrayNumpy', bestTime(lambda: [will_reader.decodeVarintArrayNumpy(f) for f in fields], args.repeat)))
+
+        for name, seconds in results:
+            print(f'  {name:42s} {seconds*1000:8.2f} ms')
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of will_batch: the converted files are the ones of will_reader, and the
+process and chunk counts below 1 are refused before any pool is started.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import io
+import os
+import shutil
+import argparse
+
+import pytest
+
+import will_reader
+import will_batch
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.mark.parametrize('value', ['0', '-2', 'a', '1.5'])
+def testPositiveIntRefused(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        will_batch.positiveInt(value)
+
+
+def testPositiveInt():
+    assert will_batch.positiveInt('1') == 1
+    assert will_batch.positiveInt('8') == 8
+
+
+@pytest.mark.parametrize('jobs, chunkSize', [(0, 1), (-1, 1), (1, 0)])
+def testConvertBatchRefused(jobs, chunkSize):
+    with pytest.raises(ValueError):
+        will_batch.convertBatch([], jobs=jobs, chunkSize=chunkSize, out=io.StringIO())
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def testConvertBatch(tmp_path, jobs):
+    files = []
+    for name in ['WCM0006.will', 'WCM0007.will']:
+        shutil.copyfile(os.path.join(HERE, name), tmp_path / name)
+        files.append(str(tmp_path / name))
+    files.append(str(tmp_path / 'missing.will'))
+
+    out = io.StringIO()
+    assert will_batch.convertBatch(files, jobs=jobs, out=out) == 1
+
+    report = out.getvalue().splitlines()
+    assert [line.split()[0] for line in report[:3]] == ['OK', 'OK', 'FAILED']
+    for inputFile in files[:2]:
+        with open(inputFile, 'rb') as f:
+            data = f.read()
+        with open(inputFile[:-len('.will')] + '.svg') as f:
+            assert f.read() == will_reader.convertBytes(data)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of will_cache: a cached conversion gives the file of a fresh one, the
+least recently used entries are evicted first, and an entry evicted by another
+process while it is read is a miss, not a failed conversion.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import os
+import zipfile
+
+import pytest
+
+import will_reader
+import will_cache
+from will_cache import ConversionCache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE = os.path.join(HERE, 'WCM0007.will')
+
+
+def readFile(fileName, mode='rt'):
+    with open(fileName, mode) as f:
+        return f.read()
+
+
+def testHashIgnoresZip(tmp_path):
+    # the same paths.protobuf, stored instead of deflated and with other dates
+    copyFile = str(tmp_path / 'copy.will')
+    with zipfile.ZipFile(SAMPLE) as source, zipfile.ZipFile(copyFile, 'w') as f:
+        for info in source.infolist():
+            f.writestr(zipfile.ZipInfo(info.filename, (2001, 2, 3, 4, 5, 6)), source.read(info))
+
+    assert will_cache.hashWillProtobuff(copyFile) == will_cache.hashWillProtobuff(SAMPLE)
+
+
+def testConvertFile(tmp_path):
+    cache = ConversionCache(str(tmp_path / 'cache'))
+    expected = will_reader.convertBytes(readFile(SAMPLE, 'rb'))
+
+    counts = [will_reader.convertFile(SAMPLE, str(tmp_path / f'out{n}.svg'), cache=cache) for n in range(2)]
+    assert counts[0][0] == 240 and counts[1] == counts[0]
+    for n in range(2):
+        assert readFile(str(tmp_path / f'out{n}.svg')) == expected
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # other options, other entry
+    will_reader.convertFile(SAMPLE, str(tmp_path / 'poly.svg'), poly=True, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert len(cache.entries()) == 2
+
+
+def writeEntry(cache, key, size):
+    cache.store(key, lambda f: f.write(b'x'*size), {'size': size})
+
+
+def testEvictEntries(tmp_path):
+    cache = ConversionCache(str(tmp_path), maxEntries=2)
+    writeEntry(cache, 'a', 10)
+    writeEntry(cache, 'b', 10)
+    # a is used again, so b is now the oldest
+    os.utime(cache.path('b', '.svg'), (1, 1))
+    assert cache.get('a') is not None
+    writeEntry(cache, 'c', 10)
+
+    assert cache.get('b') is None
+    assert cache.get('a')[1] == {'size': 10}
+    assert cache.get('c')[1] == {'size': 10}
+
+
+def testEvictBytes(tmp_path):
+    cache = ConversionCache(str(tmp_path), maxBytes=1000)
+    writeEntry(cache, 'a', 600)
+    os.utime(cache.path('a', '.svg'), (1, 1))
+    writeEntry(cache, 'b', 600)
+
+    assert cache.get('a') is None
+    assert cache.get('b') is not None
+    assert not os.path.exists(cache.path('a', '.json'))
+
+
+def evictOnGet(cache, monkeypatch):
+    """ evictOnGet(cache, monkeypatch)
+Makes the entries of cache disappear between get and their use, as if another
+process evicted them.
+    """
+
+    get = cache.get
+
+    def getEvicted(key, suffix='.svg'):
+        entry = get(key, suffix)
+        if entry is not None:
+            os.remove(entry[0])
+        return entry
+
+    monkeypatch.setattr(cache, 'get', getEvicted)
+
+
+def testCopyEvicted(tmp_path, monkeypatch):
+    cache = ConversionCache(str(tmp_path / 'cache'))
+    outputFile = str(tmp_path / 'out.svg')
+    will_reader.convertFile(SAMPLE, outputFile, cache=cache)
+    os.remove(outputFile)
+
+    evictOnGet(cache, monkeypatch)
+    assert will_reader.convertFile(SAMPLE, outputFile, cache=cache)[0] == 240
+    assert readFile(outputFile) == will_reader.convertBytes(readFile(SAMPLE, 'rb'))
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def testStrokeIndex(tmp_path, monkeypatch):
+    pytest.importorskip('numpy')
+    import will_index
+    cache = ConversionCache(str(tmp_path))
+    strokes, index = will_index.loadStrokeIndex(SAMPLE, cache)
+
+    # the protobuf is hashed once for the strokes and the index entries
+    hashes = []
+    hashWillProtobuff = will_cache.hashWillProtobuff
+    monkeypatch.setattr(will_cache, 'hashWillProtobuff', lambda *args: hashes.append(args) or hashWillProtobuff(*args))
+    cachedStrokes, cachedIndex = will_index.loadStrokeIndex(SAMPLE, cache)
+    assert len(hashes) == 1
+    assert cache.hits == 2
+    assert cachedStrokes.toBytes() == strokes.toBytes()
+    assert cachedIndex.toBytes() == index.toBytes()
+
+    evictOnGet(cache, monkeypatch)
+    cachedStrokes, cachedIndex = will_index.loadStrokeIndex(SAMPLE, cache)
+    assert cachedStrokes.toBytes() == strokes.toBytes()
+    assert cachedIndex.toBytes() == index.toBytes()
+    assert (cache.hits, cache.misses) == (2, 4)
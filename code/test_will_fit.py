@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of will_fit: the fitted curves, sampled densely, have to stay near the
+polylines of the samples, and are written at the precision of each stroke.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import io
+import os
+import re
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import will_fit
+import will_reader
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# parameters where the curves are sampled
+DENSE_PARAMETERS = np.linspace(0, 1, 65)
+
+
+def bezierPoints(beziers):
+    """ bezierPoints(beziers)
+Returns the n x 2 array of the points of the curves at DENSE_PARAMETERS.
+    """
+
+    u = DENSE_PARAMETERS[:, None, None]
+    v = 1 - u
+    points = v*v*v*beziers[:, 0] + 3*u*v*v*beziers[:, 1] + 3*u*u*v*beziers[:, 2] + u*u*u*beziers[:, 3]
+
+    return points.reshape(-1, 2)
+
+
+def polylineDistances(points, x, y):
+    """ polylineDistances(points, x, y)
+Returns the distance of every point to the polyline of the samples (x, y).
+    """
+
+    if len(x) == 1:
+        return np.hypot(points[:, 0] - x[0], points[:, 1] - y[0])
+
+    distances = will_fit.squaredSegmentDistances(points[:, 0, None], points[:, 1, None], x[:-1], y[:-1], x[1:], y[1:])
+
+    return np.sqrt(distances.min(axis=1))
+
+
+def checkStrokes(x, y, offsets, tolerance):
+    """ checkStrokes(x, y, offsets, tolerance)
+Fits the strokes and checks every curve against the samples of its stroke.
+    """
+
+    beziers, bezierOffsets = will_fit.fitStrokes(x, y, offsets, tolerance)
+    assert len(bezierOffsets) == len(offsets)
+
+    chords = np.hypot(*(beziers[:, 3] - beziers[:, 0]).T)
+    handles = np.maximum(np.hypot(*(beziers[:, 1] - beziers[:, 0]).T), np.hypot(*(beziers[:, 2] - beziers[:, 3]).T))
+    assert np.all(handles <= chords + 1e-9)
+
+    # the curves of a stroke start and end at its samples, in order
+    for n in range(len(offsets) - 1):
+        strokeX, strokeY = x[offsets[n]:offsets[n+1]], y[offsets[n]:offsets[n+1]]
+        first = 0
+        for bezier in beziers[bezierOffsets[n]:bezierOffsets[n+1]]:
+            last = first + np.flatnonzero((strokeX[first+1:] == bezier[3, 0]) & (strokeY[first+1:] == bezier[3, 1]))[0] + 1
+            distances = polylineDistances(bezierPoints(bezier[None]), strokeX[first:last+1], strokeY[first:last+1])
+            assert distances.max() <= 1.5*tolerance, f'stroke {n}: a curve is {distances.max():.3f} from the samples'
+            first = last
+
+
+@pytest.mark.parametrize('fileName', ['WCM0006.will', 'WCM0007.will', 'IntuosProPaper.will'])
+@pytest.mark.parametrize('tolerance', [0.05, 0.5])
+def testCurvesStayNearSamples(fileName, tolerance):
+    strokes = will_reader.decodeWillStrokeSet(os.path.join(HERE, fileName))
+    x = np.asarray(strokes.x, dtype=np.float64)
+    y = np.asarray(strokes.y, dtype=np.float64)
+
+    checkStrokes(x, y, np.asarray(strokes.offsets), tolerance)
+
+
+def testThreeSamples():
+    # a single interior sample: the least squares system is singular
+    x = np.array([0.0, 1.0, 1.04, 5.0, 5.0, 5.01])
+    y = np.array([0.0, 0.0, 1.0, 1.0, 3.0, 3.5])
+
+    for tolerance in (0.01, 0.1, 1.0):
+        checkStrokes(x, y, np.array([0, 3, 6]), tolerance)
+
+
+def maxDecimals(pathData):
+    """ maxDecimals(pathData)
+Returns the largest number of decimals of the numbers of the path.
+    """
+
+    return max(len(number.partition('.')[2]) for number in re.findall(r'-?\d*\.?\d+', pathData))
+
+
+@pytest.mark.parametrize('relative', [False, True])
+def testStrokePrecision(relative):
+    t = np.linspace(0, 3, 40)
+    x, y = (10*np.cos(t)).tolist(), (10*np.sin(t)).tolist()
+
+    strokes = [(x, y)]*4 + [([1.23456], [2.0])]
+    decimals = [0, 1, 3, None, 4]
+    paths = will_fit.strokesPathData(strokes, 0.01, decimals, relative)
+    assert [maxDecimals(pathData) for pathData in paths] == [0, 1, 3, will_fit.FIT_DECIMALS, 4]
+
+    allX, allY = np.concatenate(strokes, axis=1)
+    beziers, bezierOffsets = will_fit.fitStrokes(allX, allY, [0, 40, 80, 120, 160, 161], 0.01)
+    for n, numDecimals in enumerate([0, 1, 3, will_fit.FIT_DECIMALS]):
+        assert paths[n] == will_fit.bezierPathData(beziers[bezierOffsets[n]:bezierOffsets[n+1]], numDecimals, relative)
+    assert paths[4] == 'M1.2346,2.0000'
+    assert will_fit.fitPathData(x, y, 0.01, 3, relative) == will_fit.bezierPathData(will_fit.fitCubicBeziers(x, y, 0.01), 3, relative)
+
+
+@pytest.mark.parametrize('relative', [False, True])
+def testWriterPrecision(relative):
+    # the fitted curves are written at the precision of each stroke
+    t = np.linspace(0, 3, 40)
+    x, y = (10*np.cos(t)).tolist(), (10*np.sin(t)).tolist()
+    f = io.StringIO()
+    with will_reader.SVGWriter(f, fit=0.01, relative=relative) as writer:
+        for precision in (1, 3):
+            writer.writeStroke([round(v, precision) for v in x], [round(v, precision) for v in y], None, precision)
+
+    paths = re.findall(r' d="([^"]*)"', f.getvalue())
+    assert [maxDecimals(pathData) for pathData in paths] == [1, 3]
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the incremental conversion of will_reader: appending strokes to a
+notebook and converting it again gives the SVG of a full conversion, and any
+other change converts it all again.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import os
+import zipfile
+
+import pytest
+
+import will_reader
+from test_will_wire import encodeMessages
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MESSAGES = list(map(bytes, will_reader.iter_messages(will_reader.readWillProtobuff(os.path.join(HERE, 'WCM0007.will')))))
+
+# options of the conversion, as convertFile arguments
+OPTIONS = [{}, {'poly': True}, {'relative': True}, {'outline': True}, {'fit': 0.5}]
+
+
+def writeNotebook(fileName, messages):
+    """ writeNotebook(fileName, messages)
+Writes a .will file with the given stroke messages.
+    """
+
+    with zipfile.ZipFile(fileName, 'w', zipfile.ZIP_DEFLATED) as f:
+        f.writestr(will_reader.PATHS_MEMBER, encodeMessages(messages))
+
+
+def readFile(fileName):
+    with open(fileName) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('options', OPTIONS)
+def testAppendStrokes(tmp_path, options):
+    if options.get('outline') or options.get('fit'):
+        pytest.importorskip('numpy')
+    inputFile = str(tmp_path / 'notebook.will')
+    outputFile = str(tmp_path / 'notebook.svg')
+    fullFile = str(tmp_path / 'full.svg')
+
+    writeNotebook(inputFile, MESSAGES[:100])
+    assert will_reader.convertFileIncremental(inputFile, outputFile, **options)[2] == 100
+    writeNotebook(inputFile, MESSAGES[:100])
+    assert will_reader.convertFileIncremental(inputFile, outputFile, **options)[2] == 0
+    for count in (170, len(MESSAGES)):
+        writeNotebook(inputFile, MESSAGES[:count])
+        numStrokes, numPoints, numNewStrokes = will_reader.convertFileIncremental(inputFile, outputFile, **options)
+        assert (numStrokes, numNewStrokes) == (count, count - (100 if count == 170 else 170))
+
+    assert (numStrokes, numPoints) == will_reader.convertFile(inputFile, fullFile, **options)
+    assert readFile(outputFile) == readFile(fullFile)
+
+
+def testChangedNotebook(tmp_path):
+    inputFile = str(tmp_path / 'notebook.will')
+    outputFile = str(tmp_path / 'notebook.svg')
+    writeNotebook(inputFile, MESSAGES[:50])
+    will_reader.convertFileIncremental(inputFile, outputFile)
+
+    # a stroke erased, other options, or an SVG edited since: all converted again
+    writeNotebook(inputFile, MESSAGES[1:60])
+    assert will_reader.convertFileIncremental(inputFile, outputFile)[2] == 59
+    assert will_reader.convertFileIncremental(inputFile, outputFile, relative=True)[2] == 59
+    with open(outputFile, 'a') as f:
+        f.write('\n')
+    assert will_reader.convertFileIncremental(inputFile, outputFile, relative=True)[2] == 59
+    os.remove(outputFile + '.state')
+    assert will_reader.convertFileIncremental(inputFile, outputFile, relative=True)[2] == 59
+
+    assert readFile(outputFile) == will_reader.convertBytes(inputFile, relative=True)
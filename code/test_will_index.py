@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of will_index: the grid queries and the hit-testing find the strokes a
+scan of all the boxes and points finds, and a cropped conversion writes a
+subset of the paths of the full one.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import os
+import re
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import will_reader
+import will_index
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE = os.path.join(HERE, 'WCM0007.will')
+
+
+def randomBoxes(generator, count):
+    """ randomBoxes(generator, count)
+Returns the (minX, minY, maxX, maxY) arrays of random boxes of very different
+sizes, some of them empty (min > max) or reduced to a point.
+    """
+
+    minX = np.array([generator.uniform(-50, 150) for n in range(count)])
+    minY = np.array([generator.uniform(-50, 150) for n in range(count)])
+    sizes = np.array([generator.choice([0, 0.1, 1, 10, 100]) for n in range(2*count)]).reshape(2, count)
+    maxX, maxY = minX + sizes[0], minY + sizes[1]
+    empty = np.array([generator.random() < 0.05 for n in range(count)])
+    minX[empty], maxX[empty] = np.inf, -np.inf
+
+    return (minX, minY, maxX, maxY)
+
+
+def scanQuery(boxes, minX, minY, maxX, maxY):
+    """ scanQuery(boxes, minX, minY, maxX, maxY)
+Reference query: the strokes whose float32 box intersects the rectangle (none
+if it is empty).
+    """
+
+    if minX > maxX or minY > maxY:
+        return np.zeros(0, dtype=np.int64)
+
+    boxMinX, boxMinY, boxMaxX, boxMaxY = (np.asarray(v, dtype=np.float32) for v in boxes)
+
+    return np.flatnonzero((boxMinX <= maxX) & (boxMaxX >= minX) & (boxMinY <= maxY) & (boxMaxY >= minY)
+                          & (boxMinX <= boxMaxX) & (boxMinY <= boxMaxY))
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('cellSize', [None, 0.5, 30, 1000])
+def testQuery(seed, cellSize):
+    generator = random.Random(seed)
+    boxes = randomBoxes(generator, 300)
+    index = will_index.StrokeIndex(*boxes, cellSize=cellSize)
+    loaded = will_index.StrokeIndex.fromBuffer(index.toBytes())
+
+    rectangles = [(-1000, -1000, 1000, 1000), (200, 200, 300, 300), (10, 10, 5, 20), (0, 0, 0, 0)]
+    for n in range(100):
+        x, y = generator.uniform(-60, 160), generator.uniform(-60, 160)
+        rectangles.append((x, y, x + generator.choice([0, 1, 20, 80]), y + generator.choice([0, 1, 20, 80])))
+    for rectangle in rectangles:
+        expected = scanQuery(boxes, *rectangle)
+        assert index.query(*rectangle).tolist() == expected.tolist(), rectangle
+        assert loaded.query(*rectangle).tolist() == expected.tolist()
+
+
+def testEmptyIndex():
+    index = will_index.StrokeIndex([], [], [], [])
+    assert len(index) == 0
+    assert index.query(-1, -1, 1, 1).tolist() == []
+
+
+def squaredDistances(px, py, ax, ay, bx, by):
+    """ squaredDistances(px, py, ax, ay, bx, by)
+Returns the squared distances of the point (px, py) to the segments from
+(ax, ay) to (bx, by).
+    """
+
+    dx, dy = bx - ax, by - ay
+    lengths = dx*dx + dy*dy
+    t = np.clip(np.where(lengths > 0, ((px - ax)*dx + (py - ay)*dy)/np.where(lengths > 0, lengths, 1), 0), 0, 1)
+    ex, ey = ax + t*dx - px, ay + t*dy - py
+
+    return ex*ex + ey*ey
+
+
+def testStrokesAt(tmp_path):
+    strokes = will_reader.decodeStrokeSet(will_reader.readWillProtobuff(SAMPLE))
+    index = will_index.StrokeIndex.fromStrokeSet(strokes)
+    index.save(str(tmp_path / 'sample.index'))
+    loaded = will_index.StrokeIndex.load(str(tmp_path / 'sample.index'))
+
+    generator = random.Random(1)
+    minX, minY, maxX, maxY = strokes.boundingBox()
+    points = [(float(strokes.x[i]), float(strokes.y[i])) for i in generator.sample(range(strokes.numPoints), 20)]
+    points += [(generator.uniform(minX, maxX), generator.uniform(minY, maxY)) for n in range(20)]
+    for x, y in points:
+        for tolerance in (0.1, 2.0):
+            # distance to the segments of every stroke
+            expected = []
+            for n, (strokeX, strokeY, width) in enumerate(strokes):
+                ax, ay = strokeX.astype(np.float64), strokeY.astype(np.float64)
+                bx, by = np.append(ax[1:], ax[-1]), np.append(ay[1:], ay[-1])
+                distances = np.sqrt(squaredDistances(x, y, ax, ay, bx, by))
+                if len(distances) and distances.min() <= tolerance:
+                    expected.append(n)
+            assert index.strokesAt(strokes, x, y, tolerance).tolist() == expected
+            assert loaded.strokesAt(strokes, x, y, tolerance).tolist() == expected
+
+
+
+def svgPaths(fileName):
+    with open(fileName) as f:
+        return re.findall(r'<path [^>]*/>', f.read())
+
+
+@pytest.mark.parametrize('options', [{}, {'poly': True}, {'relative': True}])
+def testCropSubset(tmp_path, options):
+    from will_cache import ConversionCache
+    strokes = will_reader.decodeStrokeSet(will_reader.readWillProtobuff(SAMPLE))
+    minX, minY, maxX, maxY = strokes.boundingBox()
+    fullFile = str(tmp_path / 'full.svg')
+    will_reader.convertFile(SAMPLE, fullFile, **options)
+    fullPaths = svgPaths(fullFile)
+
+    cache = ConversionCache(str(tmp_path / 'cache'))
+    region = (minX, minY, (minX + maxX)/2, (minY + maxY)/2)
+    for n in range(2):
+        cropFile = str(tmp_path / f'crop{n}.svg')
+        numStrokes, numPoints = will_reader.convertRegion(SAMPLE, cropFile, region, cache=cache, **options)
+        cropPaths = svgPaths(cropFile)
+
+        # the paths of the strokes crossing the region, in document order
+        selected = will_index.StrokeIndex.fromStrokeSet(strokes).query(*region)
+        assert 0 < numStrokes == len(cropPaths) == len(selected) < len(fullPaths)
+        assert cropPaths == [fullPaths[i] for i in selected]
+        with open(cropFile) as f:
+            viewBox = re.search(r'viewBox="([^"]*)"', f.read()).group(1)
+        assert [float(v) for v in viewBox.split()] == pytest.approx([region[0], region[1], region[2] - region[0], region[3] - region[1]], abs=1e-4)
+    # the second crop mapped the strokes and the index back from the cache
+    assert cache.hits == 2
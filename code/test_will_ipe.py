@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of will_ipe: the documents are well formed XML with the page of the
+bounding box, one path per stroke with its pen, and coordinates that map back
+to the points of the strokes.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import io
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import will_reader
+import will_reader_slate_A4
+import will_ipe
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# largest error of a coordinate written with IPE_DECIMALS decimals, in points
+TOLERANCE = 0.5*10**-will_ipe.IPE_DECIMALS + 1e-9
+
+
+def pathPoints(path):
+    """ pathPoints(path)
+Returns the list of (x, y) points of an Ipe polyline, checking that it starts
+with a moveto followed by linetos.
+    """
+
+    lines = [line.split() for line in path.text.strip().split('\n')]
+    assert [line[2] for line in lines] == ['m'] + ['l']*(len(lines) - 1)
+
+    return [(float(x), float(y)) for x, y, operator in lines]
+
+
+def writeDocument(xData, yData, lineData, boundingBox=None):
+    """ writeDocument(xData, yData, lineData, boundingBox=None)
+Returns the root element of the document writeIPE writes, and its text.
+    """
+
+    f = io.StringIO()
+    will_ipe.writeIPE(f, xData, yData, lineData, boundingBox)
+    text = f.getvalue()
+    assert text.startswith('<?xml version="1.0"?>\n<!DOCTYPE ipe SYSTEM "ipe.dtd">\n')
+
+    return (ET.fromstring(text), text)
+
+
+@pytest.mark.parametrize('fileName', ['WCM0006.will', 'WCM0007.will', 'IntuosProPaper.will'])
+def testWriteIPE(fileName):
+    buffer = will_reader.readWillProtobuff(os.path.join(HERE, fileName))
+    xData, yData, lineData, boxes = will_reader_slate_A4.processBuffer(buffer)
+    minX, minY, maxX, maxY = will_reader_slate_A4.pageBoundingBox(boxes)
+    root, text = writeDocument(xData, yData, lineData)
+
+    assert root.tag == 'ipe' and root.get('version') == str(will_ipe.IPE_VERSION)
+    width, height = map(float, root.find('ipestyle/layout').get('paper').split())
+    assert (width, height) == pytest.approx(((maxX - minX)*will_ipe.PT_PER_MM, (maxY - minY)*will_ipe.PT_PER_MM), abs=TOLERANCE)
+
+    pages = root.findall('page')
+    assert len(pages) == 1
+    paths = pages[0].findall('path')
+    assert len(paths) == len(xData)
+    for path, arrayX, arrayY, lineWidth in zip(paths, xData, yData, lineData):
+        assert float(path.get('pen')) == pytest.approx(lineWidth*will_ipe.PT_PER_MM, abs=TOLERANCE)
+        points = pathPoints(path)
+        expected = [((x - minX)*will_ipe.PT_PER_MM, (maxY - y)*will_ipe.PT_PER_MM) for x, y in zip(arrayX, arrayY)]
+        assert [c for point in points for c in point] == pytest.approx([c for point in expected for c in point], abs=TOLERANCE)
+        assert all(-TOLERANCE <= x <= width + TOLERANCE and -TOLERANCE <= y <= height + TOLERANCE for x, y in points)
+
+    # the same document with a known bounding box
+    assert writeDocument(xData, yData, lineData, (minX, minY, maxX, maxY))[1] == text
+
+
+def testEmptyDocument():
+    root, text = writeDocument([], [], [])
+    assert root.find('ipestyle/layout').get('paper') == '0 0'
+    assert [len(page.findall('path')) for page in root.findall('page')] == [0]
+
+    # the strokes without points are not written
+    root, text = writeDocument([[1.0], [], [2.0, 4.0]], [[3.0], [], [5.0, 1.0]], [0.5, 0.5, None])
+    paths = root.findall('page/path')
+    assert [pathPoints(path) for path in paths] == [[(0, round(2*will_ipe.PT_PER_MM, 3))], [(round(will_ipe.PT_PER_MM, 3), 0), (round(3*will_ipe.PT_PER_MM, 3), round(4*will_ipe.PT_PER_MM, 3))]]
+    assert [path.get('pen') for path in paths] == [will_reader.formatNumber(0.5*will_ipe.PT_PER_MM, will_ipe.IPE_DECIMALS), None]
+
+
+def testPages():
+    f = io.StringIO()
+    with will_ipe.IPEWriter(f, (0, 0, 10, 10)) as writer:
+        writer.writeStroke([1, 2], [3, 4], 0.5)
+        writer.startPage()
+        writer.startPage()
+        writer.writeStroke([5], [6])
+    root = ET.fromstring(f.getvalue())
+
+    assert [len(page.findall('path')) for page in root.findall('page')] == [1, 0, 1]
+    assert all(page.find('layer').get('name') == 'alpha' for page in root.findall('page'))
+    assert f.getvalue().endswith(will_ipe.IPE_FOOTER)
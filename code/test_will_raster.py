@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of will_raster: the coverage of the numpy rasterizer against the areas
+of simple polygons, the PNG encoding, and the pages written by
+rasterizeFiles.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import io
+import os
+import shutil
+import struct
+import zipfile
+import zlib
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import will_reader
+import will_raster
+from test_will_wire import encodeStroke, encodeMessages
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLES = ['WCM0006.will', 'WCM0007.will', 'IntuosProPaper.will']
+
+
+def decodePNG(data):
+    """ decodePNG(data)
+Returns the (width, height, pixels) of a PNG written by encodePNG, checking
+the chunk lengths and CRCs.
+    """
+
+    assert data[:8] == will_raster.PNG_SIGNATURE
+    chunks = {}
+    pos = 8
+    while pos < len(data):
+        length, = struct.unpack('>I', data[pos:pos+4])
+        chunkType, content = data[pos+4:pos+8], data[pos+8:pos+8+length]
+        assert struct.unpack('>I', data[pos+8+length:pos+12+length])[0] == zlib.crc32(chunkType + content)
+        chunks[chunkType] = content
+        pos += 12 + length
+    assert pos == len(data) and chunks[b'IEND'] == b''
+
+    width, height, bitDepth, colorType, compression, filterMethod, interlace = struct.unpack('>IIBBBBB', chunks[b'IHDR'])
+    assert (bitDepth, colorType, compression, filterMethod, interlace) == (8, 0, 0, 0, 0)
+    rows = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype=np.uint8).reshape(height, width + 1)
+    assert not rows[:, 0].any()
+
+    return (width, height, rows[:, 1:])
+
+
+def rasterize(polygons, width, height):
+    """ rasterize(polygons, width, height)
+Returns the coverage of the list of polygons (lists of (x, y) points) by
+rasterizePolygonsNumpy.
+    """
+
+    points = np.array([point for polygon in polygons for point in polygon], dtype=float).reshape(-1, 2)
+    offsets = np.cumsum([0] + [len(polygon) for polygon in polygons])
+
+    return will_raster.rasterizePolygonsNumpy(points[:, 0], points[:, 1], offsets, width, height)
+
+
+def testEncodePNG(tmp_path):
+    pixels = np.arange(7*5, dtype=np.uint8).reshape(5, 7)*7
+    assert decodePNG(will_raster.encodePNG(pixels))[:2] == (7, 5)
+    assert (decodePNG(will_raster.encodePNG(pixels))[2] == pixels).all()
+
+    will_raster.writePNG(str(tmp_path / 'image.png'), pixels)
+    with open(tmp_path / 'image.png', 'rb') as f:
+        assert f.read() == will_raster.encodePNG(pixels)
+
+
+def testPageTransform():
+    margin = will_raster.RASTER_MARGIN
+    scale, offsetX, offsetY, width, height = will_raster.pageTransform((10, 20, 10 + 25.4, 20 + 50.8), dpi=100)
+    assert scale == pytest.approx(100/25.4)
+    assert (10*scale + offsetX, 20*scale + offsetY) == pytest.approx((margin, margin))
+    assert (width, height) == (100 + 2*margin, 200 + 2*margin)
+
+    scale, offsetX, offsetY, width, height = will_raster.pageTransform((10, 20, 10 + 25.4, 20 + 50.8), dpi=100, maxSize=104)
+    assert (width, height) == (50 + 2*margin, 100 + 2*margin)
+
+    # no points: an empty image with the margin
+    assert will_raster.pageTransform((np.inf, np.inf, -np.inf, -np.inf))[3:] == (2*margin, 2*margin)
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def testRectangleCoverage(reverse):
+    # the top and bottom on sub-scanline boundaries: the coverage is exact
+    rectangle = [(2.5, 1.0), (7.25, 1.0), (7.25, 4.5), (2.5, 4.5)]
+    coverage = rasterize([rectangle[::-1] if reverse else rectangle], 10, 6)
+
+    expected = np.zeros((6, 10))
+    expected[1:4, 3:7] = 1
+    expected[1:4, 2] = 0.5
+    expected[1:4, 7] = 0.25
+    expected[4] = expected[3]/2
+    expected[4, 2], expected[4, 7] = 0.25, 0.125
+    assert coverage == pytest.approx(expected)
+
+
+def testPolygonCoverage():
+    # a triangle and a star (the nonzero rule fills its center)
+    triangle = [(1.0, 1.0), (31.0, 3.0), (9.0, 29.0)]
+    angles = np.arange(5)*4*np.pi/5
+    star = list(zip(45 + 12*np.sin(angles), 16 - 12*np.cos(angles)))
+    coverage = rasterize([triangle, star], 60, 32)
+
+    assert coverage.min() >= 0 and coverage.max() <= 1
+    assert coverage[:, :32].sum() == pytest.approx(0.5*(30*28 - 8*2), abs=0.5)
+    assert coverage[16, 45] == 1
+    assert coverage[0].max() == pytest.approx(0, abs=1e-6) and coverage[:, -1].max() == pytest.approx(0, abs=1e-6)
+
+    # overlapping polygons are a union (their edge coverages add up, up to
+    # 1), and the empty ones are ignored
+    union = rasterize([triangle, [], triangle[::-1], star, star], 60, 32)
+    assert union.max() <= 1 and (union >= coverage - 1e-6).all()
+    assert (union[coverage < 1e-6] < 1e-6).all() and (union[coverage == 1] == 1).all()
+
+
+def testBands(monkeypatch):
+    strokes = will_reader.decodeStrokeSet(will_reader.readWillProtobuff(os.path.join(HERE, 'WCM0007.will')))
+    pixels = will_raster.rasterizeStrokes(strokes, backend='numpy')
+
+    monkeypatch.setattr(will_raster, 'BAND_ROWS', 8)
+    monkeypatch.setattr(will_raster, 'BAND_CROSSINGS', 100)
+    assert (will_raster.rasterizeStrokes(strokes, backend='numpy') == pixels).all()
+
+
+@pytest.mark.parametrize('fileName', SAMPLES)
+@pytest.mark.parametrize('outline', [False, True])
+def testRasterizeStrokes(fileName, outline):
+    strokes = will_reader.decodeStrokeSet(will_reader.readWillProtobuff(os.path.join(HERE, fileName)))
+    pixels = will_raster.rasterizeStrokes(strokes, outline=outline, backend='numpy')
+
+    assert pixels.dtype == np.uint8
+    assert pixels.min() == 0 and pixels.max() == 255
+    margin = will_raster.RASTER_MARGIN
+    assert (pixels[:margin] == 255).all() and (pixels[-margin:] == 255).all()
+    assert (pixels[:, :margin] == 255).all() and (pixels[:, -margin:] == 255).all()
+
+    small = will_raster.rasterizeStrokes(strokes, maxSize=200, outline=outline, backend='numpy')
+    assert max(small.shape) <= 200 and small.min() < 128
+
+
+def testCairo():
+    pytest.importorskip('cairo')
+    strokes = will_reader.decodeStrokeSet(will_reader.readWillProtobuff(os.path.join(HERE, 'WCM0007.will')))
+    pixels = will_raster.rasterizeStrokes(strokes, backend='numpy').astype(int)
+    cairoPixels = will_raster.rasterizeStrokes(strokes, backend='cairo').astype(int)
+
+    # both antialiased, they only differ on the edges
+    assert cairoPixels.shape == pixels.shape
+    assert np.abs(cairoPixels - pixels).mean() < 2
+
+
+def writeNotebook(fileName, numPages):
+    """ writeNotebook(fileName, numPages)
+Writes a .will file of numPages pages with one stroke each.
+    """
+
+    with zipfile.ZipFile(fileName, 'w') as f:
+        for n in range(numPages):
+            f.writestr(f'sections/media/{n:03d}.protobuf', encodeMessages([encodeStroke([100*n, 0, 500, 300], precision=2)]))
+
+
+def testPageFiles(tmp_path):
+    writeNotebook(str(tmp_path / 'notebook.will'), 3)
+    assert will_raster.pageFiles(str(tmp_path / 'notebook.will')) == [(f'sections/media/{n:03d}.protobuf', str(tmp_path / f'notebook_{n:02d}.png')) for n in range(3)]
+    assert will_raster.pageFiles(os.path.join(HERE, 'WCM0007.will'), str(tmp_path)) == [('sections/media/paths.protobuf', str(tmp_path / 'WCM0007.png'))]
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def testRasterizeFiles(tmp_path, jobs):
+    writeNotebook(str(tmp_path / 'notebook.will'), 3)
+    shutil.copy(os.path.join(HERE, 'WCM0007.will'), tmp_path)
+    with open(tmp_path / 'broken.will', 'wb') as f:
+        f.write(b'not a .will file')
+    with zipfile.ZipFile(tmp_path / 'badpage.will', 'w') as f:
+        f.writestr('sections/media/paths.protobuf', b'\x05abc')
+
+    out = io.StringIO()
+    files = [str(tmp_path / name) for name in ['notebook.will', 'broken.will', 'WCM0007.will', 'badpage.will']]
+    assert will_raster.rasterizeFiles(files, jobs=jobs, out=out) == 2
+
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith('FAILED ' + files[1])
+    assert [line.split(':')[0] for line in lines[1:5]] == [f'OK     {tmp_path}/notebook_{n:02d}.png' for n in range(3)] + [f'OK     {tmp_path}/WCM0007.png']
+    assert lines[5].startswith(f'FAILED {files[3]} (sections/media/paths.protobuf)')
+    assert lines[6].startswith('5 pages of 4 files (2 failed)')
+    assert not os.path.exists(tmp_path / 'badpage.png')
+
+    strokes = will_reader.decodeStrokeSet(will_reader.readWillProtobuff(files[2]))
+    with open(tmp_path / 'WCM0007.png', 'rb') as f:
+        width, height, pixels = decodePNG(f.read())
+    assert (pixels == will_raster.rasterizeStrokes(strokes)).all()
+    assert '240 strokes, {}x{} pixels'.format(width, height) in lines[4]
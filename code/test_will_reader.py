@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of will_reader: decoding of the stroke messages, and the in memory
+conversion (uploads that are not .will files fail as bad zip files, and the
+bytes convert as the file does).
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import io
+import os
+import random
+import zipfile
+
+import pytest
+
+import will_reader
+from will_wire import WIRETYPE_VARINT, WIRETYPE_FIXED32
+from test_will_wire import encodeVarint, encodeTag, encodeZigzagArray, encodeStroke, encodeMessages
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE = os.path.join(HERE, 'WCM0007.will')
+
+
+def randomValues(generator, count):
+    """ randomValues(generator, count)
+Returns count random signed 32 bits values, of every varint length.
+    """
+
+    return [generator.choice((-1, 1))*(generator.getrandbits(generator.randint(1, 31)) - (generator.random() < 0.1))
+            for n in range(count)]
+
+
+def testDecodeVarintArrayNumpy():
+    pytest.importorskip('numpy')
+    generator = random.Random(1)
+    for n in range(200):
+        data = encodeZigzagArray(randomValues(generator, generator.choice((0, 1, 2, 5, 100))))
+        assert will_reader.decodeVarintArrayNumpy(data).tolist() == will_reader.decodeVarintArrayPython(data)
+
+    for data in (b'', b'\x00', b'\x01', b'\xff\xff\xff\xff\x0f', encodeZigzagArray([-2**31, 2**31 - 1, 0, -1])):
+        assert will_reader.decodeVarintArrayNumpy(data).tolist() == will_reader.decodeVarintArrayPython(data)
+    with pytest.raises(ValueError):
+        will_reader.decodeVarintArrayNumpy(b'\x01\x80')
+
+
+def testDecodeVarintArraysNumpy():
+    pytest.importorskip('numpy')
+    generator = random.Random(2)
+    for n in range(50):
+        chunks = [encodeZigzagArray(randomValues(generator, generator.choice((0, 0, 1, 3, 50)))) for n in range(generator.randint(0, 20))]
+        values, offsets = will_reader.decodeVarintArraysNumpy(chunks)
+        assert len(offsets) == len(chunks) + 1
+        for chunk, start, stop in zip(chunks, offsets, offsets[1:]):
+            assert values[start:stop].tolist() == will_reader.decodeVarintArrayPython(chunk)
+
+
+def testDecodeMessageBatch():
+    pytest.importorskip('numpy')
+    generator = random.Random(3)
+    messages = []
+    for n in range(100):
+        numPoints = generator.choice((0, 1, 2, 10))
+        widths = generator.choice((None, numPoints, 1, 3))
+        messages.append(encodeStroke(randomValues(generator, 2*numPoints + (generator.random() < 0.2)),
+                                     None if widths is None else [abs(v) for v in randomValues(generator, widths)],
+                                     generator.choice((None, 0, 1, 2, 3))))
+
+    for asArrays in (False, True):
+        batch = will_reader.decodeMessageBatch(messages, asArrays)
+        for stroke, message in zip(batch, messages):
+            expected = will_reader.decodeMessagePacket(message, asArrays, withPrecision=True)
+            if asArrays:
+                assert [len(values) for values in stroke[:3]] == [len(values) for values in expected[:3]]
+                assert all((a == b).all() for a, b in zip(stroke[:3], expected[:3]))
+                assert stroke[3] == expected[3]
+            else:
+                assert stroke == expected
+
+
+def testOddPoints():
+    # the trailing x without its y is dropped
+    message = encodeStroke([1, 2, 3], precision=0)
+    assert will_reader.decodeMessagePacket(message) == ([1.0], [2.0], 1.0)
+
+
+@pytest.mark.parametrize('messages', [
+    [encodeStroke([1, 2, 3])],
+    [encodeStroke([1, 2, 3], [100, 5])],
+    [encodeStroke([1, 2, 3, 4], [100, 5, 7]), encodeStroke([5, -6, 7, 8, 9], [50, 1]), encodeStroke([])],
+])
+def testStrokeSetLengths(messages):
+    pytest.importorskip('numpy')
+    strokes = will_reader.decodeStrokeSet(encodeMessages(messages))
+
+    assert len(strokes) == len(messages)
+    assert len(strokes.x) == len(strokes.y) == len(strokes.width) == strokes.offsets[-1]
+    for (x, y, width), message in zip(strokes, messages):
+        expectedX, expectedY, lineWidth = will_reader.decodeMessagePacket(message)
+        assert x.tolist() == pytest.approx(expectedX)
+        assert y.tolist() == pytest.approx(expectedY)
+    assert strokes.lineWidths() == pytest.approx([will_reader.decodeMessagePacket(message)[2] for message in messages])
+
+
+def testFromArraysLengths():
+    np = pytest.importorskip('numpy')
+    with pytest.raises(ValueError):
+        will_reader.StrokeSet.fromArrays([(np.zeros(2), np.zeros(1), np.zeros(2))])
+
+
+@pytest.mark.parametrize('message', [
+    encodeStroke([1, 2])[:-1],                              # points cut
+    encodeStroke([1, 2]) + encodeTag(3, WIRETYPE_VARINT),   # no precision value
+    encodeStroke([1, 2]) + encodeTag(1, WIRETYPE_FIXED32) + b'\x00\x00',
+    encodeStroke([1, 2]) + encodeTag(9, WIRETYPE_VARINT) + b'\x80',
+    encodeStroke([1, 2]) + encodeTag(9, WIRETYPE_FIXED32) + b'\x00',
+])
+def testTruncatedMessage(message):
+    with pytest.raises(ValueError):
+        will_reader.decodeMessagePacket(message)
+    with pytest.raises(ValueError):
+        will_reader.decodeStrokeFields(message)
+
+
+@pytest.mark.parametrize('data', [b'', b'PK', b'not a .will file', b'x'*21, b'x'*4096])
+def testNotZipBytes(data):
+    with pytest.raises(zipfile.BadZipFile):
+        will_reader.convertBytes(data)
+
+
+@pytest.mark.parametrize('data', [b'', b'not a .will file'])
+def testNotZipFileObject(data):
+    with pytest.raises(zipfile.BadZipFile):
+        will_reader.convertBytes(io.BytesIO(data))
+
+
+def testNegativeSeek():
+    f = will_reader.BufferFile(b'abc')
+    with pytest.raises(OSError):
+        f.seek(-4, io.SEEK_END)
+    assert f.seek(-1, io.SEEK_END) == 2
+
+
+def testConvertBytes():
+    with open(SAMPLE, 'rb') as f:
+        data = f.read()
+
+    assert will_reader.convertBytes(data, relative=True) == will_reader.convertBytes(SAMPLE, relative=True)
+    assert will_reader.convertBytes(memoryview(data)) == will_reader.convertBytes(SAMPLE)
+
+
+def testMissingNumpy(monkeypatch):
+    expected = will_reader.convertBytes(SAMPLE, relative=True)
+    monkeypatch.setattr(will_reader, 'np', None)
+    monkeypatch.setattr(will_reader, 'importNumpy', lambda: None)
+
+    assert will_reader.missingNumpy([('--outline', False), ('--fit', False)]) is None
+    assert will_reader.missingNumpy([('--outline', True), ('--fit', True)]) == '--outline'
+    for options in [{'outline': True}, {'fit': 0.5}]:
+        with pytest.raises(ImportError, match='requires numpy'):
+            will_reader.SVGWriter(io.StringIO(), **options)
+    # the other modes do without numpy
+    assert will_reader.convertBytes(SAMPLE, relative=True) == expected
+
+
+@pytest.mark.parametrize('fileName', ['WCM0006.will', 'WCM0007.will', 'IntuosProPaper.will'])
+def testStrokeSetSamples(fileName):
+    np = pytest.importorskip('numpy')
+    buffer = will_reader.readWillProtobuff(os.path.join(HERE, fileName))
+    xData, yData, lineData = will_reader.processBuffer(buffer)
+    strokes = will_reader.decodeStrokeSet(buffer)
+
+    assert len(strokes) == len(xData)
+    assert strokes.numPoints == sum(map(len, xData))
+    for (x, y, width), expectedX, expectedY in zip(strokes, xData, yData):
+        assert x.dtype == np.float32 and len(width) == len(x)
+        assert x.tolist() == pytest.approx(expectedX, abs=1e-3)
+        assert y.tolist() == pytest.approx(expectedY, abs=1e-3)
+    assert strokes.lineWidths().tolist() == pytest.approx(lineData)
+    assert [x.tolist() for x in strokes.toXYLineData()[0]] == [x.tolist() for x, y, width in strokes]
+
+    # the boxes are the ones of the float32 points
+    assert strokes.boundingBox() == (float(strokes.x.min()), float(strokes.y.min()), float(strokes.x.max()), float(strokes.y.max()))
+    x, y, width = strokes[-1]
+    assert strokes.boundingBox([len(strokes) - 1]) == (float(x.min()), float(y.min()), float(x.max()), float(y.max()))
+    assert strokes.boundingBox([]) == (float('inf'), float('inf'), float('-inf'), float('-inf'))
+    with pytest.raises(IndexError):
+        strokes[len(strokes)]
+
+
+def testStrokeSetSelect():
+    np = pytest.importorskip('numpy')
+    strokes = will_reader.StrokeSet.fromArrays([(np.array([0.0, 1, 2]), np.array([5.0, 6, 7]), np.array([1.0, 2, 3])),
+                                                (np.array([3.0]), np.array([8.0]), np.array([4.0]))], [2, 1])
+
+    selected = strokes.select([True, False, True, False])
+    assert selected.offsets.tolist() == [0, 2, 2]
+    assert selected[0][0].tolist() == [0, 2]
+    assert len(selected[1][0]) == 0
+    assert selected.precision.tolist() == [2, 1]
+    assert selected.boundingBox() == (0, 5, 2, 7)
+    assert selected.boundingBox([1]) == (float('inf'), float('inf'), float('-inf'), float('-inf'))
+    # the empty stroke gets the default width, as in decodeMessagePacket
+    assert selected.lineWidths().tolist() == pytest.approx([0.02, will_reader.STROKE_WIDTH_SCALE*will_reader.DEFAULT_STROKE_WIDTH])
+
+
+def writeArchive(fileName, buffer, compression, extra=b''):
+    """ writeArchive(fileName, buffer, compression, extra=b'')
+Writes a .will archive whose paths.protobuf is buffer, compressed or stored,
+with the given extra field in its headers.
+    """
+
+    info = zipfile.ZipInfo(will_reader.PATHS_MEMBER)
+    info.compress_type = compression
+    info.extra = extra
+    with zipfile.ZipFile(fileName, 'w') as f:
+        f.writestr('sections/media/other.txt', b'x'*100)
+        f.writestr(info, buffer)
+
+
+@pytest.mark.parametrize('compression, extra', [(zipfile.ZIP_STORED, b''), (zipfile.ZIP_STORED, b'\x99\x99\x02\x00ab'), (zipfile.ZIP_DEFLATED, b'')])
+def testIterWillMessages(tmp_path, compression, extra):
+    buffer = will_reader.readWillProtobuff(SAMPLE)
+    expected = list(will_reader.iter_messages(buffer))
+    fileName = str(tmp_path / 'sample.will')
+    writeArchive(fileName, buffer, compression, extra)
+    with open(fileName, 'rb') as f:
+        data = f.read()
+
+    mapped = will_reader.mapWillProtobuff(fileName)
+    if compression == zipfile.ZIP_STORED:
+        assert isinstance(mapped, memoryview) and bytes(mapped) == buffer
+        assert bytes(will_reader.mapWillProtobuff(data)) == buffer
+    else:
+        assert mapped is None and will_reader.mapWillProtobuff(data) is None
+    with open(fileName, 'rb') as f:
+        # a file object that is not in memory is always streamed
+        assert will_reader.mapWillProtobuff(f) is None
+        assert [bytes(m) for m in will_reader.iterWillMessages(f, chunkSize=1000)] == expected
+
+    for inputFile in [fileName, data, memoryview(data), io.BytesIO(data)]:
+        assert [bytes(m) for m in will_reader.iterWillMessages(inputFile, chunkSize=777)] == expected
+
+
+@pytest.mark.parametrize('chunkSize', [1, 2, 100, 2**20])
+def testIterStreamMessages(chunkSize):
+    messages = [encodeStroke([1, 2]*n) for n in range(0, 200, 7)]
+    buffer = encodeMessages(messages)
+
+    assert list(will_reader.iterStreamMessages(io.BytesIO(buffer), chunkSize)) == messages
+    with pytest.raises(ValueError):
+        list(will_reader.iterStreamMessages(io.BytesIO(buffer[:-1]), chunkSize))
+
+
+@pytest.mark.parametrize('withPrecision', [True, False])
+def testStrokeSetRoundTrip(tmp_path, withPrecision):
+    np = pytest.importorskip('numpy')
+    strokes = will_reader.decodeStrokeSet(will_reader.readWillProtobuff(SAMPLE))
+    if not withPrecision:
+        strokes = will_reader.StrokeSet(strokes.x, strokes.y, strokes.width, strokes.offsets)
+    fileName = str(tmp_path / 'sample.strokes')
+    strokes.save(fileName)
+    with open(fileName, 'rb') as f:
+        assert f.read() == strokes.toBytes()
+
+    for loaded in [will_reader.StrokeSet.fromBuffer(strokes.toBytes()), will_reader.StrokeSet.load(fileName),
+                   will_reader.StrokeSet.load(fileName, useMmap=False)]:
+        for name, dtype in will_reader.StrokeSet.ARRAYS:
+            if name == 'precision' and not withPrecision:
+                assert loaded.precision is None
+                continue
+            array = getattr(loaded, name)
+            assert array.dtype == np.dtype(dtype) and not array.flags.writeable
+            assert np.array_equal(array, getattr(strokes, name))
+        assert loaded.boundingBox() == strokes.boundingBox()
+        assert loaded.toBytes() == strokes.toBytes()
+
+
+def testStrokeSetVersions():
+    np = pytest.importorskip('numpy')
+    strokes = will_reader.StrokeSet.fromArrays([(np.array([0.0, 1]), np.array([2.0, 3]), np.array([1.0, 1])), (np.array([5.0]), np.array([-1.0]), np.array([2.0]))], [2, 1])
+
+    # version 1 had no boxes and no precision, version 2 no precision
+    version1 = will_reader.arraysToBytes(will_reader.STROKESET_MAGIC, 1, [(name, dtype, getattr(strokes, name)) for name, dtype in will_reader.StrokeSet.ARRAYS[:4]])
+    version2 = will_reader.arraysToBytes(will_reader.STROKESET_MAGIC, 2, [(name, dtype, getattr(strokes, name)) for name, dtype in will_reader.StrokeSet.ARRAYS[:-1]])
+    for data in (version1, version2):
+        loaded = will_reader.StrokeSet.fromBuffer(data)
+        assert loaded.precision is None
+        assert loaded.boundingBox() == strokes.boundingBox() == (0, -1, 5, 3)
+        assert loaded.maxX.tolist() == [1, 5]
+
+    with pytest.raises(ValueError, match='Not a stroke set'):
+        will_reader.StrokeSet.fromBuffer(b'WILLIDX\x00' + version2[8:])
+    newer = will_reader.arraysToBytes(will_reader.STROKESET_MAGIC, will_reader.STROKESET_VERSION + 1, strokes.namedArrays())
+    with pytest.raises(ValueError, match='version'):
+        will_reader.StrokeSet.fromBuffer(newer)
+
+    empty = will_reader.StrokeSet.fromBuffer(will_reader.StrokeSet.fromArrays([]).toBytes())
+    assert len(empty) == 0 and empty.numPoints == 0
+
+    # the arrays are aligned, so they can be mapped in place
+    header, chunks, dataStart = strokes.layout()
+    assert dataStart % will_reader.STROKESET_ALIGN == 0
+    assert all(dataOffset % will_reader.STROKESET_ALIGN == 0 for dataOffset, array in chunks)
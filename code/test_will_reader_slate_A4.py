@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of will_reader_slate_A4: the bounding boxes of the strokes kept by the
+decoder, the page box reduced from them, and the numbering of the pages.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import os
+import struct
+import zipfile
+
+import pytest
+
+import will_reader
+import will_reader_slate_A4
+from will_wire import WIRETYPE_VARINT, WIRETYPE_FIXED32, WIRETYPE_LENGTH_DELIMITED
+from test_will_wire import encodeVarint, encodeTag, encodeZigzagArray, encodeMessages
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.mark.parametrize('fileName', ['WCM0006.will', 'WCM0007.will', 'IntuosProPaper.will'])
+def testStrokeBoxes(fileName):
+    buffer = will_reader.readWillProtobuff(os.path.join(HERE, fileName))
+    xData, yData, lineData, boxes = will_reader_slate_A4.processBuffer(buffer)
+
+    assert boxes == [(min(x), min(y), max(x), max(y)) for x, y in zip(xData, yData)]
+
+    minX, minY, maxX, maxY = will_reader_slate_A4.pageBoundingBox(boxes)
+    assert (minX, maxX) == (min(map(min, xData)), max(map(max, xData)))
+    assert (minY, maxY) == (min(map(min, yData)), max(map(max, yData)))
+    assert will_reader_slate_A4.XYLineDataToSVG(xData, yData, lineData) == will_reader_slate_A4.XYLineDataToSVG(xData, yData, lineData, (minX, minY, maxX, maxY))
+
+
+def testEmptyPage():
+    assert will_reader_slate_A4.pageBoundingBox([]) == (0, 0, 0, 0)
+    assert will_reader_slate_A4.pageBoundingBox([None, (1, 2, 3, 4), None]) == (1, 2, 3, 4)
+    assert will_reader_slate_A4.strokeBoundingBox([], []) is None
+
+
+def slateStroke(deltas):
+    """ slateStroke(deltas)
+Returns a stroke message with all the fields, in the order the slate decoder
+expects them, with precision 0 and the given x, y deltas.
+    """
+
+    fields = [encodeZigzagArray(deltas), encodeZigzagArray([100]*(len(deltas)//2)), b'']
+
+    return (encodeTag(1, WIRETYPE_FIXED32) + struct.pack('<f', 0.0) + encodeTag(2, WIRETYPE_FIXED32) + struct.pack('<f', 1.0)
+            + encodeTag(3, WIRETYPE_VARINT) + encodeVarint(0)
+            + b''.join(encodeTag(field, WIRETYPE_LENGTH_DELIMITED) + encodeVarint(len(data)) + data for field, data in zip((4, 5, 6), fields)))
+
+
+def countStrokes(member, outputFile):
+    """ countStrokes(member, outputFile)
+Page converter writing the name of the member instead of the SVG.
+    """
+
+    with open(outputFile, 'wt') as f:
+        f.write(member)
+
+    return 1
+
+
+@pytest.mark.parametrize('jobs, pageConverter', [(1, will_reader_slate_A4.convertPage), (2, will_reader_slate_A4.convertPage), (2, countStrokes)])
+def testConvertPages(tmp_path, jobs, pageConverter):
+    # more than 100 pages, stored out of name order: page n starts at x = n
+    numPages = 103
+    fileName = str(tmp_path / 'notebook')
+    members = [f'sections/media/{(37*n) % numPages:03d}.protobuf' for n in range(numPages)]
+    with zipfile.ZipFile(fileName + '.will', 'w') as f:
+        for n, member in enumerate(members):
+            f.writestr(member, encodeMessages([slateStroke([n, 1, 1, 1])]))
+
+    pages = list(will_reader_slate_A4.convertPages(fileName, jobs, pageConverter))
+
+    assert [(n, outputFile) for n, outputFile, numStrokes in pages] == [(n, f'{fileName}_{n:02d}.svg') for n in range(numPages)]
+    for n, outputFile, numStrokes in pages:
+        with open(outputFile) as f:
+            content = f.read()
+        assert content == members[n] if pageConverter is countStrokes else f'd="M{n}.0,1.0' in content
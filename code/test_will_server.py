@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of will_server: the streamed SVG is the document convertBytes returns,
+and the requests that cannot be converted get the right status.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import os
+import queue
+import asyncio
+
+import pytest
+
+import will_reader
+import will_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE = os.path.join(HERE, 'WCM0007.will')
+
+# query strings of the conversions, with the matching convertBytes arguments
+QUERIES = [('', {}), ('?relative=1', {'relative': True}), ('?fit=0.5', {'fit': 0.5}), ('?outline=1', {'outline': True})]
+
+
+def readSample():
+    with open(SAMPLE, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('query, options', QUERIES)
+def testConvertUpload(query, options):
+    pytest.importorskip('numpy')
+    data = readSample()
+    chunks = queue.Queue()
+    numStrokes, numPoints, stageTimes = will_server.convertUpload(data, will_server.parseOptions(query[1:]), chunks)
+
+    svg = b''.join(chunks.get() for n in range(chunks.qsize())).decode()
+    assert svg == will_reader.convertBytes(data, **options)
+    assert numStrokes == will_reader.count_strokes(will_reader.readWillProtobuff(data))
+    assert 'decode' in stageTimes
+
+
+def testParseOptions():
+    assert will_server.parseOptions('poly=1&simplify=0.05&relative=no') == {'poly': True, 'simplify': 0.05, 'relative': False}
+    with pytest.raises(ValueError):
+        will_server.parseOptions('color=red')
+    with pytest.raises(ValueError):
+        will_server.parseOptions('fit=abc')
+
+
+async def request(port, method, target, body=None):
+    """ request(port, method, target, body=None)
+Sends a request to the server and returns its (status, headers, body,
+trailers), the body being decoded from the chunked transfer encoding if it is
+used.
+    """
+
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    head = f'{method} {target} HTTP/1.1\r\nHost: localhost\r\n'
+    if body is not None:
+        head += f'Content-Length: {len(body)}\r\n'
+    writer.write(head.encode() + b'\r\n' + (body or b''))
+    response = await reader.read()
+    writer.close()
+
+    head, _, content = response.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    if headers.get('Transfer-Encoding') != 'chunked':
+        return (int(lines[0].split()[1]), headers, content, {})
+
+    body = b''
+    while True:
+        size, _, content = content.partition(b'\r\n')
+        if int(size, 16) == 0:
+            break
+        body += content[:int(size, 16)]
+        content = content[int(size, 16)+2:]
+    trailers = dict(line.split(': ', 1) for line in content.decode('latin-1').split('\r\n') if line)
+
+    return (int(lines[0].split()[1]), headers, body, trailers)
+
+
+def testServer():
+    pytest.importorskip('numpy')
+    data = readSample()
+
+    async def run():
+        conversionServer = will_server.ConversionServer(jobs=1, log=None)
+        server = await conversionServer.start('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            for query, options in QUERIES:
+                status, headers, body, trailers = await request(port, 'POST', '/convert' + query, data)
+                assert status == 200
+                assert headers['Content-Type'] == 'image/svg+xml'
+                assert body.decode() == will_reader.convertBytes(data, **options)
+                assert int(trailers['X-Strokes']) == 240
+                assert 'convert;dur=' in trailers['Server-Timing']
+
+            for method, target, body, expected in [('POST', '/convert', b'not a .will file', 422), ('POST', '/convert', b'', 422),
+                                                   ('GET', '/convert', None, 405), ('POST', '/other', data, 404),
+                                                   ('POST', '/convert?color=red', data, 400), ('POST', '/convert', None, 411)]:
+                status, headers, content, trailers = await request(port, method, target, body)
+                assert status == expected, (method, target, content)
+        finally:
+            server.close()
+            await server.wait_closed()
+            conversionServer.shutdown()
+
+    asyncio.run(run())
+
+
+def testParseOptionsNoNumpy(monkeypatch):
+    monkeypatch.setattr(will_reader, 'importNumpy', lambda: None)
+    for query in ['outline=1', 'fit=0.5', 'simplify=0']:
+        with pytest.raises(ValueError, match='requires numpy'):
+            will_server.parseOptions(query)
+    assert will_server.parseOptions('outline=0&relative=1') == {'outline': False, 'relative': True}
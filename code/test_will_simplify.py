@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of will_simplify: the vectorized simplification keeps the points of the
+recursive Ramer-Douglas-Peucker algorithm, and the removed points are within
+the tolerance of the simplified strokes.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import os
+import math
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import will_reader
+import will_simplify
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def chordDistance(x, y, start, end, i):
+    """ chordDistance(x, y, start, end, i)
+Returns the distance of the point i to the line through the points start and
+end (to the point start if they are the same).
+    """
+
+    chordX, chordY = x[end] - x[start], y[end] - y[start]
+    pointX, pointY = x[i] - x[start], y[i] - y[start]
+    chordLength = math.hypot(chordX, chordY)
+    if chordLength == 0:
+        return math.hypot(pointX, pointY)
+
+    return abs(pointX*chordY - pointY*chordX)/chordLength
+
+
+def recursiveKeep(x, y, start, end, tolerance, keep):
+    """ recursiveKeep(x, y, start, end, tolerance, keep)
+Textbook recursive Ramer-Douglas-Peucker between the kept points start and end.
+    """
+
+    if end - start < 2:
+        return
+    distances = [chordDistance(x, y, start, end, i) for i in range(start+1, end)]
+    farthest = start + 1 + distances.index(max(distances))
+    if max(distances) > tolerance:
+        keep[farthest] = True
+        recursiveKeep(x, y, start, farthest, tolerance, keep)
+        recursiveKeep(x, y, farthest, end, tolerance, keep)
+
+
+def referenceMask(x, y, offsets, tolerance):
+    keep = [False]*len(x)
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+        if stop > start:
+            keep[start] = keep[stop-1] = True
+            recursiveKeep(x, y, start, stop-1, tolerance, keep)
+
+    return keep
+
+
+def randomStrokes(generator, numStrokes):
+    """ randomStrokes(generator, numStrokes)
+Returns (x, y, offsets) of random walks, with empty, single point and closed
+strokes, and repeated points.
+    """
+
+    x, y, offsets = [], [], [0]
+    for n in range(numStrokes):
+        length = generator.choice([0, 1, 2, 3, generator.randint(4, 200)])
+        strokeX, strokeY = [generator.uniform(0, 100)], [generator.uniform(0, 100)]
+        for i in range(length - 1):
+            step = 0 if generator.random() < 0.05 else generator.uniform(0, 2)
+            angle = generator.uniform(0, 2*math.pi)
+            strokeX.append(round(strokeX[-1] + step*math.cos(angle), 2))
+            strokeY.append(round(strokeY[-1] + step*math.sin(angle), 2))
+        if length > 3 and generator.random() < 0.2:
+            strokeX[-1], strokeY[-1] = strokeX[0], strokeY[0]
+        x.extend(strokeX[:length])
+        y.extend(strokeY[:length])
+        offsets.append(len(x))
+
+    return (x, y, offsets)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('tolerance', [0, 0.05, 0.5, 5])
+def testRecursiveReference(seed, tolerance):
+    x, y, offsets = randomStrokes(random.Random(seed), 60)
+    keep = will_simplify.simplifyMask(x, y, offsets, tolerance)
+
+    assert keep.tolist() == referenceMask(x, y, offsets, tolerance)
+
+
+@pytest.mark.parametrize('fileName', ['WCM0006.will', 'WCM0007.will', 'IntuosProPaper.will'])
+def testRemovedPointsWithinTolerance(fileName):
+    strokes = will_reader.decodeStrokeSet(will_reader.readWillProtobuff(os.path.join(HERE, fileName)))
+    x, y = strokes.x.astype(np.float64), strokes.y.astype(np.float64)
+    tolerance = 0.05
+    keep = will_simplify.simplifyMask(x, y, strokes.offsets, tolerance)
+
+    kept = np.flatnonzero(keep)
+    assert keep[strokes.offsets[:-1][np.diff(strokes.offsets) > 0]].all()
+    assert keep[strokes.offsets[1:][np.diff(strokes.offsets) > 0] - 1].all()
+    # every removed point is near the chord of the kept points around it
+    for i in np.flatnonzero(~keep):
+        after = np.searchsorted(kept, i)
+        assert chordDistance(x, y, kept[after-1], kept[after], i) <= tolerance
+    assert 0 < keep.sum() < len(keep)
+
+
+def testSimplifier():
+    # the middle points of the straight part are removed, with their widths
+    strokes = [([0.0, 1, 2, 3, 3], [0.0, 0, 0, 0, 5], np.array([1.0, 2, 3, 4, 5]), 2),
+               ([7.0], [7.0], 0.5, None),
+               ([], [], 0.5, 1)]
+    simplifier = will_simplify.StrokeSimplifier(0.1, batchSize=2)
+    simplified = list(simplifier.simplify(strokes))
+
+    assert [stroke[:2] for stroke in simplified] == [([0, 3, 3], [0, 0, 5]), ([7.0], [7.0]), ([], [])]
+    assert simplified[0][2].tolist() == [1, 4, 5]
+    assert [stroke[2:] for stroke in simplified[1:]] == [(0.5, None), (0.5, 1)]
+    assert (simplifier.numPoints, simplifier.numRemoved) == (6, 2)
+    assert 'removed 2 of 6 points' in simplifier.report()
+
+
+def testSimplifyStrokeSet():
+    strokes = will_reader.decodeStrokeSet(will_reader.readWillProtobuff(os.path.join(HERE, 'WCM0007.will')))
+    simplifier = will_simplify.StrokeSimplifier(0.05)
+    simplified = simplifier.simplifyStrokeSet(strokes)
+
+    keep = will_simplify.simplifyMask(strokes.x, strokes.y, strokes.offsets, 0.05)
+    assert np.array_equal(simplified.x, strokes.x[keep])
+    assert np.array_equal(simplified.width, strokes.width[keep])
+    assert len(simplified) == len(strokes)
+    assert simplifier.numRemoved == strokes.numPoints - simplified.numPoints == (~keep).sum()
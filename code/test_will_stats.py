@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of will_stats: nested and reentered stages are counted once, and the self
+times add up to the time spent in the stages.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import os
+import time
+import pstats
+
+import pytest
+
+import will_reader
+import will_stats
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class Clock:
+    """ Clock()
+Stand-in for time.perf_counter, that only moves forward with sleep.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(will_stats.time, 'perf_counter', clock)
+    return clock
+
+
+def testNestedStages(clock):
+    stats = will_stats.Stats()
+    with stats.timer('svg'):
+        clock.sleep(1)
+        with stats.timer('fit'):
+            clock.sleep(2)
+        clock.sleep(4)
+
+    assert stats.calls == {'svg': 1, 'fit': 1}
+    assert stats.times == {'svg': 7, 'fit': 2}
+    assert stats.selfTimes == {'svg': 5, 'fit': 2}
+    assert stats.nested == {('svg', 'fit'): [1, 2, 2]}
+    assert 'with nested stages' in stats.report()
+
+
+def testReenteredStage(clock):
+    stats = will_stats.Stats()
+    timer = stats.timer('decode')
+    assert stats.timer('decode') is not timer
+    with timer:
+        clock.sleep(1)
+        with stats.timer('decode'):
+            clock.sleep(2)
+        with stats.timer('decode'):
+            clock.sleep(4)
+    with stats.timer('decode'):
+        clock.sleep(8)
+
+    # the outer start time is kept, and the inner calls are not counted twice
+    assert stats.calls['decode'] == 4
+    assert stats.times['decode'] == 15
+    assert stats.selfTimes['decode'] == 15
+
+
+def testTimeIterator(clock):
+    stats = will_stats.Stats()
+
+    def slowItems():
+        for n in range(3):
+            clock.sleep(1)
+            yield n
+
+    with stats.timer('decode'):
+        for item in stats.timeIterator('read', slowItems()):
+            clock.sleep(10)
+
+    assert stats.calls['read'] == 4
+    assert stats.times == {'decode': 33, 'read': 3}
+    assert stats.selfTimes == {'decode': 30, 'read': 3}
+    assert stats.nested == {('decode', 'read'): [4, 3, 3]}
+
+
+def testDumpStats(tmp_path):
+    stats = will_stats.Stats()
+    with stats.timer('svg'):
+        with stats.timer('fit'):
+            pass
+    stats.dumpStats(str(tmp_path / 'stats.prof'))
+
+    profile = pstats.Stats(str(tmp_path / 'stats.prof')).stats
+    calls, numCalls, selfSeconds, seconds, callers = profile[('will_reader', 0, 'fit')]
+    assert (calls, selfSeconds, seconds) == (1, stats.selfTimes['fit'], stats.times['fit'])
+    assert list(callers) == [('will_reader', 0, 'svg')]
+    assert profile[('will_reader', 0, 'svg')][2] == stats.selfTimes['svg']
+
+
+@pytest.mark.parametrize('options', [{'fit': 0.5}, {'outline': True}])
+def testConversionStages(monkeypatch, options):
+    pytest.importorskip('numpy')
+    with open(os.path.join(HERE, 'WCM0007.will'), 'rb') as f:
+        data = f.read()
+    monkeypatch.setattr(will_reader, 'STATS', None)
+    stats = will_reader.enableStats()
+    # small batches, so the strokes are fitted or outlined inside the svg stage
+    monkeypatch.setattr(will_reader, 'BATCH_SIZE', 16)
+
+    startTime = time.perf_counter()
+    will_reader.convertBytes(data, **options)
+    wallTime = time.perf_counter() - startTime
+
+    stage = 'fit' if 'fit' in options else 'outline'
+    assert ('svg', stage) in stats.nested
+    assert sum(stats.selfTimes.values()) <= wallTime
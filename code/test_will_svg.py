@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the streaming SVG writer of will_reader: the document does not
+depend on the output (seekable file, stream, known bounding box), has one path
+per stroke as strokePathData writes it, and the viewBox of all the points. The
+compact paths draw the same points with as few characters as possible.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import io
+import os
+import re
+import random
+import itertools
+
+import pytest
+
+import will_reader
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLES = ['WCM0006.will', 'WCM0007.will', 'IntuosProPaper.will']
+
+
+class StreamWriter(io.StringIO):
+    """ StreamWriter()
+Text output that cannot seek, as a pipe or a socket.
+    """
+
+    def seekable(self):
+        return False
+
+
+def writeDocument(f, strokes, poly=False, boundingBox=None):
+    """ writeDocument(f, strokes, poly=False, boundingBox=None)
+Writes the strokes with an SVGWriter and returns the document.
+    """
+
+    will_reader.writeSVG(f, strokes, poly, boundingBox=boundingBox)
+    f.seek(0)
+
+    return f.read()
+
+
+@pytest.mark.parametrize('fileName', SAMPLES)
+@pytest.mark.parametrize('poly', [False, True])
+def testOutputs(tmp_path, fileName, poly):
+    xData, yData, lineData = will_reader.processBuffer(will_reader.readWillProtobuff(os.path.join(HERE, fileName)))
+    strokes = list(zip(xData, yData, lineData))
+    document = will_reader.XYLineDataToSVG(xData, yData, lineData, poly)
+
+    boundingBox = (min(map(min, xData)), min(map(min, yData)), max(map(max, xData)), max(map(max, yData)))
+    with open(tmp_path / 'out.svg', 'w+') as f:
+        assert writeDocument(f, strokes, poly) == document
+    assert writeDocument(StreamWriter(), strokes, poly) == document
+    assert writeDocument(StreamWriter(), iter(strokes), poly, boundingBox) == document
+
+    header, body = document[:will_reader.SVG_HEADER_SIZE], document[will_reader.SVG_HEADER_SIZE:]
+    assert header.rstrip().endswith('>') and body.startswith('<path')
+    minX, minY, width, height = map(float, re.search(r'viewBox="([^"]*)"', header).group(1).split())
+    assert (minX, minY, minX + width, minY + height) == pytest.approx(boundingBox, abs=1e-4)
+    paths = re.findall(r'<path stroke="black" fill="none" d="([^"]*)"/>', body)
+    assert paths == [will_reader.strokePathData(x, y, poly) for x, y in zip(xData, yData)]
+    assert body.endswith(will_reader.SVG_FOOTER)
+
+
+def testEmptyDocument():
+    assert will_reader.XYLineDataToSVG([], [], []) == writeDocument(StreamWriter(), [])
+    assert 'viewBox="0 0 0 0"' in will_reader.XYLineDataToSVG([], [], [])
+    # empty strokes are skipped
+    assert will_reader.XYLineDataToSVG([[], [1.0, 2.0]], [[], [3.0, 4.0]], [1.0, 1.0]).count('<path') == 1
+
+
+NUMBER = r'-?(?:\d+(?:\.\d*)?|\.\d+)'
+
+
+def pathPoints(pathData):
+    """ pathPoints(pathData)
+Returns the flat list of the absolute x, y of every point of an SVG path made
+of M, L and C commands (absolute or relative), control points included.
+    """
+
+    tokens = re.findall(r'[MmLlCc]|' + NUMBER, pathData)
+    points = []
+    x = y = 0.0
+    command = None
+    pending = []
+    for token in tokens:
+        if token in 'MmLlCc':
+            command = token
+            continue
+        pending.append(float(token))
+        count = 6 if command in 'Cc' else 2
+        if len(pending) < count:
+            continue
+        relative = command.islower()
+        pairs = [(pending[i] + (x if relative else 0), pending[i+1] + (y if relative else 0)) for i in range(0, count, 2)]
+        points.extend(itertools.chain.from_iterable(pairs))
+        x, y = pairs[-1]
+        pending = []
+        # the pairs after a moveto are linetos
+        command = {'M': 'L', 'm': 'l'}.get(command, command)
+    assert not pending
+
+    return points
+
+
+@pytest.mark.parametrize('precision', [0, 1, 2, 3])
+@pytest.mark.parametrize('poly', [False, True])
+def testCompactPathData(precision, poly):
+    generator = random.Random(precision)
+    for length in list(range(1, 12)) + [50]:
+        # decoded coordinates are integers divided by 10**precision
+        x = [generator.randint(-3000, 3000)/10**precision for n in range(length)]
+        y = [generator.randint(-3000, 3000)/10**precision for n in range(length)]
+        numPoints = length if poly else max(length - length%3, 1)
+        expected = [round(v, precision) for v in itertools.chain.from_iterable(zip(x[:numPoints], y[:numPoints]))]
+
+        for relative in (False, True):
+            pathData = will_reader.compactPathData(x, y, precision, poly, relative)
+            assert pathPoints(pathData) == pytest.approx(expected, abs=1e-9)
+            # as few characters as possible
+            for number in re.findall(NUMBER, pathData):
+                assert not number.lstrip('-').startswith('0') or number.lstrip('-') == '0'
+                assert not ('.' in number and number.endswith(('0', '.')))
+        # the same points as the plain paths (which repeat the first point of
+        # the polygonal ones)
+        assert pathPoints(will_reader.strokePathData(x, y, poly)) == pytest.approx(expected[:2]*poly + expected)
+
+
+@pytest.mark.parametrize('text, expected', [('1.50', '1.5'), ('2.00', '2'), ('0.25', '.25'), ('-0.25', '-.25'), ('10.0', '10'),
+                                            ('M0.50,-0.05 100.00 20.10', 'M.5,-.05 100 20.1'), ('0', '0'), ('-0.001', '-.001')])
+def testCompactNumbers(text, expected):
+    assert will_reader.compactNumbers(text) == expected
+
+
+def testFormatNumber():
+    assert will_reader.formatNumber(3.14159, 4) == '3.1416'
+    assert will_reader.formatNumber(2.0, 4) == '2'
+    assert will_reader.formatNumber(0.5, 4) == '.5'
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of will_wire: the values decode as protobuf encodes them, and truncated
+messages raise ValueError. The encoders of this module also build the stroke
+messages of the other tests.
+
+Run with python -m pytest from this directory.
+
+@author: ninguem
+"""
+import struct
+
+import pytest
+
+import will_wire
+from will_wire import WIRETYPE_VARINT, WIRETYPE_FIXED32, WIRETYPE_FIXED64, WIRETYPE_LENGTH_DELIMITED
+
+
+def encodeVarint(value):
+    """ encodeVarint(value)
+Returns the bytes of the unsigned varint value.
+    """
+
+    data = bytearray()
+    while value >= 0x80:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+    data.append(value)
+
+    return bytes(data)
+
+
+def encodeTag(field, wireType):
+    """ encodeTag(field, wireType)
+Returns the bytes of the tag of a field.
+    """
+
+    return encodeVarint(field << 3 | wireType)
+
+
+def encodeZigzagArray(values):
+    """ encodeZigzagArray(values)
+Returns the bytes of the packed array of the signed values, zigzag encoded.
+    """
+
+    return b''.join(encodeVarint(2*v if v >= 0 else -2*v - 1) for v in values)
+
+
+def encodeStroke(deltas, widthDeltas=None, precision=None, extra=b''):
+    """ encodeStroke(deltas, widthDeltas=None, precision=None, extra=b'')
+Returns the bytes of a stroke message with the given x, y deltas and stroke
+width deltas (the fields missing when None), followed by extra.
+    """
+
+    message = b''
+    if precision is not None:
+        message += encodeTag(3, WIRETYPE_VARINT) + encodeVarint(precision)
+    points = encodeZigzagArray(deltas)
+    message += encodeTag(4, WIRETYPE_LENGTH_DELIMITED) + encodeVarint(len(points)) + points
+    if widthDeltas is not None:
+        widths = encodeZigzagArray(widthDeltas)
+        message += encodeTag(5, WIRETYPE_LENGTH_DELIMITED) + encodeVarint(len(widths)) + widths
+
+    return message + extra
+
+
+def encodeMessages(messages):
+    """ encodeMessages(messages)
+Returns the paths.protobuf buffer of the messages (each one prefixed by its
+length).
+    """
+
+    return b''.join(encodeVarint(len(message)) + message for message in messages)
+
+
+@pytest.mark.parametrize('value', [0, 1, 127, 128, 300, 2**32 - 1, 2**63])
+def testDecodeVarint(value):
+    data = b'\x07' + encodeVarint(value)
+    assert will_wire.decodeVarint(data, 1) == (value, len(data))
+    assert will_wire.decodeVarint32(data, 1) == (value & 0xFFFFFFFF, len(data))
+    assert will_wire.skipField(data, 1, WIRETYPE_VARINT) == len(data)
+
+
+def testDecodePackedVarints():
+    values = [0, 1, 127, 128, 300, 2**31, 2**32 - 1]
+    assert will_wire.decodePackedVarints(b''.join(encodeVarint(v) for v in values)) == values
+    assert will_wire.decodePackedVarints(b'') == []
+
+
+def testDecodeFields():
+    data = struct.pack('<f', 0.5) + encodeVarint(3) + b'abc'
+    assert will_wire.decodeFloat(data, 0) == (0.5, 4)
+    assert will_wire.decodeLengthDelimited(data, 4) == (b'abc', len(data))
+    assert will_wire.skipField(data, 0, WIRETYPE_FIXED32) == 4
+    assert will_wire.skipField(data, 4, WIRETYPE_LENGTH_DELIMITED) == len(data)
+    assert will_wire.unpackTag(encodeTag(5, WIRETYPE_LENGTH_DELIMITED)[0]) == (5, WIRETYPE_LENGTH_DELIMITED)
+
+
+@pytest.mark.parametrize('data, pos', [(b'', 0), (b'\x80', 0), (b'\x01\xff\xff', 1), (b'\x01', 1)])
+def testTruncatedVarint(data, pos):
+    with pytest.raises(ValueError):
+        will_wire.decodeVarint(data, pos)
+    with pytest.raises(ValueError):
+        will_wire.decodeVarint32(data, pos)
+    with pytest.raises(ValueError):
+        will_wire.skipField(data, pos, WIRETYPE_VARINT)
+
+
+@pytest.mark.parametrize('data', [b'', b'\x00\x00\x00'])
+def testTruncatedFloat(data):
+    with pytest.raises(ValueError):
+        will_wire.decodeFloat(data, 0)
+    with pytest.raises(ValueError):
+        will_wire.skipField(data, 0, WIRETYPE_FIXED32)
+
+
+@pytest.mark.parametrize('wireType, data', [(WIRETYPE_FIXED64, b'\x00'*7), (WIRETYPE_LENGTH_DELIMITED, b'\x05abc')])
+def testTruncatedField(wireType, data):
+    with pytest.raises(ValueError):
+        will_wire.skipField(data, 0, wireType)
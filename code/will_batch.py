@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch conversion of Wacom WILL files to SVG.
+
+Converts every .will file given as files, directories or glob patterns (or
+read one per line from stdin) in a pool of worker processes, so the modules
+are imported once per worker instead of once per file.
+
+@author: ninguem
+"""
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import os
+import sys
+import time
+import argparse
+
+import will_reader
+from will_cache import ConversionCache, DEFAULT_MAX_BYTES
+
+
+def positiveInt(value):
+    """ positiveInt(value)
+Argparse type of the options counting processes or files: an integer of at
+least 1.
+    """
+
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'not an integer: {value!r}')
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1, not {number}')
+
+    return number
+
+
+def findWillFiles(inputs, recursive=False):
+    """ findWillFiles(inputs, recursive=False)
+Expands the list of inputs into the list of .will files to convert. Each input
+can be a .will file, a directory (its .will files are used) or a glob pattern.
+Duplicates are removed, keeping the first occurrence.
+
+inputs    : list of strings with files, directories or glob patterns
+recursive : also look for .will files in the subdirectories of directories
+    """
+
+    files = []
+    for name in inputs:
+        if os.path.isdir(name):
+            pattern = os.path.join(name, '**', '*.will') if recursive else os.path.join(name, '*.will')
+            files.extend(sorted(glob.glob(pattern, recursive=recursive)))
+        elif glob.has_magic(name):
+            files.extend(sorted(glob.glob(name, recursive=True)))
+        else:
+            files.append(name)
+
+    return list(dict.fromkeys(files))
+
+
+def convertOne(inputFile, poly=False, cacheDir=None, cacheBytes=DEFAULT_MAX_BYTES, incremental=False, simplify=None, fit=None, relative=False, outline=False):
+    """ convertOne(inputFile, poly=False, cacheDir=None, cacheBytes=DEFAULT_MAX_BYTES, incremental=False, simplify=None, fit=None, relative=False, outline=False)
+Worker function: converts one file and returns a tuple
+(inputFile, error, numStrokes, numPoints, seconds, cached, numRemoved), where
+error is None on success or the error message otherwise, cached tells whether
+the SVG came from the cache and numRemoved is the number of points removed by
+the simplification. It never raises, so one bad file does not stop the batch.
+
+inputFile   : string with the .will file.
+poly        : create polygonal paths instead of Bezier curves
+cacheDir    : directory of the conversion cache, or None
+cacheBytes  : maximum size of the cache
+incremental : only convert the strokes appended since the last conversion
+              (see will_reader.convertFileIncremental), the cache is not used
+simplify    : tolerance of the stroke simplification, or None
+fit         : tolerance of the Bezier fit of the strokes, or None
+relative    : use relative path commands
+outline     : write the strokes as filled outlines
+    """
+
+    startTime = time.perf_counter()
+    cache = ConversionCache(cacheDir, cacheBytes) if cacheDir else None
+    simplifier = None
+    try:
+        if simplify is not None:
+            from will_simplify import StrokeSimplifier
+            simplifier = StrokeSimplifier(simplify)
+        if incremental:
+            numStrokes, numPoints = will_reader.convertFileIncremental(inputFile, poly=poly, simplifier=simplifier, fit=fit, relative=relative, outline=outline)[:2]
+        else:
+            numStrokes, numPoints = will_reader.convertFile(inputFile, poly=poly, cache=cache, simplifier=simplifier, fit=fit, relative=relative, outline=outline)
+        error = None
+    except Exception as e:
+        numStrokes = numPoints = 0
+        error = f'{type(e).__name__}: {e}'
+
+    return (inputFile, error, numStrokes, numPoints, time.perf_counter() - startTime, cache is not None and cache.hits > 0,
+            simplifier.numRemoved if simplifier is not None else 0)
+
+
+def convertBatch(files, poly=False, jobs=None, chunkSize=1, out=sys.stdout, cacheDir=None, cacheBytes=DEFAULT_MAX_BYTES, incremental=False, simplify=None, fit=None, relative=False, outline=False):
+    """ convertBatch(files, poly=False, jobs=None, chunkSize=1, out=sys.stdout, cacheDir=None, cacheBytes=DEFAULT_MAX_BYTES, incremental=False, simplify=None, fit=None, relative=False, outline=False)
+Converts the files in a ProcessPoolExecutor, printing one line per file (in
+input order) and a final summary to out. Returns the number of failures.
+
+files       : list of .will files
+poly        : create polygonal paths instead of Bezier curves
+jobs        : number of worker processes (default: number of CPUs, 1 runs in
+              this process)
+chunkSize   : number of files sent to a worker at a time
+out         : text file-like object for the report
+cacheDir    : directory of the conversion cache, or None
+cacheBytes  : maximum size of the cache
+incremental : only convert the strokes appended since the last conversion
+simplify    : tolerance of the stroke simplification, or None
+fit         : tolerance of the Bezier fit of the strokes, or None
+relative    : use relative path commands
+outline     : write the strokes as filled outlines
+    """
+
+    if jobs is not None and jobs < 1:
+        raise ValueError(f'jobs must be at least 1, not {jobs}')
+    if chunkSize < 1:
+        raise ValueError(f'chunkSize must be at least 1, not {chunkSize}')
+
+    startTime = time.perf_counter()
+
+    # the processes converting many files import numpy once for the vectorized
+    # decoder, instead of decoding the small files in python (see
+    # will_reader.decodeMessages)
+    if jobs == 1:
+        if len(files) > 1:
+            will_reader.importNumpy()
+        results = (convertOne(inputFile, poly, cacheDir, cacheBytes, incremental, simplify, fit, relative, outline) for inputFile in files)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=will_reader.importNumpy)
+        results = executor.map(convertOne, files, [poly]*len(files), [cacheDir]*len(files), [cacheBytes]*len(files), [incremental]*len(files), [simplify]*len(files), [fit]*len(files), [relative]*len(files), [outline]*len(files), chunksize=chunkSize)
+
+    numFailed = 0
+    numCached = 0
+    totalStrokes = 0
+    totalPoints = 0
+    totalRemoved = 0
+    try:
+        for inputFile, error, numStrokes, numPoints, seconds, cached, numRemoved in results:
+            if error is None:
+                removed = f' ({numRemoved} removed)' if simplify is not None else ''
+                print(f'OK     {inputFile}: {numStrokes} strokes, {numPoints} points{removed}, {seconds*1000:.1f} ms{" (cached)" if cached else ""}', file=out)
+                numCached += cached
+                totalStrokes += numStrokes
+                totalPoints += numPoints
+                totalRemoved += numRemoved
+            else:
+                print(f'FAILED {inputFile}: {error}', file=out)
+                numFailed += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - startTime
+    rate = len(files)/elapsed if elapsed > 0 else 0
+    print(f'{len(files)} files ({len(files) - numFailed} converted, {numCached} from the cache, {numFailed} failed) in {elapsed:.2f} s: '
+          f'{rate:.1f} files/s, {totalPoints/elapsed if elapsed > 0 else 0:.0f} points/s', file=out)
+    if simplify is not None:
+        print(f'simplification (tolerance {simplify}): removed {totalRemoved} of {totalPoints + totalRemoved} points', file=out)
+
+    return numFailed
+
+
+if __name__=='__main__':
+
+    parser = argparse.ArgumentParser(description='Convert many Wacom WILL files to SVG in parallel.\n\nEach file.will is converted to file.svg, which is overwritten without warning.\nWith no inputs (or -), the list of files is read from stdin, one per line.',formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-p', '--poly', action='store_true', default=False, help='create polygonal path instead of Bezier curve')
+    parser.add_argument('-j', '--jobs', type=positiveInt, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-c', '--chunksize', type=positiveInt, default=1, help='number of files sent to a worker at a time (default: 1)')
+    parser.add_argument('-R', '--recursive', action='store_true', default=False, help='look for .will files in subdirectories')
+    parser.add_argument('--cache', default=None, help='directory of the conversion cache (reuses the SVG when the strokes did not change)')
+    parser.add_argument('-i', '--incremental', action='store_true', default=False, help='only convert the strokes appended since the last conversion (state kept in file.svg.state)')
+    parser.add_argument('-s', '--simplify', type=float, default=None, metavar='TOL', help='simplify the strokes (Ramer-Douglas-Peucker) with the tolerance TOL')
+    parser.add_argument('-f', '--fit', type=float, default=None, metavar='TOL', help='fit the strokes with cubic Bezier curves with the tolerance TOL')
+    parser.add_argument('-r', '--relative', action='store_true', default=False, help='use relative path commands (shorter numbers)')
+    parser.add_argument('-o', '--outline', action='store_true', default=False, help='draw the strokes as filled outlines that follow the pen pressure')
+    parser.add_argument('--cache-size', type=float, default=DEFAULT_MAX_BYTES/2**20, help=f'maximum size of the cache in MB (default: {DEFAULT_MAX_BYTES//2**20})')
+    parser.add_argument(dest='inputs', nargs='*', help='.will files, directories or glob patterns')
+
+    args = parser.parse_args()
+
+    option = will_reader.missingNumpy([('--outline', args.outline), ('--fit', args.fit is not None), ('--simplify', args.simplify is not None)])
+    if option is not None:
+        parser.error(f'{option} requires numpy, which is not installed')
+
+    inputs = [name for name in args.inputs if name != '-']
+    if not args.inputs or '-' in args.inputs:
+        inputs.extend(line.strip() for line in sys.stdin if line.strip())
+
+    files = findWillFiles(inputs, args.recursive)
+
+    sys.exit(1 if convertBatch(files, args.poly, args.jobs, args.chunksize, cacheDir=args.cache, cacheBytes=int(args.cache_size*2**20), incremental=args.incremental, simplify=args.simplify, fit=args.fit, relative=args.relative, outline=args.outline) else 0)
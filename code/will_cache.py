@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content addressed on-disk cache of conversions.
+
+The entries are keyed on a hash of the paths.protobuf member of the .will
+file (not of the zip, whose timestamps change on every export) and of the
+conversion options, so a notebook that is re-exported without changes is not
+converted again. Each entry is a file <key><suffix> (e.g. the generated .svg)
+plus a small <key>.json with its metadata. The cache is bounded in size and
+number of entries, the least recently used entries are evicted first.
+
+@author: ninguem
+"""
+from zipfile import ZipFile
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+# bump when the output of the converter changes, so old entries are not used
+CACHE_VERSION = 2
+
+DEFAULT_MAX_BYTES = 256*1024*1024
+
+HASH_CHUNK_SIZE = 64*1024
+
+
+def hashWillProtobuff(inputFile, member='sections/media/paths.protobuf'):
+    """ hashWillProtobuff(inputFile, member='sections/media/paths.protobuf')
+Returns the sha256 hex digest of the (uncompressed) protobuf member of the
+.will file, inflating it chunk by chunk.
+
+inputFile : string with the .will file (or a binary file-like object)
+member    : name of the protobuf member in the archive
+    """
+
+    digest = hashlib.sha256()
+    with ZipFile(inputFile) as input_zip:
+        with input_zip.open(member) as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """ ConversionCache(directory, maxBytes=DEFAULT_MAX_BYTES, maxEntries=None)
+On-disk cache of conversion results, see the module documentation. It is safe
+to share the directory between processes: entries are written to a temporary
+file and renamed into place.
+
+directory  : directory of the cache (created if needed)
+maxBytes   : maximum total size of the entries
+maxEntries : maximum number of entries (default: no limit)
+    """
+
+    def __init__(self, directory, maxBytes=DEFAULT_MAX_BYTES, maxEntries=None):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, protobufHash, options):
+        """ key(protobufHash, options)
+Returns the key of the conversion of a protobuf member with the given options.
+
+protobufHash : hash of the protobuf member (see hashWillProtobuff)
+options      : JSON serializable dictionary of the options of the conversion
+        """
+
+        keyData = json.dumps({'protobuf': protobufHash, 'options': options, 'version': CACHE_VERSION}, sort_keys=True)
+
+        return hashlib.sha256(keyData.encode()).hexdigest()
+
+    def path(self, key, suffix):
+        """ path(key, suffix)
+Returns the name of the file of the entry key with the given extension.
+        """
+
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key, suffix='.svg'):
+        """ get(key, suffix='.svg')
+Returns (entryFile, metadata) for the key, or None if it is not cached. The
+entry is marked as recently used.
+
+key    : key of the entry
+suffix : extension of the entry file
+        """
+
+        entryFile = self.path(key, suffix)
+        try:
+            with open(self.path(key, '.json')) as f:
+                metadata = json.load(f)
+            os.utime(entryFile)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        return (entryFile, metadata)
+
+    def copyTo(self, key, outputFile, suffix='.svg'):
+        """ copyTo(key, outputFile, suffix='.svg')
+Copies the entry to outputFile and returns its metadata, or None if it is not
+cached. An entry evicted by another process before it is copied is a miss.
+        """
+
+        entry = self.get(key, suffix)
+        if entry is None:
+            return None
+        try:
+            shutil.copyfile(entry[0], outputFile)
+        except OSError:
+            self.miss()
+            return None
+
+        return entry[1]
+
+    def miss(self):
+        """ miss()
+Counts the last hit of get as a miss, for the callers that could not read the
+entry (evicted by another process in the meantime).
+        """
+
+        self.hits -= 1
+        self.misses += 1
+
+    def put(self, key, sourceFile, metadata=None, suffix='.svg'):
+        """ put(key, sourceFile, metadata=None, suffix='.svg')
+Stores a copy of sourceFile as the entry of the key, with its metadata, and
+evicts old entries if the cache got too big.
+
+key        : key of the entry
+sourceFile : file with the result of the conversion
+metadata   : JSON serializable dictionary stored with the entry
+suffix     : extension of the entry file
+        """
+
+        def copySource(f):
+            with open(sourceFile, 'rb') as source:
+                shutil.copyfileobj(source, f)
+
+        self.store(key, copySource, metadata, suffix)
+
+    def store(self, key, write, metadata=None, suffix='.svg'):
+        """ store(key, write, metadata=None, suffix='.svg')
+Same as put, but the entry file is written by write(f), f being a binary file.
+        """
+
+        self.atomicWrite(self.path(key, suffix), write)
+        self.atomicWrite(self.path(key, '.json'), lambda f: f.write(json.dumps(metadata or {}).encode()))
+        self.evict()
+
+    def atomicWrite(self, fileName, write):
+        """ atomicWrite(fileName, write)
+Calls write(f) on a temporary file of the cache directory and renames it to
+fileName, so other processes never see a partial entry.
+        """
+
+        fd, tempName = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tempName, fileName)
+        except BaseException:
+            os.remove(tempName)
+            raise
+
+    def entries(self):
+        """ entries()
+Returns the list of (lastUsed, size, files) of the entries, oldest first.
+        """
+
+        groups = {}
+        with os.scandir(self.directory) as scan:
+            for dirEntry in scan:
+                key, suffix = os.path.splitext(dirEntry.name)
+                if suffix == '.tmp':
+                    continue
+                try:
+                    stat = dirEntry.stat()
+                except OSError:
+                    continue
+                lastUsed, size, files = groups.get(key, (0, 0, []))
+                lastUsed = lastUsed if suffix == '.json' else max(lastUsed, stat.st_mtime)
+                groups[key] = (lastUsed, size + stat.st_size, files + [dirEntry.path])
+
+        return sorted(groups.values())
+
+    def evict(self):
+        """ evict()
+Removes the least recently used entries until the cache fits in maxBytes and
+maxEntries.
+        """
+
+        entries = self.entries()
+        totalBytes = sum(size for lastUsed, size, files in entries)
+        numEntries = len(entries)
+        for lastUsed, size, files in entries:
+            if totalBytes <= self.maxBytes and (self.maxEntries is None or numEntries <= self.maxEntries):
+                break
+            for fileName in files:
+                try:
+                    os.remove(fileName)
+                except FileNotFoundError:
+                    pass
+            totalBytes -= size
+            numEntries -= 1
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fitting of the stroke samples with cubic Bezier curves.
+
+The legacy Bezier output reads every three samples as the control points of
+a curve, so it has as many coordinates as the input and does not pass through
+most of the pen positions. Here the strokes are fitted with the algorithm of
+P. J. Schneider ("An Algorithm for Automatically Fitting Digitized Curves",
+Graphics Gems, 1990): a least squares cubic is fitted to the samples with a
+chord length parameterization, the parameters are improved by a few Newton
+steps, and if the farthest sample is still farther than the tolerance the
+samples are split there and both halves fitted again, keeping the tangents
+continuous at the split. The samples alone do not pin the curve down (with a
+single interior sample the least squares system is singular), so the curve is
+also checked between the samples, and control points farther than the ends of
+the segment are replaced by the heuristic of Wu and Barsky.
+As in will_simplify, the recursion is replaced by passes over the pending
+segments of many strokes at once, so the numpy overhead is paid once per pass
+instead of once per segment.
+Requires numpy.
+
+@author: ninguem
+"""
+import numpy as np
+
+# number of Newton reparameterizations tried before splitting
+MAX_ITERATIONS = 4
+
+# reparameterization is only tried if the error is below this factor of the
+# tolerance, otherwise the segment is split right away
+ITERATION_ERROR_FACTOR = 4.0
+
+# relative determinant below which the least squares system of a segment is
+# taken as singular
+SINGULAR_EPSILON = 1e-9
+
+# fractions of the parameter interval between two samples where the distance
+# of the curve to the line between them is checked
+GAP_FRACTIONS = (0.25, 0.5, 0.75)
+
+# number of decimals of the coordinates of the fitted paths of the strokes given
+# without their decimal precision
+FIT_DECIMALS = 2
+
+
+def normalize(dx, dy):
+    """ normalize(dx, dy)
+Returns the unit vectors of the arrays (dx, dy), zero vectors are unchanged.
+    """
+
+    length = np.hypot(dx, dy)
+    length = np.where(length > 0, length, 1)
+
+    return (dx/length, dy/length)
+
+
+def squaredSegmentDistances(px, py, ax, ay, bx, by):
+    """ squaredSegmentDistances(px, py, ax, ay, bx, by)
+Returns the squared distances of the points (px, py) to the line segments from
+(ax, ay) to (bx, by).
+    """
+
+    dx, dy = bx - ax, by - ay
+    lengths = dx*dx + dy*dy
+    t = np.clip(((px - ax)*dx + (py - ay)*dy)/np.where(lengths > 0, lengths, 1), 0, 1)
+    ex, ey = ax + t*dx - px, ay + t*dy - py
+
+    return ex*ex + ey*ey
+
+
+def segmentPoints(starts, ends):
+    """ segmentPoints(starts, ends)
+Returns (segment, index, firsts) for the segments of points starts[i] to
+ends[i] (inclusive): the segment and the point index of every point of every
+segment, concatenated, and the position of the first point of each segment in
+them.
+    """
+
+    lengths = ends - starts + 1
+    firsts = np.cumsum(lengths) - lengths
+    segment = np.repeat(np.arange(len(starts)), lengths)
+    index = np.arange(lengths.sum()) + np.repeat(starts - firsts, lengths)
+
+    return (segment, index, firsts)
+
+
+def firstMaxima(values, segment, firsts):
+    """ firstMaxima(values, segment, firsts)
+Returns the maximum of the values of each segment and the position (in
+values) of its first occurrence.
+    """
+
+    maxima = np.maximum.reduceat(values, firsts)
+    candidates = np.flatnonzero(values == maxima[segment])
+    positions = candidates[np.concatenate(([True], np.diff(segment[candidates]) > 0))]
+
+    return (maxima, positions)
+
+
+class SegmentFit:
+    """ SegmentFit(x, y, starts, ends, leftTangents, rightTangents)
+Least squares cubic fits of the segments of points starts[i] to ends[i] (at
+least 3 points each) with the given unit end tangents ((tx, ty) tuples of
+arrays), all computed together.
+    """
+
+    def __init__(self, x, y, starts, ends, leftTangents, rightTangents):
+        self.x = x
+        self.y = y
+        self.starts = starts
+        self.ends = ends
+        self.leftTangents = leftTangents
+        self.rightTangents = rightTangents
+        self.segment, self.index, self.firsts = segmentPoints(starts, ends)
+        self.lasts = self.firsts + (ends - starts)
+
+    def chordLengthParameters(self):
+        """ chordLengthParameters()
+Returns the parameters of the points proportional to the length of the
+polyline of their segment up to each of them, from 0 to 1.
+        """
+
+        steps = np.hypot(np.diff(self.x[self.index], prepend=0), np.diff(self.y[self.index], prepend=0))
+        steps[self.firsts] = 0
+        lengths = np.cumsum(steps)
+        lengths -= lengths[self.firsts][self.segment]
+
+        return lengths/lengths[self.lasts][self.segment]
+
+    def fit(self, u):
+        """ fit(u)
+Fits the beziers to the points at the parameters u. Returns
+(beziers, errors, splits): the len(starts) x 8 array of the control points
+(x0, y0, x1, y1, x2, y2, x3, y3) of each segment, the largest squared distance
+of an interior point to its position on the curve (or of the curve between
+the point and its neighbours to the line between them) and the index of that
+point.
+        """
+
+        segment, firsts = self.segment, self.firsts
+        x = self.x[self.index]
+        y = self.y[self.index]
+        x0, y0 = self.x[self.starts], self.y[self.starts]
+        x3, y3 = self.x[self.ends], self.y[self.ends]
+        (t1x, t1y), (t2x, t2y) = self.leftTangents, self.rightTangents
+
+        v = 1 - u
+        b0 = v*v*v
+        b1 = 3*u*v*v
+        b2 = 3*u*u*v
+        b3 = u*u*u
+        rx = x - (b0 + b1)*x0[segment] - (b2 + b3)*x3[segment]
+        ry = y - (b0 + b1)*y0[segment] - (b2 + b3)*y3[segment]
+
+        c11 = np.add.reduceat(b1*b1, firsts)*(t1x*t1x + t1y*t1y)
+        c12 = np.add.reduceat(b1*b2, firsts)*(t1x*t2x + t1y*t2y)
+        c22 = np.add.reduceat(b2*b2, firsts)*(t2x*t2x + t2y*t2y)
+        r1 = t1x*np.add.reduceat(b1*rx, firsts) + t1y*np.add.reduceat(b1*ry, firsts)
+        r2 = t2x*np.add.reduceat(b2*rx, firsts) + t2y*np.add.reduceat(b2*ry, firsts)
+
+        # nearly singular systems (e.g. a single interior point, which only
+        # constrains a combination of the two alphas) give huge alphas
+        det = c11*c22 - c12*c12
+        singular = np.abs(det) <= SINGULAR_EPSILON*c11*c22
+        safeDet = np.where(singular, 1, det)
+        alphaLeft = np.where(singular, 0, (r1*c22 - r2*c12)/safeDet)
+        alphaRight = np.where(singular, 0, (c11*r2 - c12*r1)/safeDet)
+
+        # degenerate solutions, control points farther than the distance between
+        # the ends and segments of 3 points fall back to the heuristic of Wu and
+        # Barsky; if it is not good enough the segment is split
+        segmentLength = np.hypot(x3 - x0, y3 - y0)
+        epsilon = 1e-6*segmentLength
+        degenerate = ((alphaLeft < epsilon) | (alphaRight < epsilon) | (alphaLeft > segmentLength) | (alphaRight > segmentLength)
+                      | (self.ends - self.starts == 2))
+        alphaLeft = np.where(degenerate, segmentLength/3, alphaLeft)
+        alphaRight = np.where(degenerate, segmentLength/3, alphaRight)
+
+        x1, y1 = x0 + alphaLeft*t1x, y0 + alphaLeft*t1y
+        x2, y2 = x3 + alphaRight*t2x, y3 + alphaRight*t2y
+        beziers = np.column_stack((x0, y0, x1, y1, x2, y2, x3, y3))
+
+        dx = b1*(x1 - x0)[segment] + b2*(x2 - x3)[segment] - rx
+        dy = b1*(y1 - y0)[segment] + b2*(y2 - y3)[segment] - ry
+        distances = dx*dx + dy*dy
+
+        # the curve could still wander away between the points: at a few
+        # parameters between two points it has to be near the line between
+        # them, else the segment is split at one of the two
+        gapSegment = segment[:-1]
+        gapDistances = np.zeros(len(gapSegment))
+        for fraction in GAP_FRACTIONS:
+            um = u[:-1] + fraction*(u[1:] - u[:-1])
+            vm = 1 - um
+            gapX = vm*vm*vm*x0[gapSegment] + 3*um*vm*vm*x1[gapSegment] + 3*um*um*vm*x2[gapSegment] + um*um*um*x3[gapSegment]
+            gapY = vm*vm*vm*y0[gapSegment] + 3*um*vm*vm*y1[gapSegment] + 3*um*um*vm*y2[gapSegment] + um*um*um*y3[gapSegment]
+            gapDistances = np.maximum(gapDistances, squaredSegmentDistances(gapX, gapY, x[:-1], y[:-1], x[1:], y[1:]))
+        gapDistances[self.lasts[:-1]] = 0      # between two segments
+        distances[:-1] = np.maximum(distances[:-1], gapDistances)
+        distances[1:] = np.maximum(distances[1:], gapDistances)
+
+        # the first and last points are on the curve and cannot be split at
+        distances[firsts] = -1
+        distances[self.lasts] = -1
+        errors, positions = firstMaxima(distances, segment, firsts)
+
+        return (beziers, errors, self.index[positions])
+
+    def reparameterize(self, beziers, u):
+        """ reparameterize(beziers, u)
+Returns the parameters u improved by one Newton step on the distance of each
+point to the bezier of its segment.
+        """
+
+        x0, y0, x1, y1, x2, y2, x3, y3 = beziers[self.segment].T
+        v = 1 - u
+
+        # the point, first and second derivatives of the curve at u
+        dx = v*v*v*x0 + 3*u*v*v*x1 + 3*u*u*v*x2 + u*u*u*x3 - self.x[self.index]
+        dy = v*v*v*y0 + 3*u*v*v*y1 + 3*u*u*v*y2 + u*u*u*y3 - self.y[self.index]
+        d1x = 3*(v*v*(x1 - x0) + 2*u*v*(x2 - x1) + u*u*(x3 - x2))
+        d1y = 3*(v*v*(y1 - y0) + 2*u*v*(y2 - y1) + u*u*(y3 - y2))
+        d2x = 6*(v*(x2 - 2*x1 + x0) + u*(x3 - 2*x2 + x1))
+        d2y = 6*(v*(y2 - 2*y1 + y0) + u*(y3 - 2*y2 + y1))
+
+        numerator = dx*d1x + dy*d1y
+        denominator = d1x*d1x + d1y*d1y + dx*d2x + dy*d2y
+        step = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+        return np.clip(u - step, 0, 1)
+
+    def subset(self, mask, u):
+        """ subset(mask, u)
+Returns the SegmentFit of the segments where mask is True and their
+parameters u.
+        """
+
+        fit = SegmentFit(self.x, self.y, self.starts[mask], self.ends[mask],
+                         (self.leftTangents[0][mask], self.leftTangents[1][mask]),
+                         (self.rightTangents[0][mask], self.rightTangents[1][mask]))
+
+        return (fit, u[mask[self.segment]])
+
+    def splitArrays(self, mask, splits):
+        """ splitArrays(mask, splits)
+Returns the (starts, ends, splits, t1x, t1y, t2x, t2y) arrays of the segments
+where mask is True.
+        """
+
+        return (self.starts[mask], self.ends[mask], splits[mask], self.leftTangents[0][mask], self.leftTangents[1][mask],
+                self.rightTangents[0][mask], self.rightTangents[1][mask])
+
+
+def fitStrokes(x, y, offsets, tolerance):
+    """ fitStrokes(x, y, offsets, tolerance)
+Fits cubic Bezier curves to every stroke, see the module documentation.
+Returns (beziers, bezierOffsets): the n x 4 x 2 array of the control points of
+the n curves and the array with len(strokes)+1 indexes of the first curve of
+each stroke. The curves of a stroke start each at the end of the previous one,
+no sample is farther than tolerance from its position on them and, between
+two samples, they stay within tolerance of the line between them (checked at
+GAP_FRACTIONS of the way). Repeated
+samples are ignored, and strokes with less than two distinct samples have no
+curve.
+
+x         : x coordinates of all the points
+y         : y coordinates of all the points
+offsets   : array with len(strokes)+1 indexes of the start of each stroke
+tolerance : maximum distance of the samples to the curves
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    # drop repeated samples
+    distinct = np.ones(len(x), dtype=bool)
+    distinct[1:] = (np.diff(x) != 0) | (np.diff(y) != 0)
+    distinct[offsets[:-1][offsets[:-1] < len(x)]] = True
+    x = x[distinct]
+    y = y[distinct]
+    offsets = np.concatenate(([0], np.cumsum(distinct)))[offsets]
+
+    starts = offsets[:-1]
+    ends = offsets[1:] - 1
+    valid = ends > starts
+    starts, ends = starts[valid], ends[valid]
+    leftTangents = normalize(x[starts+1] - x[starts], y[starts+1] - y[starts])
+    rightTangents = normalize(x[ends-1] - x[ends], y[ends-1] - y[ends])
+
+    squaredTolerance = tolerance*tolerance
+    found = []
+    while len(starts):
+        # two points: straight segment
+        line = ends - starts == 1
+        if np.any(line):
+            x0, y0, x3, y3 = x[starts[line]], y[starts[line]], x[ends[line]], y[ends[line]]
+            # the control points are a third of the way, but closer if the end
+            # tangents make the curve bulge farther than the tolerance from the
+            # line (the bulge is at most 3/4 of the distance across the line)
+            chordX, chordY = normalize(x3 - x0, y3 - y0)
+            across = np.maximum(np.abs(leftTangents[0][line]*chordY - leftTangents[1][line]*chordX),
+                                np.abs(rightTangents[0][line]*chordY - rightTangents[1][line]*chordX))
+            distance = np.minimum(np.hypot(x3 - x0, y3 - y0)/3, tolerance/np.maximum(0.75*across, 1e-12))
+            found.append((starts[line], np.column_stack((
+                x0, y0, x0 + distance*leftTangents[0][line], y0 + distance*leftTangents[1][line],
+                x3 + distance*rightTangents[0][line], y3 + distance*rightTangents[1][line], x3, y3))))
+        curve = ~line
+        fit = SegmentFit(x, y, starts[curve], ends[curve],
+                         (leftTangents[0][curve], leftTangents[1][curve]), (rightTangents[0][curve], rightTangents[1][curve]))
+        if not len(fit.starts):
+            break
+
+        u = fit.chordLengthParameters()
+        beziers, errors, splits = fit.fit(u)
+        done = errors <= squaredTolerance
+        found.append((fit.starts[done], beziers[done]))
+
+        # segments close to the tolerance get a few reparameterizations
+        retry = ~done & (errors <= squaredTolerance*ITERATION_ERROR_FACTOR**2)
+        retryFit, retryU = fit.subset(retry, u)
+        retryBeziers = beziers[retry]
+        retrySplits = splits[retry]
+        for iteration in range(MAX_ITERATIONS):
+            if not len(retryFit.starts):
+                break
+            retryU = retryFit.reparameterize(retryBeziers, retryU)
+            retryBeziers, retryErrors, retrySplits = retryFit.fit(retryU)
+            retryDone = retryErrors <= squaredTolerance
+            found.append((retryFit.starts[retryDone], retryBeziers[retryDone]))
+            retryFit, retryU = retryFit.subset(~retryDone, retryU)
+            retryBeziers = retryBeziers[~retryDone]
+            retrySplits = retrySplits[~retryDone]
+
+        # the others are split at their farthest point
+        splitArrays = zip(fit.splitArrays(~done & ~retry, splits),
+                          retryFit.splitArrays(np.ones(len(retryFit.starts), dtype=bool), retrySplits))
+        splitStarts, splitEnds, splitPoints, t1x, t1y, t2x, t2y = [np.concatenate(arrays) for arrays in splitArrays]
+        centerX, centerY = normalize(x[splitPoints-1] - x[splitPoints+1], y[splitPoints-1] - y[splitPoints+1])
+
+        starts = np.concatenate((splitStarts, splitPoints))
+        ends = np.concatenate((splitPoints, splitEnds))
+        leftTangents = (np.concatenate((t1x, -centerX)), np.concatenate((t1y, -centerY)))
+        rightTangents = (np.concatenate((centerX, t2x)), np.concatenate((centerY, t2y)))
+
+    if not found:
+        return (np.zeros((0, 4, 2)), np.zeros(len(offsets), dtype=np.int64))
+
+    # the curves are found out of order, their start points sort them
+    bezierStarts = np.concatenate([starts for starts, beziers in found])
+    beziers = np.concatenate([beziers for starts, beziers in found])
+    order = np.argsort(bezierStarts, kind='stable')
+
+    return (beziers[order].reshape(-1, 4, 2), np.searchsorted(bezierStarts[order], offsets))
+
+
+def fitCubicBeziers(arrayX, arrayY, tolerance):
+    """ fitCubicBeziers(arrayX, arrayY, tolerance)
+Returns the n x 4 x 2 array of the control points of the n cubic Bezier
+curves fitted to a single stroke (see fitStrokes).
+
+arrayX    : x coordinates of the stroke
+arrayY    : y coordinates of the stroke
+tolerance : maximum distance of the samples to the curves
+    """
+
+    return fitStrokes(arrayX, arrayY, [0, len(arrayX)], tolerance)[0]
+
+
+def bezierPathData(beziers, decimals=FIT_DECIMALS, relative=False):
+    """ bezierPathData(beziers, decimals=FIT_DECIMALS, relative=False)
+Returns the content of the d attribute of the SVG path of consecutive cubic
+Bezier curves.
+
+beziers  : n x 4 x 2 array of control points, n > 0
+decimals : number of decimals of the coordinates
+relative : use relative c commands (control points relative to the start of
+           each curve)
+    """
+
+    if relative:
+        # rounded first, so the rounding errors do not add up along the path
+        beziers = np.round(beziers, decimals)
+        controlPoints = beziers[:, 1:] - beziers[:, :1]
+        command = 'm'
+    else:
+        controlPoints = beziers[:, 1:]
+        command = 'M'
+
+    # start point, then the 3 remaining control points of each curve
+    coordinates = np.concatenate((beziers[0, 0], controlPoints.ravel())).tolist()
+    coordinateFormat = f'%.{decimals}f,%.{decimals}f'
+    curveFormat = ' '.join([coordinateFormat]*3)
+    curve = ' c' if relative else ' C'
+
+    return (command + coordinateFormat + curve + curve.join([curveFormat]*len(beziers))) % tuple(coordinates)
+
+
+def strokesPathData(strokes, tolerance, decimals=FIT_DECIMALS, relative=False):
+    """ strokesPathData(strokes, tolerance, decimals=FIT_DECIMALS, relative=False)
+Returns the list of the d attributes of the SVG paths of the cubic Bezier
+curves fitted to the strokes, all fitted together. Strokes with a single
+distinct point give a lone moveto, empty strokes an empty string.
+
+strokes   : sequence of (x, y) tuples
+tolerance : maximum distance of the samples to the curves
+decimals  : number of decimals of the coordinates, or the sequence of the
+            numbers of decimals of each stroke (its decimal precision, None
+            for FIT_DECIMALS)
+relative  : use relative commands (see bezierPathData)
+    """
+
+    if isinstance(decimals, int):
+        decimals = [decimals]*len(strokes)
+    else:
+        decimals = [FIT_DECIMALS if n is None else n for n in decimals]
+
+    offsets = np.zeros(len(strokes)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x, y in strokes])
+    x = np.concatenate([np.asarray(x, dtype=np.float64) for x, y in strokes]) if strokes else np.zeros(0)
+    y = np.concatenate([np.asarray(y, dtype=np.float64) for x, y in strokes]) if strokes else np.zeros(0)
+
+    beziers, bezierOffsets = fitStrokes(x, y, offsets, tolerance)
+
+    paths = []
+    for n, (start, stop) in enumerate(zip(bezierOffsets[:-1].tolist(), bezierOffsets[1:].tolist())):
+        if start < stop:
+            paths.append(bezierPathData(beziers[start:stop], decimals[n], relative))
+        elif offsets[n] < offsets[n+1]:
+            paths.append(f'M{x[offsets[n]]:.{decimals[n]}f},{y[offsets[n]]:.{decimals[n]}f}')
+        else:
+            paths.append('')
+
+    return paths
+
+
+def fitPathData(arrayX, arrayY, tolerance, decimals=FIT_DECIMALS, relative=False):
+    """ fitPathData(arrayX, arrayY, tolerance, decimals=FIT_DECIMALS, relative=False)
+Returns the content of the d attribute of the SVG path of the cubic Bezier
+curves fitted to a single stroke (see strokesPathData), decimals being its
+decimal precision (None for FIT_DECIMALS).
+    """
+
+    return strokesPathData([(arrayX, arrayY)], tolerance, [decimals], relative)[0]
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spatial index of the strokes, for region export and hit-testing.
+
+The bounding boxes of the strokes (see will_reader.StrokeSet) are put in a
+uniform grid over the page: each cell keeps the indexes of the strokes whose
+box overlaps it, in one flat array (cellStrokes[cellOffsets[c]:cellOffsets[c+1]]
+are the strokes of the cell c). A rectangle query only looks at the cells it
+covers, then checks the boxes of their strokes; a point query is a small
+rectangle query followed by the exact distance to the candidate strokes. The
+grid is built and queried with a few numpy operations, and it is saved in the
+same binary form as the StrokeSet (mapped back without copying), so it can be
+kept in the conversion cache next to the decoded strokes.
+Requires numpy.
+
+@author: ninguem
+"""
+import numpy as np
+
+import will_reader
+
+INDEX_MAGIC = b'WILLIDX\x00'
+INDEX_VERSION = 1
+
+# target mean number of strokes per cell
+STROKES_PER_CELL = 2.0
+
+
+def expandRanges(starts, counts):
+    """ expandRanges(starts, counts)
+Returns the concatenation of the ranges starts[i]:starts[i]+counts[i], and the
+index i of the range of each element.
+    """
+
+    firsts = np.cumsum(counts) - counts
+    rangeIndexes = np.repeat(np.arange(len(counts)), counts)
+
+    return (np.arange(counts.sum()) - firsts[rangeIndexes] + starts[rangeIndexes], rangeIndexes)
+
+
+class StrokeIndex:
+    """ StrokeIndex(minX, minY, maxX, maxY, cellSize=None)
+Uniform grid index of the bounding boxes of the strokes, see the module
+documentation. The strokes are identified by their position in the document
+(the order of the messages of paths.protobuf). Empty strokes (min > max) are
+never returned.
+
+minX, minY, maxX, maxY : arrays with the bounding box of each stroke
+cellSize               : size of the (square) cells, default about
+                         STROKES_PER_CELL strokes per cell
+    """
+
+    # arrays written by toBytes and save, with their little endian dtypes
+    ARRAYS = (('minX', '<f4'), ('minY', '<f4'), ('maxX', '<f4'), ('maxY', '<f4'),
+              ('grid', '<f8'), ('cellOffsets', '<i8'), ('cellStrokes', '<i4'))
+
+    def __init__(self, minX, minY, maxX, maxY, cellSize=None):
+        self.minX = np.asarray(minX, dtype=np.float32)
+        self.minY = np.asarray(minY, dtype=np.float32)
+        self.maxX = np.asarray(maxX, dtype=np.float32)
+        self.maxY = np.asarray(maxY, dtype=np.float32)
+
+        strokes = np.flatnonzero((self.minX <= self.maxX) & (self.minY <= self.maxY))
+        if len(strokes):
+            originX, originY = float(self.minX[strokes].min()), float(self.minY[strokes].min())
+            width = float(self.maxX[strokes].max()) - originX
+            height = float(self.maxY[strokes].max()) - originY
+        else:
+            originX = originY = width = height = 0.0
+        if cellSize is None:
+            cellSize = np.sqrt(width*height*STROKES_PER_CELL/max(len(strokes), 1))
+        cellSize = max(cellSize, width/1024, height/1024, 1e-6)
+        numX = int(width//cellSize) + 1
+        numY = int(height//cellSize) + 1
+        # origin, cell size and number of cells of the grid
+        self.grid = np.array([originX, originY, cellSize, numX, numY], dtype=np.float64)
+
+        # every (cell, stroke) pair, sorted by cell
+        cellX0, cellY0, cellX1, cellY1 = self.cellRanges(self.minX[strokes], self.minY[strokes], self.maxX[strokes], self.maxY[strokes])
+        spanX = cellX1 - cellX0 + 1
+        counts = spanX*(cellY1 - cellY0 + 1)
+        positions, pairStrokes = expandRanges(np.zeros(len(strokes), dtype=np.int64), counts)
+        cells = (cellY0[pairStrokes] + positions//spanX[pairStrokes])*numX + cellX0[pairStrokes] + positions%spanX[pairStrokes]
+        order = np.argsort(cells, kind='stable')
+
+        self.cellStrokes = strokes[pairStrokes[order]].astype(np.int32)
+        self.cellOffsets = np.zeros(numX*numY + 1, dtype=np.int64)
+        self.cellOffsets[1:] = np.cumsum(np.bincount(cells, minlength=numX*numY))
+
+    @classmethod
+    def fromStrokeSet(cls, strokes, cellSize=None):
+        """ StrokeIndex.fromStrokeSet(strokes, cellSize=None)
+Builds the index of the bounding boxes of a will_reader.StrokeSet.
+        """
+
+        return cls(strokes.minX, strokes.minY, strokes.maxX, strokes.maxY, cellSize)
+
+    def cellRanges(self, minX, minY, maxX, maxY):
+        """ cellRanges(minX, minY, maxX, maxY)
+Returns the (cellX0, cellY0, cellX1, cellY1) arrays of the first and last
+columns and rows of the cells overlapped by the boxes, clipped to the grid.
+        """
+
+        originX, originY, cellSize, numX, numY = self.grid
+
+        def cell(values, origin, numCells):
+            return np.clip(np.floor((np.asarray(values, dtype=np.float64) - origin)/cellSize), 0, numCells - 1).astype(np.int64)
+
+        return (cell(minX, originX, numX), cell(minY, originY, numY), cell(maxX, originX, numX), cell(maxY, originY, numY))
+
+    def __len__(self):
+        return len(self.minX)
+
+    def query(self, minX, minY, maxX, maxY):
+        """ query(minX, minY, maxX, maxY)
+Returns the sorted array of the indexes of the strokes whose bounding box
+intersects the rectangle.
+        """
+
+        originX, originY, cellSize, numX, numY = self.grid
+        if (not len(self.cellStrokes) or minX > maxX or minY > maxY
+                or maxX < originX or maxY < originY or minX > originX + numX*cellSize or minY > originY + numY*cellSize):
+            return np.zeros(0, dtype=np.int64)
+
+        cellX0, cellY0, cellX1, cellY1 = (int(v) for v in self.cellRanges(minX, minY, maxX, maxY))
+        cells = (np.arange(cellY0, cellY1 + 1)[:, None]*int(numX) + np.arange(cellX0, cellX1 + 1)).ravel()
+        positions = expandRanges(self.cellOffsets[cells], self.cellOffsets[cells+1] - self.cellOffsets[cells])[0]
+        candidates = np.unique(self.cellStrokes[positions]).astype(np.int64)
+
+        inside = ((self.minX[candidates] <= maxX) & (self.maxX[candidates] >= minX)
+                  & (self.minY[candidates] <= maxY) & (self.maxY[candidates] >= minY))
+
+        return candidates[inside]
+
+    def strokesAt(self, strokes, x, y, tolerance=1.0):
+        """ strokesAt(strokes, x, y, tolerance=1.0)
+Hit-testing: returns the sorted array of the indexes of the strokes that pass
+within tolerance of the point (x, y), the distance being measured to the
+segments between consecutive points of the stroke.
+
+strokes   : will_reader.StrokeSet the index was built from
+x, y      : coordinates of the point
+tolerance : maximum distance of the stroke to the point
+        """
+
+        candidates = self.query(x - tolerance, y - tolerance, x + tolerance, y + tolerance)
+        if not len(candidates):
+            return candidates
+
+        # segments from each point to the next one of the same stroke (the last
+        # point of a stroke is a segment of length 0)
+        starts = strokes.offsets[candidates]
+        counts = strokes.offsets[candidates+1] - starts
+        points, pointStrokes = expandRanges(starts, counts)
+        nextPoints = np.where(points + 1 < (starts + counts)[pointStrokes], points + 1, points)
+
+        ax, ay = strokes.x[points].astype(np.float64), strokes.y[points].astype(np.float64)
+        dx, dy = strokes.x[nextPoints] - ax, strokes.y[nextPoints] - ay
+        lengths2 = dx*dx + dy*dy
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.clip(np.where(lengths2 > 0, ((x - ax)*dx + (y - ay)*dy)/lengths2, 0), 0, 1)
+        distances = np.hypot(ax + t*dx - x, ay + t*dy - y)
+
+        firsts = np.cumsum(counts) - counts
+        hit = np.minimum.reduceat(distances, firsts) <= tolerance
+
+        return candidates[hit]
+
+    def namedArrays(self):
+        """ namedArrays()
+Returns the list of (name, dtype, array) of ARRAYS.
+        """
+
+        return [(name, dtype, getattr(self, name)) for name, dtype in self.ARRAYS]
+
+    def toBytes(self):
+        """ toBytes()
+Returns the binary form of the index (see save).
+        """
+
+        return will_reader.arraysToBytes(INDEX_MAGIC, INDEX_VERSION, self.namedArrays())
+
+    def save(self, fileName):
+        """ save(fileName)
+Writes the index in the binary form of will_reader.packArrays, which
+StrokeIndex.load maps back without rebuilding anything.
+
+fileName : name of the file (.index)
+        """
+
+        will_reader.writeArrays(fileName, INDEX_MAGIC, INDEX_VERSION, self.namedArrays())
+
+    @classmethod
+    def fromBuffer(cls, buffer):
+        """ StrokeIndex.fromBuffer(buffer)
+Builds the index from its binary form (see save), the arrays are read-only
+views of buffer.
+        """
+
+        version, arrays = will_reader.unpackArrays(buffer, INDEX_MAGIC, INDEX_VERSION, 'stroke index')
+
+        index = cls.__new__(cls)
+        for name, dtype in cls.ARRAYS:
+            setattr(index, name, arrays[name])
+
+        return index
+
+    @classmethod
+    def load(cls, fileName, useMmap=True):
+        """ StrokeIndex.load(fileName, useMmap=True)
+Loads an index written by save, memory mapped with useMmap.
+        """
+
+        return cls.fromBuffer(will_reader.mapFile(fileName, useMmap))
+
+
+def loadStrokeIndex(inputFile, cache=None):
+    """ loadStrokeIndex(inputFile, cache=None)
+Returns the (strokes, index) of the .will file: its StrokeSet (see
+will_reader.decodeWillStrokeSet) and the StrokeIndex of its strokes. With a
+cache, both are stored in it and later calls just map them back, so a large
+notebook can be queried again without decoding it.
+
+inputFile : string with the .will file.
+cache     : will_cache.ConversionCache, or None
+    """
+
+    if cache is None:
+        strokes = will_reader.decodeWillStrokeSet(inputFile)
+        return (strokes, StrokeIndex.fromStrokeSet(strokes))
+
+    # the protobuf is hashed once for both entries
+    from will_cache import hashWillProtobuff
+    protobufHash = hashWillProtobuff(inputFile, will_reader.PATHS_MEMBER)
+    strokes = will_reader.decodeWillStrokeSet(inputFile, cache, protobufHash)
+    cacheKey = cache.key(protobufHash, {'format': 'index', 'version': INDEX_VERSION})
+    entry = cache.get(cacheKey, '.index')
+    if entry is not None:
+        try:
+            return (strokes, StrokeIndex.load(entry[0]))
+        except OSError:
+            # evicted by another process since get
+            cache.miss()
+
+    index = StrokeIndex.fromStrokeSet(strokes)
+    cache.store(cacheKey, lambda f: f.write(index.toBytes()), {'strokes': len(index)}, '.index')
+
+    return (strokes, index)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+IPE output of the strokes.
+
+Writes the documents of the Ipe drawing editor (an XML file with one <page>
+per page and one <path> per stroke) straight from the decoded strokes, instead
+of writing an SVG and converting it with the svgtoipe program. The coordinates
+of the strokes are in mm with y going down, the ones of Ipe in points with y
+going up: every point is scaled by 72/25.4 and flipped, so the page (the
+bounding box of the strokes) starts at the origin. Each path is drawn with the
+width of its stroke. Works without numpy.
+
+@author: ninguem
+"""
+import will_reader
+
+IPE_VERSION = 70218
+
+IPE_HEADER = '<?xml version="1.0"?>\n<!DOCTYPE ipe SYSTEM "ipe.dtd">\n<ipe version="{version}" creator="will2svg">\n'
+
+IPE_FOOTER = '</ipe>\n'
+
+PT_PER_MM = 72/25.4
+
+# number of decimals of the coordinates, in points
+IPE_DECIMALS = 3
+
+
+def ipePathData(arrayX, arrayY, minX, maxY, decimals=IPE_DECIMALS):
+    """ ipePathData(arrayX, arrayY, minX, maxY, decimals=IPE_DECIMALS)
+Returns the content of the Ipe path of a single stroke: a polyline of
+"x y m" and "x y l" lines, in points, with the origin at (minX, maxY).
+
+arrayX   : x coordinates of the stroke
+arrayY   : y coordinates of the stroke
+minX     : x coordinate of the left of the page
+maxY     : y coordinate of the bottom of the page
+decimals : number of decimals of the coordinates
+    """
+
+    lines = [f'{(x - minX)*PT_PER_MM:.{decimals}f} {(maxY - y)*PT_PER_MM:.{decimals}f} l' for x, y in zip(arrayX, arrayY)]
+    lines[0] = lines[0][:-1] + 'm'
+
+    return will_reader.compactNumbers('\n'.join(lines))
+
+
+class IPEWriter:
+    """ IPEWriter(f, boundingBox)
+Incremental Ipe writer: the header is written by the constructor, then the
+pages with startPage, writeStroke and endPage, and close() ends the document.
+All the pages share the paper given by the bounding box, which has to be
+known beforehand since the y axis is flipped (see the module documentation).
+
+f           : text file-like object
+boundingBox : (minX, minY, maxX, maxY) of the strokes of all the pages
+    """
+
+    def __init__(self, f, boundingBox):
+        self.f = f
+        self.minX, self.minY, self.maxX, self.maxY = boundingBox
+        if self.minX > self.maxX:       # no points
+            self.minX = self.minY = self.maxX = self.maxY = 0
+        self.inPage = False
+
+        paper = (f'{will_reader.formatNumber((self.maxX - self.minX)*PT_PER_MM, IPE_DECIMALS)} '
+                 f'{will_reader.formatNumber((self.maxY - self.minY)*PT_PER_MM, IPE_DECIMALS)}')
+        f.write(IPE_HEADER.format(version=IPE_VERSION))
+        f.write(f'<ipestyle name="will2svg">\n<layout paper="{paper}" origin="0 0" frame="{paper}"/>\n</ipestyle>\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.close()
+
+    def startPage(self):
+        """ startPage()
+Starts a new page, ending the current one.
+        """
+
+        self.endPage()
+        self.f.write('<page>\n<layer name="alpha"/>\n')
+        self.inPage = True
+
+    def endPage(self):
+        """ endPage()
+Ends the current page, if any.
+        """
+
+        if self.inPage:
+            self.f.write('</page>\n')
+            self.inPage = False
+
+    def writeStroke(self, arrayX, arrayY, lineWidth=None):
+        """ writeStroke(arrayX, arrayY, lineWidth=None)
+Writes the path of one stroke on the current page (a page is started if
+needed).
+
+arrayX    : x coordinates of the stroke
+arrayY    : y coordinates of the stroke
+lineWidth : linewidth of the stroke in mm, or None for the default pen
+        """
+
+        if len(arrayX) == 0:
+            return
+        if not self.inPage:
+            self.startPage()
+
+        pen = f' pen="{will_reader.formatNumber(lineWidth*PT_PER_MM, IPE_DECIMALS)}"' if lineWidth is not None else ''
+        self.f.write(f'<path layer="alpha" stroke="black"{pen} cap="1" join="1">\n'
+                     f'{ipePathData(arrayX, arrayY, self.minX, self.maxY)}\n</path>\n')
+
+    def close(self):
+        """ close()
+Ends the last page and the document (an empty document gets an empty page).
+It does not close f.
+        """
+
+        if not self.inPage:
+            self.startPage()
+        self.endPage()
+        self.f.write(IPE_FOOTER)
+
+
+def strokesBoundingBox(xData, yData):
+    """ strokesBoundingBox(xData, yData)
+Returns the (minX, minY, maxX, maxY) of the strokes ((inf, inf, -inf, -inf) if
+there is no point).
+
+xData : array with arrays of x coordinates
+yData : array with arrays of y coordinates
+    """
+
+    boxes = [(min(arrayX), min(arrayY), max(arrayX), max(arrayY)) for arrayX, arrayY in zip(xData, yData) if len(arrayX)]
+    if not boxes:
+        return (float('inf'), float('inf'), float('-inf'), float('-inf'))
+
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes), max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+
+def writeIPE(f, xData, yData, lineData, boundingBox=None):
+    """ writeIPE(f, xData, yData, lineData, boundingBox=None)
+Writes the strokes to f as a single page Ipe document.
+
+f           : text file-like object
+xData       : array with arrays of x coordinates
+yData       : array with arrays of y coordinates
+lineData    : array with the linewidths of the strokes
+boundingBox : bounding box of the strokes if it is already known (e.g.
+              StrokeSet.boundingBox), or None
+    """
+
+    if boundingBox is None:
+        boundingBox = strokesBoundingBox(xData, yData)
+
+    with IPEWriter(f, boundingBox) as writer:
+        writer.startPage()
+        for arrayX, arrayY, lineWidth in zip(xData, yData, lineData):
+            writer.writeStroke(arrayX, arrayY, lineWidth)
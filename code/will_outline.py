@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Variable width strokes drawn as filled outlines.
+
+SVG paths have a single stroke-width, so the pressure of the pen is lost when
+a stroke is written as its centerline. Here each stroke becomes the polygon
+around it: every sample is moved by half its width to both sides, along the
+normal of the stroke (from the tangent of the previous to the next sample),
+and the left side, a point at the end, the right side backwards and a point
+at the start are joined and filled. Consecutive duplicate samples are dropped
+first, and a stroke with a single sample becomes a small diamond.
+All the strokes of a batch are outlined together with a few numpy operations,
+there is no loop over the points.
+Requires numpy.
+
+@author: ninguem
+"""
+import numpy as np
+
+import will_reader
+
+# number of decimals of the coordinates of the outlines
+OUTLINE_DECIMALS = 2
+
+
+def outlineStrokes(x, y, widths, offsets):
+    """ outlineStrokes(x, y, widths, offsets)
+Returns (outlineX, outlineY, outlineOffsets): the points of the outline
+polygon of each stroke, concatenated, and the len(strokes)+1 indexes of the
+start of each polygon. A stroke of n distinct samples has a polygon of 2n+2
+points, an empty stroke an empty polygon.
+
+x       : x coordinates of all the points
+y       : y coordinates of all the points
+widths  : width of the stroke at each point, in the units of the coordinates
+offsets : array with len(strokes)+1 indexes of the start of each stroke
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    widths = np.asarray(widths, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    # drop the points equal to the previous one of the same stroke
+    keep = np.ones(len(x), dtype=bool)
+    keep[1:] = (x[1:] != x[:-1]) | (y[1:] != y[:-1])
+    keep[offsets[:-1][offsets[:-1] < len(x)]] = True
+    offsets = np.concatenate(([0], np.cumsum(keep)))[offsets]
+    x, y, widths = x[keep], y[keep], widths[keep]
+
+    counts = np.diff(offsets)
+    stroke = np.repeat(np.arange(len(counts)), counts)
+    index = np.arange(len(x))
+    previous = np.maximum(index - 1, offsets[:-1][stroke])
+    following = np.minimum(index + 1, offsets[1:][stroke] - 1)
+
+    # unit tangents, (1, 0) for the strokes of a single point
+    tx = x[following] - x[previous]
+    ty = y[following] - y[previous]
+    length = np.hypot(tx, ty)
+    single = length == 0
+    length[single] = 1
+    tx = np.where(single, 1.0, tx/length)
+    ty = np.where(single, 0.0, ty/length)
+
+    halfWidths = 0.5*widths
+    leftX, leftY = x - ty*halfWidths, y + tx*halfWidths
+    rightX, rightY = x + ty*halfWidths, y - tx*halfWidths
+
+    # caps: half a width ahead of the last point and behind the first one
+    nonEmpty = counts > 0
+    firsts, lasts = offsets[:-1][nonEmpty], offsets[1:][nonEmpty] - 1
+    endX, endY = x[lasts] + tx[lasts]*halfWidths[lasts], y[lasts] + ty[lasts]*halfWidths[lasts]
+    startX, startY = x[firsts] - tx[firsts]*halfWidths[firsts], y[firsts] - ty[firsts]*halfWidths[firsts]
+
+    # position of every point in the polygons: left side, end cap, right side
+    # backwards, start cap
+    outlineOffsets = np.concatenate(([0], np.cumsum(np.where(nonEmpty, 2*counts + 2, 0))))
+    base = outlineOffsets[:-1][stroke]
+    local = index - offsets[:-1][stroke]
+    numPoints = outlineOffsets[-1]
+    outlineX = np.empty(numPoints)
+    outlineY = np.empty(numPoints)
+    outlineX[base + local], outlineY[base + local] = leftX, leftY
+    outlineX[base + 2*counts[stroke] - local], outlineY[base + 2*counts[stroke] - local] = rightX, rightY
+    strokeBase = outlineOffsets[:-1][nonEmpty]
+    outlineX[strokeBase + counts[nonEmpty]], outlineY[strokeBase + counts[nonEmpty]] = endX, endY
+    outlineX[strokeBase + 2*counts[nonEmpty] + 1], outlineY[strokeBase + 2*counts[nonEmpty] + 1] = startX, startY
+
+    return (outlineX, outlineY, outlineOffsets)
+
+
+def outlinePathData(strokes, decimals=OUTLINE_DECIMALS, relative=False):
+    """ outlinePathData(strokes, decimals=OUTLINE_DECIMALS, relative=False)
+Returns the list of the d attributes of the closed SVG paths of the outlines
+of the strokes (see outlineStrokes), all computed together, to be filled.
+Empty strokes give an empty string.
+
+strokes  : sequence of (x, y, widths) tuples, widths being the width at each
+           point in the units of the coordinates (or a single width for the
+           whole stroke)
+decimals : number of decimals of the coordinates
+relative : use relative commands
+    """
+
+    if not strokes:
+        return []
+    offsets = np.zeros(len(strokes)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(strokeX) for strokeX, strokeY, strokeWidths in strokes])
+    x = np.concatenate([np.asarray(strokeX, dtype=np.float64) for strokeX, strokeY, strokeWidths in strokes])
+    y = np.concatenate([np.asarray(strokeY, dtype=np.float64) for strokeX, strokeY, strokeWidths in strokes])
+    widths = np.concatenate([np.broadcast_to(np.asarray(strokeWidths, dtype=np.float64), len(strokeX))
+                             for strokeX, strokeY, strokeWidths in strokes])
+
+    outlineX, outlineY, outlineOffsets = outlineStrokes(x, y, widths, offsets)
+    # rounded first, so the offsets of the relative commands are exact
+    outlineX = np.round(outlineX, decimals).tolist()
+    outlineY = np.round(outlineY, decimals).tolist()
+
+    return [will_reader.compactPathData(outlineX[start:stop], outlineY[start:stop], decimals, poly=True, relative=relative) + 'Z' if start < stop else ''
+            for start, stop in zip(outlineOffsets[:-1].tolist(), outlineOffsets[1:].tolist())]
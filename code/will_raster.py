@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Direct raster output (PNG) of Wacom WILL files.
+
+The decoded strokes are drawn straight into a grayscale pixel buffer at the
+requested resolution, without writing an SVG and rendering it again. Each
+stroke is drawn as its outline polygon (see will_outline), following the pen
+pressure with the outline option or with the mean width of the stroke
+otherwise. With pycairo the polygons are filled by cairo; without it by a
+numpy scanline rasterizer: the crossings of the polygon edges with a few
+sub-scanlines per pixel row are computed together, a band of rows at a time,
+the spans inside each polygon (nonzero rule) are accumulated in a coverage
+buffer with their exact horizontal coverage, and the sub-scanlines are
+averaged, which gives antialiased edges. The PNG is written with zlib from the standard library.
+Every sections/media/*.protobuf member of a .will file is a page, and the
+pages of all the files are rendered in a pool of worker processes.
+Requires numpy.
+
+@author: ninguem
+"""
+from concurrent.futures import ProcessPoolExecutor
+from zipfile import ZipFile
+import os
+import sys
+import time
+import struct
+import zlib
+import argparse
+
+import numpy as np
+
+try:
+    import cairo
+except ImportError:     # the numpy rasterizer is used instead
+    cairo = None
+
+import will_reader
+from will_outline import outlineStrokes
+from will_index import expandRanges
+
+# default resolution, in pixels per inch (the coordinates are in mm)
+RASTER_DPI = 96.0
+
+MM_PER_INCH = 25.4
+
+# margin around the strokes, in pixels
+RASTER_MARGIN = 2
+
+# sub-scanlines per pixel row of the numpy rasterizer
+SUBSCANLINES = 4
+
+# pixel rows rasterized at a time by the numpy rasterizer (bounds the memory
+# of the coverage buffer)
+BAND_ROWS = 256
+
+# crossings of the edges with the sub-scanlines computed at a time by the numpy
+# rasterizer, the bands are made smaller when they would have more (bounds the
+# memory of the crossings, whatever the amount of ink of the page)
+BAND_CROSSINGS = 1 << 19
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+PNG_COMPRESSION = 6
+
+
+def pageTransform(boundingBox, dpi=RASTER_DPI, maxSize=None):
+    """ pageTransform(boundingBox, dpi=RASTER_DPI, maxSize=None)
+Returns (scale, offsetX, offsetY, width, height): the pixel coordinates of a
+point are (x*scale + offsetX, y*scale + offsetY), and the image of the
+bounding box, with a margin of RASTER_MARGIN pixels, is width x height pixels.
+
+boundingBox : (minX, minY, maxX, maxY) of the drawing
+dpi         : resolution in pixels per inch
+maxSize     : maximum width and height of the image in pixels (the
+              resolution is lowered to fit it), or None
+    """
+
+    minX, minY, maxX, maxY = boundingBox
+    if minX > maxX:             # no points
+        minX = minY = maxX = maxY = 0.0
+    scale = dpi/MM_PER_INCH
+    if maxSize is not None:
+        scale = min(scale, (maxSize - 2*RASTER_MARGIN)/max(maxX - minX, maxY - minY, 1e-6))
+    width = int(np.ceil((maxX - minX)*scale)) + 2*RASTER_MARGIN
+    height = int(np.ceil((maxY - minY)*scale)) + 2*RASTER_MARGIN
+
+    return (scale, RASTER_MARGIN - minX*scale, RASTER_MARGIN - minY*scale, width, height)
+
+
+def strokeOutlines(strokes, outline=False):
+    """ strokeOutlines(strokes, outline=False)
+Returns the (outlineX, outlineY, outlineOffsets) of the polygons of the
+strokes of a will_reader.StrokeSet (see will_outline.outlineStrokes), in
+document units.
+
+strokes : will_reader.StrokeSet
+outline : follow the width of each point instead of the mean width of the
+          stroke
+    """
+
+    if outline:
+        widths = strokes.width*will_reader.STROKE_WIDTH_SCALE
+    else:
+        widths = np.repeat(strokes.lineWidths(), np.diff(strokes.offsets))
+
+    return outlineStrokes(strokes.x, strokes.y, widths, strokes.offsets)
+
+
+def rasterizePolygonsNumpy(polygonX, polygonY, polygonOffsets, width, height):
+    """ rasterizePolygonsNumpy(polygonX, polygonY, polygonOffsets, width, height)
+Returns the float32 (height, width) array of the coverage of the pixels by the
+union of the polygons (each one filled with the nonzero rule), between 0 and
+1. See the module documentation.
+
+polygonX, polygonY : pixel coordinates of the points of all the polygons
+polygonOffsets     : array with len(polygons)+1 indexes of the start of each
+                     polygon
+width, height      : size of the image
+    """
+
+    coverage = np.zeros((height, width), dtype=np.float32)
+    counts = np.diff(polygonOffsets)
+    if not len(polygonX):
+        return coverage
+
+    # edges from every point to the next one of its polygon, the last point
+    # to the first
+    ends = np.arange(1, len(polygonX) + 1)
+    ends[polygonOffsets[1:][counts > 0] - 1] = polygonOffsets[:-1][counts > 0]
+    x0, x1 = polygonX, polygonX[ends]
+    y0, y1 = polygonY*SUBSCANLINES, polygonY[ends]*SUBSCANLINES
+    del ends
+
+    # rows of the crossings of the edges with the sub-scanlines k (at
+    # y = k + 0.5), the edges are half open so a vertex is crossed once
+    numRows = height*SUBSCANLINES
+    firstRows = np.clip(np.ceil(np.minimum(y0, y1) - 0.5), 0, numRows).astype(np.int64)
+    lastRows = np.clip(np.ceil(np.maximum(y0, y1) - 0.5), 0, numRows).astype(np.int64)
+
+    # the crossings are only computed for the edges of one band of rows at a
+    # time, the bands ending every BAND_ROWS pixel rows and where the count of
+    # crossings passes a multiple of BAND_CROSSINGS, so the memory does not
+    # grow with the ink of the page
+    rowCrossings = np.cumsum(np.bincount(firstRows, minlength=numRows + 1) - np.bincount(lastRows, minlength=numRows + 1))[:numRows]
+    crossingsBefore = np.cumsum(rowCrossings.reshape(height, SUBSCANLINES).sum(axis=1)) // BAND_CROSSINGS
+    bandStarts = np.union1d(np.arange(0, height, BAND_ROWS), np.flatnonzero(np.diff(crossingsBefore)) + 1)*SUBSCANLINES
+    for bandStart, bandEnd in zip(bandStarts.tolist(), np.append(bandStarts[1:], numRows).tolist()):
+        bandEdges = np.flatnonzero((firstRows < bandEnd) & (lastRows > bandStart))
+        if not len(bandEdges):
+            continue
+        bandFirstRows = np.maximum(firstRows[bandEdges], bandStart)
+        rows, edges = expandRanges(bandFirstRows, np.minimum(lastRows[bandEdges], bandEnd) - bandFirstRows)
+        edges = bandEdges[edges]
+        edgeX0, edgeY0 = x0[edges], y0[edges]
+        crossX = edgeX0 + (rows + 0.5 - edgeY0)*(x1[edges] - edgeX0)/(y1[edges] - edgeY0)
+        directions = np.where(y1[edges] > edgeY0, 1, -1)
+
+        # sorted by polygon, row and x, the winding number after each
+        # crossing; it is back to 0 at the end of every (polygon, row), so a
+        # plain cumsum does it
+        polygon = np.searchsorted(polygonOffsets, edges, side='right') - 1
+        groups = polygon*(bandEnd - bandStart) + (rows - bandStart)
+        order = np.lexsort((crossX, groups))
+        rows, crossX, directions = rows[order], crossX[order], directions[order]
+        winding = np.cumsum(directions)
+        spanStarts = (winding != 0) & (winding == directions)
+        spanEnds = (winding == 0)
+        spanRows = rows[spanStarts] - bandStart
+        spanX0 = np.clip(crossX[spanStarts], 0, width)
+        spanX1 = np.clip(crossX[spanEnds], 0, width)
+
+        # each span adds a step at its start and removes it at its end; a step
+        # at x covers the pixel floor(x) by floor(x) + 1 - x and the next ones
+        # fully, so it is two entries of the difference array of the coverage
+        stepX = np.concatenate((spanX0, spanX1))
+        signs = np.concatenate((np.ones(len(spanX0)), -np.ones(len(spanX1))))
+        columns = np.floor(stepX).astype(np.int64)
+        fractions = stepX - columns
+        cells = np.concatenate((spanRows, spanRows))*(width + 2) + columns
+        bandRows = bandEnd - bandStart
+        differences = np.bincount(cells, signs*(1 - fractions), bandRows*(width + 2))
+        differences += np.bincount(cells + 1, signs*fractions, bandRows*(width + 2))
+        subCoverage = np.cumsum(differences.reshape(bandRows, width + 2)[:, :width], axis=1, dtype=np.float32)
+        np.clip(subCoverage, 0, 1, out=subCoverage)
+        pixelRow = bandStart//SUBSCANLINES
+        coverage[pixelRow:pixelRow + bandRows//SUBSCANLINES] = subCoverage.reshape(-1, SUBSCANLINES, width).mean(axis=1)
+
+    return coverage
+
+
+def rasterizePolygonsCairo(polygonX, polygonY, polygonOffsets, width, height):
+    """ rasterizePolygonsCairo(polygonX, polygonY, polygonOffsets, width, height)
+Same as rasterizePolygonsNumpy, drawn with pycairo.
+    """
+
+    surface = cairo.ImageSurface(cairo.FORMAT_A8, width, height)
+    context = cairo.Context(surface)
+    context.set_source_rgba(0, 0, 0, 1)
+    context.set_fill_rule(cairo.FILL_RULE_WINDING)
+    polygonX, polygonY = polygonX.tolist(), polygonY.tolist()
+    for start, stop in zip(polygonOffsets[:-1].tolist(), polygonOffsets[1:].tolist()):
+        if start == stop:
+            continue
+        # filled one by one, so overlapping polygons add up as a union
+        context.move_to(polygonX[start], polygonY[start])
+        for i in range(start + 1, stop):
+            context.line_to(polygonX[i], polygonY[i])
+        context.close_path()
+        context.fill()
+    surface.flush()
+
+    alpha = np.frombuffer(surface.get_data(), dtype=np.uint8).reshape(height, surface.get_stride())[:, :width]
+
+    return alpha.astype(np.float32)/255
+
+
+def rasterizeStrokes(strokes, dpi=RASTER_DPI, maxSize=None, outline=False, backend=None):
+    """ rasterizeStrokes(strokes, dpi=RASTER_DPI, maxSize=None, outline=False, backend=None)
+Returns the uint8 (height, width) grayscale image (black strokes on white) of
+the bounding box of the strokes.
+
+strokes : will_reader.StrokeSet
+dpi     : resolution in pixels per inch
+maxSize : maximum width and height of the image in pixels, or None
+outline : follow the pen pressure (see strokeOutlines)
+backend : 'cairo' or 'numpy' (default: cairo if pycairo is installed)
+    """
+
+    if backend is None:
+        backend = 'numpy' if cairo is None else 'cairo'
+    if backend == 'cairo' and cairo is None:
+        raise ImportError('pycairo is not installed, use the numpy backend.')
+
+    with will_reader.stageTimer('outline'):
+        outlineX, outlineY, outlineOffsets = strokeOutlines(strokes, outline)
+    if len(outlineX):
+        boundingBox = (outlineX.min(), outlineY.min(), outlineX.max(), outlineY.max())
+    else:
+        boundingBox = strokes.boundingBox()
+    scale, offsetX, offsetY, width, height = pageTransform(boundingBox, dpi, maxSize)
+
+    rasterizePolygons = rasterizePolygonsCairo if backend == 'cairo' else rasterizePolygonsNumpy
+    with will_reader.stageTimer('raster'):
+        coverage = rasterizePolygons(outlineX*scale + offsetX, outlineY*scale + offsetY, outlineOffsets, width, height)
+
+    return np.round(255*(1 - coverage)).astype(np.uint8)
+
+
+def encodePNG(pixels, compression=PNG_COMPRESSION):
+    """ encodePNG(pixels, compression=PNG_COMPRESSION)
+Returns the bytes of the 8 bit grayscale PNG of the image.
+
+pixels      : uint8 (height, width) array
+compression : zlib compression level
+    """
+
+    height, width = pixels.shape
+
+    def chunk(chunkType, data):
+        return struct.pack('>I', len(data)) + chunkType + data + struct.pack('>I', zlib.crc32(chunkType + data))
+
+    # every row starts with its filter type, 0 (none)
+    rows = np.zeros((height, width + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels
+
+    return (PNG_SIGNATURE
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows.tobytes(), compression))
+            + chunk(b'IEND', b''))
+
+
+def writePNG(fileName, pixels):
+    """ writePNG(fileName, pixels)
+Writes the image to a grayscale PNG file (see encodePNG).
+    """
+
+    with open(fileName, 'wb') as f:
+        f.write(encodePNG(pixels))
+
+
+def pageFiles(inputFile, outputDir=None):
+    """ pageFiles(inputFile, outputDir=None)
+Returns the list of (member, pngFile) of the pages of the .will file: file.png
+for a single page, file_00.png, file_01.png... otherwise, in the order of
+will_reader.listWillProtobuffs.
+
+inputFile : string with the .will file.
+outputDir : directory of the images (default: the one of inputFile)
+    """
+
+    base = os.path.splitext(inputFile)[0]
+    if outputDir is not None:
+        base = os.path.join(outputDir, os.path.basename(base))
+    members = will_reader.listWillProtobuffs(inputFile)
+    if len(members) == 1:
+        return [(members[0], base + '.png')]
+
+    return [(member, f'{base}_{str(n).zfill(2)}.png') for n, member in enumerate(members)]
+
+
+def rasterizePage(inputFile, member, outputFile, dpi=RASTER_DPI, maxSize=None, outline=False, backend=None):
+    """ rasterizePage(inputFile, member, outputFile, dpi=RASTER_DPI, maxSize=None, outline=False, backend=None)
+Worker function: renders one page of a .will file to a PNG file and returns a
+tuple (inputFile, member, error, numStrokes, width, height, seconds), where
+error is None on success or the error message otherwise. It never raises, so
+one bad page does not stop the batch.
+
+inputFile  : string with the .will file.
+member     : protobuf member of the page
+outputFile : string with the .png file
+dpi, maxSize, outline, backend : see rasterizeStrokes
+    """
+
+    startTime = time.perf_counter()
+    try:
+        with ZipFile(inputFile) as input_zip:
+            buffer = input_zip.read(member)
+        strokes = will_reader.decodeStrokeSet(buffer)
+        pixels = rasterizeStrokes(strokes, dpi, maxSize, outline, backend)
+        writePNG(outputFile, pixels)
+        height, width = pixels.shape
+        error = None
+    except Exception as e:
+        strokes = ()
+        width = height = 0
+        error = f'{type(e).__name__}: {e}'
+
+    return (inputFile, member, error, len(strokes), width, height, time.perf_counter() - startTime)
+
+
+def rasterizeFiles(files, dpi=RASTER_DPI, maxSize=None, outline=False, backend=None, jobs=None, outputDir=None, out=sys.stdout):
+    """ rasterizeFiles(files, dpi=RASTER_DPI, maxSize=None, outline=False, backend=None, jobs=None, outputDir=None, out=sys.stdout)
+Renders every page of the files to PNG in a ProcessPoolExecutor, one page per
+task, printing one line per page (in input order) and a final summary to out.
+Returns the number of failures.
+
+files     : list of .will files
+dpi, maxSize, outline, backend : see rasterizeStrokes
+jobs      : number of worker processes (default: number of CPUs, 1 runs in
+            this process)
+outputDir : directory of the images (default: next to each file)
+out       : text file-like object for the report
+    """
+
+    startTime = time.perf_counter()
+
+    tasks = []
+    numFailed = 0
+    for inputFile in files:
+        try:
+            tasks.extend((inputFile, member, outputFile) for member, outputFile in pageFiles(inputFile, outputDir))
+        except Exception as e:
+            print(f'FAILED {inputFile}: {type(e).__name__}: {e}', file=out)
+            numFailed += 1
+    inputFiles, members, outputFiles = zip(*tasks) if tasks else ((), (), ())
+    options = [[value]*len(tasks) for value in (dpi, maxSize, outline, backend)]
+
+    if jobs == 1:
+        results = map(rasterizePage, inputFiles, members, outputFiles, *options)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        results = executor.map(rasterizePage, inputFiles, members, outputFiles, *options)
+
+    try:
+        for (inputFile, member, error, numStrokes, width, height, seconds), outputFile in zip(results, outputFiles):
+            if error is None:
+                print(f'OK     {outputFile}: {numStrokes} strokes, {width}x{height} pixels, {seconds*1000:.1f} ms', file=out)
+            else:
+                print(f'FAILED {inputFile} ({member}): {error}', file=out)
+                numFailed += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - startTime
+    print(f'{len(tasks)} pages of {len(files)} files ({numFailed} failed) in {elapsed:.2f} s: '
+          f'{len(tasks)/elapsed if elapsed > 0 else 0:.1f} pages/s', file=out)
+
+    return numFailed
+
+
+if __name__=='__main__':
+
+    from will_batch import findWillFiles
+
+    parser = argparse.ArgumentParser(description='Render Wacom WILL files to PNG images.\n\nEach page of file.will is written to file.png (file_00.png, file_01.png... for\nseveral pages), which is overwritten without warning.\nWith no inputs (or -), the list of files is read from stdin, one per line.',formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-d', '--dpi', type=float, default=RASTER_DPI, help=f'resolution in pixels per inch (default: {RASTER_DPI:g})')
+    parser.add_argument('--size', type=int, default=None, help='maximum width and height of the images in pixels (thumbnails)')
+    parser.add_argument('-o', '--outline', action='store_true', default=False, help='follow the pen pressure instead of the mean width of each stroke')
+    parser.add_argument('--backend', choices=('cairo', 'numpy'), default=None, help='rasterizer (default: cairo if pycairo is installed)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-R', '--recursive', action='store_true', default=False, help='look for .will files in subdirectories')
+    parser.add_argument('--output-dir', default=None, help='directory of the images (default: next to the .will files)')
+    parser.add_argument(dest='inputs', nargs='*', help='.will files, directories or glob patterns')
+
+    args = parser.parse_args()
+
+    inputs = [name for name in args.inputs if name != '-']
+    if not args.inputs or '-' in args.inputs:
+        inputs.extend(line.strip() for line in sys.stdin if line.strip())
+
+    files = findWillFiles(inputs, args.recursive)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    sys.exit(1 if rasterizeFiles(files, args.dpi, args.size, args.outline, args.backend, args.jobs, args.output_dir) else 0)
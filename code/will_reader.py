@@ -5,21 +5,98 @@ Created on Fri Aug 10 11:09:11 2018
 
 @author: ninguem
 """
-from matplotlib import pyplot as plt
-from zipfile import ZipFile
-from google.protobuf.internal.decoder import _DecodeVarint32
-from google.protobuf.internal.decoder import wire_format
-from google.protobuf.internal.decoder import struct
+from zipfile import ZipFile, ZIP_STORED
+from will_wire import decodeVarint, decodeVarint32, decodeFloat, decodeLengthDelimited, decodePackedVarints, unpackTag, skipField
+from will_wire import WIRETYPE_VARINT, WIRETYPE_FIXED32, WIRETYPE_LENGTH_DELIMITED
 import os
 import sys
+import io
+import errno
+import fnmatch
+import mmap
+import struct
+import contextlib
+import hashlib
+import re
+import json
+import itertools
 import argparse
 
+# numpy, imported on first use by importNumpy: importing it takes most of the
+# startup time, so the conversion of small documents does without it (see
+# NUMPY_DECODE_BYTES)
+np = None
+
 VERBOSE = False
 
+# will_stats.Stats instance collecting counters and stage timings, None when
+# the instrumentation is disabled (see enableStats)
+STATS = None
+
+NULL_TIMER = contextlib.nullcontext()
+
 # General purpose functions
 #
 
 
+def importNumpy():
+    """ importNumpy()
+Imports numpy the first time it is needed and returns it, or None when it is
+not installed (the pure python decoders are used instead). Every function that
+uses the vectorized paths calls it first.
+    """
+
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        np = numpy
+
+    return np
+
+
+def missingNumpy(options):
+    """ missingNumpy(options)
+Returns the name of the first option used that needs numpy if numpy is not
+installed, or None. numpy is only imported if one of the options is used, so
+the command line tools can refuse them with a clear message before converting.
+
+options : sequence of (name, used) of the options that need numpy
+    """
+
+    for name, used in options:
+        if used and importNumpy() is None:
+            return name
+
+    return None
+
+
+def enableStats():
+    """ enableStats()
+Turns on the instrumentation and returns the will_stats.Stats object that
+collects the counters and stage timings.
+    """
+
+    global STATS
+    import will_stats
+    STATS = will_stats.Stats()
+
+    return STATS
+
+
+def stageTimer(name):
+    """ stageTimer(name)
+Returns the context manager that times the stage name, or a shared no-op one
+when the instrumentation is disabled.
+
+name : name of the stage
+    """
+
+    return NULL_TIMER if STATS is None else STATS.timer(name)
+
+
 def debugPrint(str=''):
     """ debugPrint
 It is simply a wrapper to print that you can turn on or off in order to debug
@@ -46,62 +123,471 @@ factor : factor to be used to divide the array (just to facilitate the specific
     return [v/factor for v in res[1:]]
 
 
-def plotXYLineData(xData, yData, lineData):
-    """ plotXYLineData(xData, yData, lineData)
+def plotXYLineData(xData, yData, lineData, fileName=None, show=False):
+    """ plotXYLineData(xData, yData, lineData, fileName=None, show=False)
 Plots the object in the array of arrays xData, yData and lineData 
+matplotlib is only imported when this function is called, so the conversion
+itself does not pay for it.
 
 xData    : array with arrays of x coordinates
 yData    : array with arrays of y coordinates
 lineData : array with arrays of lineWhidths
+fileName : if given, the figure is saved to this file (any format supported
+           by matplotlib, e.g. .png or .pdf)
+show     : if True, shows the figure in a window
     """
 
+    import matplotlib
+    if fileName is not None and not show:
+        matplotlib.use('Agg')       # no GUI backend needed just to save
+    from matplotlib import pyplot as plt
+
     for x, y, lineWidth in zip(xData, yData, lineData):
-        plt.plot(x,[-y for y in y],'k', linewidth=(lineWidth**5)/20)
+        plt.plot(x, np.negative(y) if importNumpy() is not None else [-y for y in y], 'k', linewidth=(lineWidth**5)/20)
     
     plt.axis('equal')
 
+    if fileName is not None:
+        plt.savefig(fileName)
+    if show:
+        plt.show()
+
+
+SVG_HEADER = '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{width}mm" height="{height}mm" viewBox="{minX} {minY} {width} {height}">'
+
+# room reserved for the header, so it can be patched in once the bounding box
+# is known
+SVG_HEADER_SIZE = 320
+
+SVG_FOOTER = '</svg>'
+
+# number of strokes fitted (see will_fit) or outlined (see will_outline)
+# together in the fit and outline modes of SVGWriter
+BATCH_SIZE = 256
+
+# number of decimals of the numbers of the header
+HEADER_DECIMALS = 4
+
+# number of strokes decoded together by decodeMessages
+DECODE_BATCH_SIZE = 256
+
+# size of the messages decodeMessages decodes in python before importing numpy
+# for the vectorized decoder (about what the import costs in decoding time),
+# unless numpy is already imported
+NUMPY_DECODE_BYTES = 256*1024
+
+# trailing zeros (and the point if nothing is left after it) of numbers
+# formatted with %.nf, and their leading zero
+TRAILING_ZEROS = re.compile(r'(\.\d*?[1-9])0+(?!\d)|\.0+(?!\d)')
+LEADING_ZERO = re.compile(r'(?<![\d.])0(?=\.)')
+
+
+def compactNumbers(text):
+    """ compactNumbers(text)
+Returns text with the numbers formatted with %.nf written with as few
+characters as possible: 1.50 -> 1.5, 2.00 -> 2, 0.25 -> .25, -0.25 -> -.25.
+    """
+
+    return LEADING_ZERO.sub('', TRAILING_ZEROS.sub(r'\1', text))
+
 
-def XYLineDataToSVG(xData, yData, lineData, poly=False):
+# replacements that shorten the numbers of the paths written by compactPathData
+# (see numberReplacements), by (precision, relative)
+NUMBER_REPLACEMENTS = {}
+
+
+def numberReplacements(precision, relative=False):
+    """ numberReplacements(precision, relative=False)
+Returns the list of (old, new) str.replace arguments that remove the trailing
+zeros (2.50 -> 2.5, 2.00 -> 2) and the leading zeros (0.25 -> .25,
+-0.25 -> -.25) of the numbers formatted with %.nf, n being precision, in the
+paths written by compactPathData (the trailing zeros of the last number are
+left to the caller). A few dozen plain replacements of the whole path are
+faster than a regular expression or a test per number.
+
+precision : number of decimals of the numbers
+relative  : the path uses relative commands
+    """
+
+    replacements = NUMBER_REPLACEMENTS.get((precision, relative))
+    if replacements is None:
+        replacements = []
+        if precision > 0:
+            commands = 'mlc' if relative else 'MLC'
+            separators = ' ,' + commands[1]
+            # a zero between a digit and a separator is a decimal, and the
+            # first decimal is never removed by these
+            for _ in range(precision - 1):
+                replacements += [(digit + '0' + sep, digit + sep) for sep in separators for digit in '0123456789']
+            replacements += [('.0' + sep, sep) for sep in separators]
+            replacements += [(prefix + '0.', prefix + '.') for prefix in ' ,-' + commands]
+        replacements = NUMBER_REPLACEMENTS[(precision, relative)] = replacements
+
+    return replacements
+
+
+def formatNumber(value, decimals):
+    """ formatNumber(value, decimals)
+Returns value rounded to decimals, written with as few characters as possible.
+    """
+
+    return compactNumbers(f'%.{decimals}f' % value)
+
+
+def strokePathData(arrayX, arrayY, poly=False):
+    """ strokePathData(arrayX, arrayY, poly=False)
+Returns the content of the d attribute of the SVG path of a single stroke.
+
+arrayX : x coordinates of the stroke
+arrayY : y coordinates of the stroke
+poly   : if True generates a polygonal path, otherwise the points are
+         interpreted as Bezier control points (first and odd last points are
+         ignored)
+    """
+
+    if poly:
+        return f'M{arrayX[0]},{arrayY[0]}  L' + ','.join([f'{x} {y}' for x, y in zip(arrayX, arrayY)])
+
+    # every third point starts a new C command
+    numPoints = len(arrayX) - len(arrayX)%3
+    separators = [' ' if idx == 1 else (' C' if idx%3 == 0 else ',') for idx in range(1, numPoints)]
+
+    return f'M{arrayX[0]},{arrayY[0]}' + ''.join([f'{sep}{x} {y}' for sep, x, y in zip(separators, arrayX[1:numPoints], arrayY[1:numPoints])])
+
+
+def compactPathData(arrayX, arrayY, precision, poly=False, relative=False):
+    """ compactPathData(arrayX, arrayY, precision, poly=False, relative=False)
+Same as strokePathData, but the coordinates are written with the decimal
+precision of the stroke (its decimalPrecision field), so no binary float noise
+is written, and without trailing and leading zeros (see numberReplacements). The repeated first point of the polygonal paths is
+dropped and the whole path is formatted with a single % operation. With
+relative, the l and c commands use the offsets from the previous point, which
+are the deltas stored in the WILL file and are usually much shorter.
+
+arrayX    : x coordinates of the stroke
+arrayY    : y coordinates of the stroke
+precision : number of decimals of the coordinates
+poly      : if True generates a polygonal path, otherwise the points are
+            interpreted as Bezier control points as in strokePathData
+relative  : use relative commands
+    """
+
+    numberFormat = f'%.{precision}f'
+    pair = f'{numberFormat} {numberFormat}'
+    numPoints = len(arrayX) if poly else max(len(arrayX) - len(arrayX)%3, 1)
+
+    values = [0.0]*(2*numPoints)
+    values[0], values[1] = arrayX[0], arrayY[0]
+    if relative:
+        # the differences of the coordinates are written rounded to the
+        # precision, which is exact since the coordinates are
+        if poly:
+            values[2::2] = [b - a for a, b in zip(arrayX, arrayX[1:numPoints])]
+            values[3::2] = [b - a for a, b in zip(arrayY, arrayY[1:numPoints])]
+        else:
+            # the control points of each c command are relative to its start point
+            starts = [0, 1] + [3*(idx//3) - 1 for idx in range(3, numPoints)]
+            values[2::2] = [arrayX[idx] - arrayX[start] for idx, start in zip(range(1, numPoints), starts)]
+            values[3::2] = [arrayY[idx] - arrayY[start] for idx, start in zip(range(1, numPoints), starts)]
+        move, line, curve = 'm', 'l', ' c'
+    else:
+        values[0::2] = arrayX[:numPoints]
+        values[1::2] = arrayY[:numPoints]
+        move, line, curve = 'M', 'L', ' C'
+
+    template = f'{move}{numberFormat},{numberFormat}'
+    if poly:
+        if numPoints > 1:
+            template += line + ' '.join([pair]*(numPoints - 1))
+    elif numPoints > 1:
+        template += f' {pair},{pair}' + f'{curve}{pair},{pair},{pair}'*(numPoints//3 - 1)
+
+    pathData = template % tuple(values)
+    if precision > 0:
+        pathData = pathData.rstrip('0').rstrip('.')
+    for old, new in numberReplacements(precision, relative):
+        pathData = pathData.replace(old, new)
+
+    return pathData
+
+
+class SVGWriter:
+    """ SVGWriter(f, poly=False, fit=None, relative=False, boundingBox=None, outline=False)
+Incremental SVG writer. Each stroke is written to the file-like object f as
+soon as writeStroke is called, so the cost per point is constant and the memory
+does not grow with the document. The bounding box is accumulated in the same
+pass: on seekable outputs a blank header is reserved and patched in by close(),
+on other outputs the paths are kept until close() writes the header. When the
+bounding box is already known (e.g. StrokeSet.boundingBox), the header is
+written right away and the strokes are not scanned for it.
+In fit mode the strokes are fitted with cubic Bezier curves (see will_fit),
+BATCH_SIZE strokes at a time, and written by batch. In outline mode each
+stroke is written as the filled polygon around it, following the width of the
+stroke at each point (see will_outline), also by batch.
+The coordinates of the strokes given with their decimal precision are written
+at that precision (see compactPathData, and the control points of the fitted
+curves as well), the others as in strokePathData.
+
+f           : text file-like object
+poly        : create polygonal paths instead of Bezier curves
+fit         : tolerance of the fit mode, or None (the poly option is then
+              ignored)
+relative    : use relative path commands for the strokes given with their
+              precision and in fit mode
+boundingBox : (minX, minY, maxX, maxY) of all the strokes that will be
+              written, or None
+outline     : write the strokes as filled outlines (the poly and fit options
+              are then ignored)
+The outline and fit modes require numpy (ImportError otherwise).
+    """
+
+    def __init__(self, f, poly=False, fit=None, relative=False, boundingBox=None, outline=False):
+        mode = missingNumpy([('The outline mode', outline), ('The fit mode', fit is not None)])
+        if mode is not None:
+            raise ImportError(f'{mode} of SVGWriter requires numpy, which is not installed.')
+
+        self.f = f
+        self.poly = poly
+        self.fit = fit
+        self.relative = relative
+        self.outline = outline
+        self.batchStrokes = []
+        self.fixedBox = boundingBox is not None
+        if self.fixedBox:
+            self.minX, self.minY, self.maxX, self.maxY = boundingBox
+        else:
+            self.minX = self.minY = float('inf')
+            self.maxX = self.maxY = float('-inf')
+
+        try:
+            self.seekable = f.seekable()
+        except (AttributeError, OSError):
+            self.seekable = False
+
+        if self.fixedBox:
+            # the header is final, nothing to patch or keep (it is padded all
+            # the same, so the document does not depend on the output)
+            f.write(self.header())
+        elif self.seekable:
+            self.headerPos = f.tell()
+            f.write(' '*SVG_HEADER_SIZE)
+        else:
+            self.paths = []
+
+    @classmethod
+    def resume(cls, f, boundingBox, poly=False, fit=None, relative=False, outline=False):
+        """ SVGWriter.resume(f, boundingBox, poly=False, fit=None, relative=False, outline=False)
+Returns a writer that appends strokes to a document previously written by an
+SVGWriter to the seekable file f (opened in 'r+' mode). The closing tag is
+removed, and close() patches the header with the union of boundingBox and the
+new strokes.
+
+f           : text file opened in 'r+' mode, with the document at position 0
+boundingBox : (minX, minY, maxX, maxY) of the strokes already in the document,
+              as returned by boundingBox()
+poly        : create polygonal paths instead of Bezier curves
+fit         : tolerance of the fit mode, or None
+relative    : use relative path commands
+outline     : write the strokes as filled outlines
+        """
+
+        writer = cls.__new__(cls)
+        writer.f = f
+        writer.poly = poly
+        writer.fit = fit
+        writer.relative = relative
+        writer.outline = outline
+        writer.batchStrokes = []
+        writer.fixedBox = False
+        writer.minX, writer.minY, writer.maxX, writer.maxY = boundingBox
+        writer.seekable = True
+        writer.headerPos = 0
+
+        endPos = f.seek(0, io.SEEK_END)
+        f.seek(endPos - len(SVG_FOOTER))
+        if f.read() != SVG_FOOTER:
+            raise ValueError('The document does not end with the closing svg tag.')
+        f.seek(endPos - len(SVG_FOOTER))
+        f.truncate()
+
+        return writer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.close()
+
+    def boundingBox(self):
+        """ boundingBox()
+Returns the (minX, minY, maxX, maxY) of the strokes written so far.
+        """
+
+        return (self.minX, self.minY, self.maxX, self.maxY)
+
+    def header(self):
+        """ header()
+Returns the <svg> opening tag for the bounding box seen so far, padded to
+SVG_HEADER_SIZE characters.
+        """
+
+        if self.minX > self.maxX:       # no points
+            minX = minY = maxX = maxY = 0
+        else:
+            minX, minY, maxX, maxY = self.minX, self.minY, self.maxX, self.maxY
+
+        header = SVG_HEADER.format(minX=formatNumber(minX, HEADER_DECIMALS), minY=formatNumber(minY, HEADER_DECIMALS),
+                                   width=formatNumber(maxX-minX, HEADER_DECIMALS), height=formatNumber(maxY-minY, HEADER_DECIMALS))
+
+        return (header + ' ').ljust(SVG_HEADER_SIZE)
+
+    def writeStroke(self, arrayX, arrayY, lineWidth=None, precision=None):
+        """ writeStroke(arrayX, arrayY, lineWidth=None, precision=None)
+Writes the path of one stroke.
+The linewidth is only used in outline mode, the other paths are drawn with
+the default stroke width.
+
+arrayX    : x coordinates of the stroke
+arrayY    : y coordinates of the stroke
+lineWidth : linewidth of the stroke, or the array of the widths of its points
+            as stored in the file (see decodeMessagePacket with asArrays)
+precision : decimal precision of the coordinates (the decimalPrecision field of
+            the stroke), or None
+        """
+
+        if len(arrayX) == 0:
+            return
+
+        if self.outline:
+            importNumpy()
+            if lineWidth is None:
+                lineWidth = STROKE_WIDTH_SCALE*DEFAULT_STROKE_WIDTH
+            elif np.ndim(lineWidth):
+                lineWidth = np.multiply(lineWidth, STROKE_WIDTH_SCALE)
+            if not self.fixedBox:
+                # the outline is at most half a width away from the points
+                margin = 0.5*float(np.max(lineWidth))
+                self.minX = min(self.minX, float(np.min(arrayX)) - margin)
+                self.maxX = max(self.maxX, float(np.max(arrayX)) + margin)
+                self.minY = min(self.minY, float(np.min(arrayY)) - margin)
+                self.maxY = max(self.maxY, float(np.max(arrayY)) + margin)
+        elif not self.fixedBox:
+            self.minX = min(self.minX, min(arrayX))
+            self.maxX = max(self.maxX, max(arrayX))
+            self.minY = min(self.minY, min(arrayY))
+            self.maxY = max(self.maxY, max(arrayY))
+
+        if self.outline or self.fit is not None:
+            self.batchStrokes.append((arrayX, arrayY, lineWidth) if self.outline else (arrayX, arrayY, precision))
+            if len(self.batchStrokes) >= BATCH_SIZE:
+                self.flushBatch()
+            return
+
+        if precision is None:
+            self.writePath(strokePathData(arrayX, arrayY, self.poly))
+        else:
+            self.writePath(compactPathData(arrayX, arrayY, precision, self.poly, self.relative))
+
+    def writePath(self, pathData, filled=False):
+        """ writePath(pathData, filled=False)
+Writes a path element with the given d attribute, stroked, or filled and
+not stroked.
+        """
+
+        if filled:
+            path = f'<path fill="black" d="{pathData}"/>\n'
+        else:
+            path = f'<path stroke="black" fill="none" d="{pathData}"/>\n'
+        if self.seekable or self.fixedBox:
+            self.f.write(path)
+        else:
+            self.paths.append(path)
+
+    def flushBatch(self):
+        """ flushBatch()
+Fits or outlines and writes the strokes pending in fit or outline mode.
+        """
+
+        if not self.batchStrokes:
+            return
+
+        if self.outline:
+            from will_outline import outlinePathData
+            with stageTimer('outline'):
+                paths = outlinePathData(self.batchStrokes, relative=self.relative)
+            for pathData in paths:
+                self.writePath(pathData, filled=True)
+        else:
+            from will_fit import strokesPathData
+            # the control points are written at the precision of each stroke
+            with stageTimer('fit'):
+                paths = strokesPathData([(x, y) for x, y, precision in self.batchStrokes], self.fit,
+                                        [precision for x, y, precision in self.batchStrokes], self.relative)
+            for pathData in paths:
+                self.writePath(compactNumbers(pathData))
+        self.batchStrokes = []
+
+    def close(self):
+        """ close()
+Writes the header and closes the <svg> element. It does not close f.
+        """
+
+        self.flushBatch()
+        if self.fixedBox:
+            pass                        # written by __init__
+        elif self.seekable:
+            endPos = self.f.tell()
+            self.f.seek(self.headerPos)
+            self.f.write(self.header())
+            self.f.seek(endPos)
+        else:
+            self.f.write(self.header())
+            self.f.writelines(self.paths)
+            self.paths = []
+        self.f.write(SVG_FOOTER)
+
+
+def writeSVG(f, strokes, poly=False, fit=None, relative=False, boundingBox=None, outline=False):
+    """ writeSVG(f, strokes, poly=False, fit=None, relative=False, boundingBox=None, outline=False)
+Streams the strokes to f as an SVG document.
+
+f           : text file-like object
+strokes     : iterable of (x, y, lineWidth) or (x, y, lineWidth, precision)
+              tuples, for instance a generator
+poly        : create polygonal paths instead of Bezier curves
+fit         : fit the strokes with Bezier curves with this tolerance (see
+              SVGWriter)
+relative    : use relative path commands (see SVGWriter)
+boundingBox : bounding box of the strokes if it is already known (see
+              SVGWriter), or None
+outline     : write the strokes as filled outlines (see SVGWriter)
+    """
+
+    with SVGWriter(f, poly, fit, relative, boundingBox, outline) as writer:
+        for stroke in strokes:
+            writer.writeStroke(*stroke)
+
+
+def XYLineDataToSVG(xData, yData, lineData, poly=False, fit=None, outline=False):
     """ XYLineDataToSVG(xData, yData, lineData)
 Generates the SVG spline data for the array of arrays xData, yData and lineData 
-Currently it ignores the linewidth so it generates constant width paths
+Unless outline is set it ignores the linewidth so it generates constant width paths
+It is a wrapper around SVGWriter that returns the document as a string.
 
 xData    : array with arrays of x coordinates
 yData    : array with arrays of y coordinates
 lineData : array with arrays of lineWhidths
-skips    : number of spline control points to skip
-
-TODO: Take linewidhts into consideration    
+poly     : create polygonal paths instead of Bezier curves
+fit      : fit the strokes with Bezier curves with this tolerance (see SVGWriter)
+outline  : write the strokes as filled outlines of their linewidth (see
+           SVGWriter)
     """
 
-    svgStr = f''
-   
-    for arrayX, arrayY in zip(xData, yData):
-        svgStr += f'<path stroke="black" fill="none" d="M{arrayX[0]},{arrayY[0]} '
-        idxr = range(len(arrayX))
-        if poly: 
-            svgStr += f' L'
-            xyZip = zip(arrayX[0:], arrayY[0:], idxr[0:])   # use all points
-        if not poly:            # ignore first n odd last points
-            idxr = range(len(arrayX) - len(arrayX)%3) 
-            xyZip = zip(arrayX[1:], arrayY[1:], idxr[1:])
-        for x, y, idx in xyZip:
-            if not poly:        # interpret point list as list of Bezier control points
-                if idx%3 == 0:
-                    svgStr = svgStr[:-1] + f' C'
-            svgStr += f'{x} {y},'
-    
-        svgStr = svgStr[:-1] + '"/>\n'
-    
-    minX = max(arrayX)
-    maxX = min(arrayX)
-    minY = max(arrayY)
-    maxY = min(arrayY)    
-    svgWidth = maxX-minX
-    svgHeight = maxY-minY
-    svgStr = f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{svgWidth}mm" height="{svgHeight}mm" viewBox="{minX} {minY} {maxX} {maxY}"> ' + svgStr + '</svg>'
+    f = io.StringIO()
+    writeSVG(f, zip(xData, yData, lineData), poly, fit, outline=outline)
         
-    return svgStr
+    return f.getvalue()
 
 
 
@@ -123,23 +609,150 @@ v : array to unzigzag
 
 
 
+def decodeVarintArrayPython(strBytes):
+    """ decodeVarintArrayPython(strBytes)
+Decodes the array of bytes in the format Varint to signed integers, one value
+at a time in python. It is the fallback used when numpy is not available.
+
+strBytes : array to unpack
+    """
+
+    return [unzigzag(v) for v in decodePackedVarints(strBytes)]
+
+
+def decodeVarintArrayNumpy(strBytes):
+    """ decodeVarintArrayNumpy(strBytes)
+Vectorized version of decodeVarintArrayPython. Instead of walking the bytes one
+varint at a time, it decodes the whole packed array in a few numpy passes:
+the bytes without the continuation bit mark the end of each varint, the
+position of each byte inside its varint gives the shift of its 7 bits, the
+shifted bits of each varint are ORed together and finally the values are
+unzigzagged. Returns a numpy int64 array with the same values the python
+decoder returns.
+
+strBytes : array to unpack
+    """
+
+    importNumpy()
+
+    data = np.frombuffer(strBytes, dtype=np.uint8)
+    if data.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    if data[-1] & 0x80:
+        raise ValueError('Truncated varint array.')
+
+    # last byte of each varint and the index of the varint of each byte
+    isLast = data < 0x80
+    ends = np.flatnonzero(isLast)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    if (ends - starts).max() >= 10:
+        raise ValueError('Too many bytes when decoding varint.')
+
+    if ends.size == data.size:      # every value fits in a single byte
+        values = data.astype(np.uint64)
+    else:
+        varintIdx = np.zeros(data.size, dtype=np.intp)
+        varintIdx[1:] = np.cumsum(isLast[:-1])
+        shifts = 7*(np.arange(data.size) - starts[varintIdx])
+        bits = (data & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+        values = np.bitwise_or.reduceat(bits, starts)
+
+    # same 32 bits truncation as decodeVarint32
+    values &= np.uint64(0xFFFFFFFF)
+
+    # unzigzag
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def decodeVarintArraysNumpy(chunks):
+    """ decodeVarintArraysNumpy(chunks)
+Decodes many packed varint arrays in a single numpy pass, which avoids the
+per call overhead of decodeVarintArrayNumpy on small arrays. Returns the
+concatenated values and the array of len(chunks)+1 offsets of the values of
+each chunk.
+
+chunks : list of bytes-like packed varint arrays
+    """
+
+    importNumpy()
+
+    data = b''.join(chunks)
+    byteOffsets = np.zeros(len(chunks)+1, dtype=np.int64)
+    byteOffsets[1:] = np.cumsum([len(chunk) for chunk in chunks])
+
+    bytesArray = np.frombuffer(data, dtype=np.uint8)
+    chunkEnds = byteOffsets[1:][byteOffsets[1:] > byteOffsets[:-1]]
+    if np.any(bytesArray[chunkEnds-1] & 0x80):
+        raise ValueError('Truncated varint array.')
+
+    # number of varints ending before each chunk boundary
+    endsBefore = np.zeros(len(data)+1, dtype=np.int64)
+    endsBefore[1:] = np.cumsum(bytesArray < 0x80)
+
+    return (decodeVarintArrayNumpy(data), endsBefore[byteOffsets])
+
+
+def segmentedCumsum(values, offsets):
+    """ segmentedCumsum(values, offsets)
+Returns the cummulative sum of each segment values[offsets[i]:offsets[i+1]],
+restarting at every segment, computed with a single numpy cumsum.
+
+values  : integer numpy array
+offsets : array with the len(segments)+1 boundaries of the segments
+    """
+
+    importNumpy()
+
+    total = np.cumsum(values)
+    starts = offsets[:-1]
+    base = np.where(starts > 0, total[np.maximum(starts-1, 0)], 0) if len(total) else np.zeros(len(starts), dtype=total.dtype)
+
+    return total - np.repeat(base, np.diff(offsets))
+
+
+def segmentedBounds(values, offsets):
+    """ segmentedBounds(values, offsets)
+Returns the (minima, maxima) arrays of each segment
+values[offsets[i]:offsets[i+1]], computed with one numpy reduceat each. The
+empty segments get inf and -inf.
+
+values  : numpy array
+offsets : array with the len(segments)+1 boundaries of the segments
+    """
+
+    importNumpy()
+
+    offsets = np.asarray(offsets)
+    nonEmpty = np.diff(offsets) > 0
+    minima = np.full(len(offsets)-1, np.inf, dtype=values.dtype if values.dtype.kind == 'f' else np.float64)
+    maxima = np.full(len(offsets)-1, -np.inf, dtype=minima.dtype)
+    if np.any(nonEmpty):
+        # empty segments contain no point, so the segments of the non empty ones
+        # end where the next non empty one starts
+        starts = offsets[:-1][nonEmpty]
+        minima[nonEmpty] = np.minimum.reduceat(values, starts)
+        maxima[nonEmpty] = np.maximum.reduceat(values, starts)
+
+    return (minima, maxima)
+
+
 def decodeVarintArray(strBytes):
     """ decodeVarintArray(strBytes)
 Decodes the array of bytes in the format Varint to signed integers.
 Most protobuffer data comes in packages of varint type. This function "unpacks"
 the array and returns an array of signed integers.
+It uses the vectorized decoder when numpy is available and falls back to the
+python decoder otherwise.
 
 strBytes : array to unpack
     """
 
-    values = []
-    
-    nextPos = 0
-    while nextPos < len(strBytes):
-        value, nextPos = _DecodeVarint32(strBytes, nextPos)
-        values.append(value)
+    if importNumpy() is None:
+        return decodeVarintArrayPython(strBytes)
         
-    return [unzigzag(v) for v in values]
+    return decodeVarintArrayNumpy(strBytes).tolist()
         
 
 
@@ -150,123 +763,213 @@ strBytes : array to unpack
 #
     
 
-def decodeMessagePacket(messageBytes):
-    """ decodeMessagePacket(messageBytes):
-Decodes the message package in the WILL format and returns the vector of
-location ponts x, y and the linewidths.
-It assumes that the message is in the format specified in the WILL file format
-form Wacom. 
-Future versions might break this code, since its based on the format from 2018.
-
+# fields of the stroke message: field number -> (name, wire type, default)
+# The defaults are the ones of the WILL format, used when a field is missing.
+STROKE_FIELDS = {
+    1: ('startParameter', WIRETYPE_FIXED32, 0.0),
+    2: ('stopParameter', WIRETYPE_FIXED32, 1.0),
+    3: ('decimalPrecision', WIRETYPE_VARINT, 2),
+    4: ('points', WIRETYPE_LENGTH_DELIMITED, b''),
+    5: ('strokeWidths', WIRETYPE_LENGTH_DELIMITED, b''),
+    6: ('colors', WIRETYPE_LENGTH_DELIMITED, b''),
+}
+
+FIELD_DECODERS = {
+    WIRETYPE_VARINT: decodeVarint,
+    WIRETYPE_FIXED32: decodeFloat,
+    WIRETYPE_LENGTH_DELIMITED: decodeLengthDelimited,
+}
+
+# fields needed to build the x, y, lineWidth of a stroke
+GEOMETRY_FIELDS = frozenset(['decimalPrecision', 'points', 'strokeWidths'])
+
+# stroke width used for strokes without the strokeWidths field (lineWidth 1)
+DEFAULT_STROKE_WIDTH = 100.0
+
+# factor from the stroke widths of the file to the units of the coordinates
+STROKE_WIDTH_SCALE = 0.01
+
+
+def decodeStrokeFields(messageBytes, fields=None):
+    """ decodeStrokeFields(messageBytes, fields=None)
+Decodes the fields of a stroke message packet into a dictionary name -> value,
+dispatching on the field number and wire type of each tag (see STROKE_FIELDS),
+so the fields can come in any order or be missing (the WILL default is used).
+Unknown fields and fields that are not asked for are skipped using their
+length, without decoding them. Numeric fields are decoded, length-delimited
+fields are returned as the raw bytes of the packed array.
 
 messageBytes : message to decode
+fields       : names of the fields to decode (default: all)
     """
 
+    values = {name: default for name, wireType, default in STROKE_FIELDS.values()
+              if fields is None or name in fields}
+
     nextPos = 0
-    
-    # startParameter  [FLOAT]
-    #  (varint header)
-    msgVarintIdentifier, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    field, wireType = wire_format.UnpackTag(msgVarintIdentifier)
-    #  value
-    startParameter =struct.unpack('f',messageBytes[nextPos:nextPos+4])[0]
-    nextPos += 4
+    while nextPos < len(messageBytes):
+        tag, nextPos = decodeVarint(messageBytes, nextPos)
+        field, wireType = unpackTag(tag)
+        fieldInfo = STROKE_FIELDS.get(field)
 
-    debugPrint(f'field: {field}, wire type:{wireType}')
-    debugPrint(f'startParameter: {startParameter}')
+        if fieldInfo is None or fieldInfo[1] != wireType or fieldInfo[0] not in values:
+            if VERBOSE:
+                debugPrint(f'field: {field}, wire type:{wireType} (skipped)')
+            nextPos = skipField(messageBytes, nextPos, wireType)
+        else:
+            values[fieldInfo[0]], nextPos = FIELD_DECODERS[wireType](messageBytes, nextPos)
+            if VERBOSE:
+                debugPrint(f'field: {field}, wire type:{wireType}')
 
+    if nextPos > len(messageBytes):
+        raise ValueError('Truncated stroke message.')
 
-    # stopParameter  [FLOAT]
-    #  (varint header)
-    msgVarintIdentifier, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    field, wireType = wire_format.UnpackTag(msgVarintIdentifier)
-    #  value
-    stopParameter = struct.unpack('f',messageBytes[nextPos:nextPos+4])[0]
-    nextPos += 4
+    return values
 
-    debugPrint(f'field: {field}, wire type:{wireType}')
-    debugPrint(f'stopParameter: {stopParameter}')
 
-    
-    # decimalPrecision  [VARIANT]
-    #  (varint header)
-    msgVarintIdentifier, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    field, wireType = wire_format.UnpackTag(msgVarintIdentifier)
-    #  value
-    decimalPrecision, nextPos = _DecodeVarint32(messageBytes, nextPos)
-
-    debugPrint(f'field: {field}, wire type:{wireType}')
-    debugPrint(f'decimalPrecision: {decimalPrecision}')
-    
+def decodeMessagePacket(messageBytes, asArrays=False, withPrecision=False):
+    """ decodeMessagePacket(messageBytes, asArrays=False, withPrecision=False):
+Decodes the message package in the WILL format and returns the vector of
+location ponts x, y and the linewidths.
+The fields are found by their field number (see decodeStrokeFields), and only
+the ones needed for the geometry are decoded. A trailing x without its y (an
+odd number of values in the points field) is dropped. With asArrays, the
+stroke widths are the ones of the points: DEFAULT_STROKE_WIDTH when the field
+is missing, and the mean width at every point when their number does not match
+the points.
+
+messageBytes  : message to decode
+asArrays      : if True (requires numpy), returns the numpy arrays x, y and the
+                per point stroke widths instead of lists and the mean linewidth
+withPrecision : if True, the decimal precision of the coordinates is appended
+                to the returned tuple (see SVGWriter.writeStroke)
+    """
 
-    # x,y sequence  [BYTE STRING]
-    #  (varint header)
-    msgVarintIdentifier, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    field, wireType = wire_format.UnpackTag(msgVarintIdentifier)
-    #  value
-    strLen, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    xyBytes = messageBytes[nextPos:nextPos+strLen]
-    nextPos += strLen
-    xyList = decodeVarintArray(xyBytes)
-    
-    dx = xyList[0::2]
-    dy = xyList[1::2]
-    
-    factor = 10**decimalPrecision
-    
-    x = cumsum(dx, factor)
-    y = cumsum(dy, factor)
-    
-    debugPrint(f'field: {field}, wire type:{wireType}')
-    debugPrint(f'strLen: {strLen}')
-    debugPrint(f'x [{len(x)}]: {x[0:10]}...')
-    debugPrint(f'y [{len(y)}]: {y[0:10]}...')
+    values = decodeStrokeFields(messageBytes, None if VERBOSE else GEOMETRY_FIELDS)
 
+    decimalPrecision = values['decimalPrecision']
+    factor = 10**decimalPrecision
 
+    # x,y sequence
+    if not asArrays:
+        xyList = decodeVarintArrayPython(values['points'])
+        del xyList[len(xyList) - len(xyList)%2:]
+        x = cumsum(xyList[0::2], factor)
+        y = cumsum(xyList[1::2], factor)
+    else:
+        xyArray = decodeVarintArrayNumpy(values['points'])
+        xyArray = xyArray[:len(xyArray) - len(xyArray)%2]
+        x = np.cumsum(xyArray[0::2])/factor
+        y = np.cumsum(xyArray[1::2])/factor
+
+    # stroke width
+    if not asArrays:
+        strokeWidths = cumsum(decodeVarintArrayPython(values['strokeWidths']), 1.0)
+        if not strokeWidths:
+            strokeWidths = [DEFAULT_STROKE_WIDTH]*len(x)
+    else:
+        strokeWidths = np.cumsum(decodeVarintArrayNumpy(values['strokeWidths'])).astype(np.float64)
+        if not len(strokeWidths):
+            strokeWidths = np.full(len(x), DEFAULT_STROKE_WIDTH)
+        elif len(strokeWidths) != len(x):
+            strokeWidths = np.full(len(x), strokeWidths.sum()/len(strokeWidths))
+
+    # the debug output is only formatted when it is printed
+    if VERBOSE:
+        debugPrint(f'startParameter: {values["startParameter"]}')
+        debugPrint(f'stopParameter: {values["stopParameter"]}')
+        debugPrint(f'decimalPrecision: {decimalPrecision}')
+        debugPrint(f'x [{len(x)}]: {x[0:10]}...')
+        debugPrint(f'y [{len(y)}]: {y[0:10]}...')
+        debugPrint(f'strokeWidthList [{len(strokeWidths)}]: {strokeWidths[0:10]}...')
+        debugPrint(f'colorValueList: {decodeVarintArrayPython(values["colors"])}')
+        debugPrint()
+
+    if STATS is not None:
+        STATS.count('messages')
+        STATS.count('bytes', len(messageBytes))
+        STATS.count('points', len(x))
 
+    #plt.plot(x,y,'k', linewidth=(lineWidth**5)/20)
 
-    # stroke width  [BYTE STRING]
-    #  (varint header)
-    msgVarintIdentifier, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    field, wireType = wire_format.UnpackTag(msgVarintIdentifier)
-    #  value
-    strLen, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    strokeWidthBytes = messageBytes[nextPos:nextPos+strLen]
-    nextPos += strLen
-    strokeWidthList = decodeVarintArray(strokeWidthBytes)
+    #plt.axis('equal')
     
-    strokeWidths = cumsum(strokeWidthList, 1.0)
+    if asArrays:
+        return (x, y, strokeWidths, decimalPrecision) if withPrecision else (x, y, strokeWidths)
     
-    debugPrint(f'field: {field}, wire type:{wireType}')
-    debugPrint(f'strLen: {strLen}')
-    debugPrint(f'strokeWidthList [{len(strokeWidths)}]: {strokeWidths[0:10]}...')
+    lineWidth = STROKE_WIDTH_SCALE*sum(strokeWidths)/len(strokeWidths) if strokeWidths else STROKE_WIDTH_SCALE*DEFAULT_STROKE_WIDTH
     
+    return (x, y, lineWidth, decimalPrecision) if withPrecision else (x, y, lineWidth)
 
-    # color values  [BYTE STRING]
-    #  (varint header)
-    msgVarintIdentifier, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    field, wireType = wire_format.UnpackTag(msgVarintIdentifier)
-    #  value
-    strLen, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    colorValuesBytes = messageBytes[nextPos:nextPos+strLen]
-    nextPos += strLen
-    colorValueList = decodeVarintArray(colorValuesBytes)
-    
-    debugPrint(f'field: {field}, wire type:{wireType}')
-    debugPrint(f'strLen: {strLen}')
-    debugPrint(f'colorValueList [{len(colorValueList)}]: {colorValueList}')
 
-    debugPrint()
-    
-    debugPrint(struct.unpack('B'*len(messageBytes[nextPos:]),messageBytes[nextPos:]))
+def index_strokes(buffer):
+    """ index_strokes(buffer)
+Returns a list with the (offset, length) of each message packet (stroke) in the
+buffer. Only the length prefixes are read, the messages are not decoded.
+
+buffer : Whole protobuffer read from the WILL file.
+    """
 
-    lineWidth = 0.01*sum(strokeWidths)/len(strokeWidths)
+    index = []
     
-    #plt.plot(x,y,'k', linewidth=(lineWidth**5)/20)
+    buffPos = 0
+    while buffPos < len(buffer):
+        messageLength, buffPos = decodeVarint32(buffer, buffPos)
+        index.append((buffPos, messageLength))
+        buffPos += messageLength
 
-    #plt.axis('equal')
+    return index
+
+
+def count_strokes(buffer):
+    """ count_strokes(buffer)
+Returns the number of message packets (strokes) in the buffer, reading only
+the length prefixes.
+
+buffer : Whole protobuffer read from the WILL file.
+    """
+
+    count = 0
     
-    return (x, y, lineWidth)
+    buffPos = 0
+    while buffPos < len(buffer):
+        messageLength, buffPos = decodeVarint32(buffer, buffPos)
+        buffPos += messageLength
+        count += 1
+
+    return count
+
+
+def iter_messages(buffer):
+    """ iter_messages(buffer)
+Generator that yields the bytes of each message packet in the buffer.
+
+buffer : Whole protobuffer read from the WILL file.
+    """
+
+    buffPos = 0
+    while buffPos < len(buffer):
+        messageLength, buffPos = decodeVarint32(buffer, buffPos)
+        messageBytes = buffer[buffPos:buffPos+messageLength]
+        buffPos += messageLength
+        
+        yield messageBytes
+
+
+def iter_strokes(buffer, asArrays=False):
+    """ iter_strokes(buffer, asArrays=False)
+Generator that decodes one message packet at a time and yields its
+(x, y, lineWidth) tuple, as returned by decodeMessagePacket. Nothing is
+decoded before it is asked for, so the strokes can be rendered or streamed
+while the buffer is read, or only the first ones decoded, e.g.
+itertools.islice(iter_strokes(buffer), 10) for a thumbnail.
+
+buffer   : Whole protobuffer read from the WILL file.
+asArrays : yield (x, y, widths) numpy arrays instead (see decodeMessagePacket)
+    """
+
+    for messageBytes in iter_messages(buffer):
+        yield decodeMessagePacket(messageBytes, asArrays)
 
 
 def processBuffer(buffer):
@@ -283,23 +986,8 @@ buffer : Whole protobuffer read from the WILL file.
     xData = []
     yData = []
     lineData = []
-    minX = 10000
-    maxX = -10000
-    minY = 10000
-    maxY = -10000
     
-    buffPos = 0
-    while buffPos < len(buffer):
-        messageLength, buffPos = _DecodeVarint32(buffer, buffPos)
-        messageBytes = buffer[buffPos:buffPos+messageLength]
-        buffPos += messageLength
-        
-        #print(f'messageLength = {messageLength}')
-        #print('messageBytes:')
-        #print(messageBytes)
-        
-        (x, y, lineWidth) = decodeMessagePacket(messageBytes)
-        
+    for (x, y, lineWidth) in iter_strokes(buffer):
         xData.append(x)
         yData.append(y)
         lineData.append(lineWidth)
@@ -311,6 +999,517 @@ buffer : Whole protobuffer read from the WILL file.
    
 
 
+STROKESET_MAGIC = b'WILLSTK\x00'
+STROKESET_VERSION = 3
+STROKESET_ALIGN = 64
+
+
+def packArrays(magic, version, arrays):
+    """ packArrays(magic, version, arrays)
+Returns the (header, chunks, dataStart) of the binary form of named arrays
+used by StrokeSet (and will_index): the header bytes (magic, length and JSON
+description of the arrays), the list of (dataOffset, array) to write and the
+offset of the data section in the file. The arrays are aligned to
+STROKESET_ALIGN bytes so they can be mapped in place.
+
+magic   : bytes identifying the kind of file
+version : version of the format, written in the description
+arrays  : list of (name, dtype, array)
+    """
+
+    importNumpy()
+
+    description = {}
+    chunks = []
+    dataOffset = 0
+    for name, dtype, array in arrays:
+        array = np.ascontiguousarray(array, dtype=dtype)
+        description[name] = {'dtype': dtype, 'offset': dataOffset, 'count': len(array)}
+        chunks.append((dataOffset, array))
+        dataOffset += -(-array.nbytes//STROKESET_ALIGN)*STROKESET_ALIGN
+
+    headerJSON = json.dumps({'version': version, 'arrays': description}).encode()
+    header = magic + struct.pack('<I', len(headerJSON)) + headerJSON
+    dataStart = -(-len(header)//STROKESET_ALIGN)*STROKESET_ALIGN
+
+    return (header, chunks, dataStart)
+
+
+def arraysToBytes(magic, version, arrays):
+    """ arraysToBytes(magic, version, arrays)
+Returns the binary form of the arrays as bytes (see packArrays).
+    """
+
+    header, chunks, dataStart = packArrays(magic, version, arrays)
+    data = bytearray(dataStart + (chunks[-1][0] + chunks[-1][1].nbytes if chunks else 0))
+    data[:len(header)] = header
+    for dataOffset, array in chunks:
+        data[dataStart+dataOffset:dataStart+dataOffset+array.nbytes] = array.tobytes()
+
+    return bytes(data)
+
+
+def writeArrays(fileName, magic, version, arrays):
+    """ writeArrays(fileName, magic, version, arrays)
+Writes the binary form of the arrays to the file fileName (see packArrays).
+    """
+
+    header, chunks, dataStart = packArrays(magic, version, arrays)
+    with open(fileName, 'wb') as f:
+        f.write(header)
+        for dataOffset, array in chunks:
+            f.write(b'\0'*(dataStart + dataOffset - f.tell()))
+            f.write(memoryview(array).cast('B'))
+
+
+def unpackArrays(buffer, magic, version, kind='stroke set'):
+    """ unpackArrays(buffer, magic, version, kind='stroke set')
+Returns (fileVersion, arrays) for the binary form written by packArrays,
+arrays being a dictionary name -> read-only view of buffer made with
+numpy.frombuffer, nothing is copied.
+
+buffer  : bytes-like object (bytes, mmap, memoryview)
+magic   : expected magic bytes
+version : latest supported version (older ones are accepted)
+kind    : name of the kind of file, for the error messages
+    """
+
+    importNumpy()
+
+    if bytes(buffer[:len(magic)]) != magic:
+        raise ValueError(f'Not a {kind} file.')
+    headerLength, = struct.unpack_from('<I', buffer, len(magic))
+    headerStart = len(magic) + 4
+    description = json.loads(bytes(buffer[headerStart:headerStart+headerLength]))
+    if not 1 <= description['version'] <= version:
+        raise ValueError(f'Unsupported {kind} version {description["version"]}.')
+    dataStart = -(-(headerStart + headerLength)//STROKESET_ALIGN)*STROKESET_ALIGN
+
+    arrays = {name: np.frombuffer(buffer, dtype=info['dtype'], count=info['count'], offset=dataStart+info['offset'])
+              for name, info in description['arrays'].items()}
+
+    return (description['version'], arrays)
+
+
+def mapFile(fileName, useMmap=True):
+    """ mapFile(fileName, useMmap=True)
+Returns the content of the file fileName, memory mapped (read-only) with
+useMmap, read otherwise.
+    """
+
+    with open(fileName, 'rb') as f:
+        if useMmap:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return f.read()
+
+
+class StrokeSet:
+    """ StrokeSet(x, y, width, offsets, precision=None)
+Array backed storage of all the strokes of a document. Instead of one python
+list of floats per stroke, every point of the document is kept in three
+contiguous float32 arrays (x, y and stroke width) and the stroke i is made of
+the points offsets[i]:offsets[i+1]. Indexing or iterating over the set returns
+numpy views of the arrays, so nothing is copied.
+The bounding box of each stroke is computed once, when the set is built, and
+kept in the minX, minY, maxX and maxY arrays (inf and -inf for empty strokes),
+so the bounding box of the document or of a selection of strokes never
+rescans the points.
+Requires numpy.
+
+x         : x coordinates of all the points
+y         : y coordinates of all the points
+width     : stroke widths of all the points
+offsets   : array with len(strokes)+1 indexes of the start of each stroke
+precision : array with the decimal precision of the coordinates of each stroke
+            (see SVGWriter.writeStroke), or None if it is not known
+    """
+
+    # arrays written by toBytes and save, with their little endian dtypes
+    ARRAYS = (('offsets', '<i8'), ('x', '<f4'), ('y', '<f4'), ('width', '<f4'),
+              ('minX', '<f4'), ('minY', '<f4'), ('maxX', '<f4'), ('maxY', '<f4'), ('precision', '<i1'))
+
+    def __init__(self, x, y, width, offsets, precision=None):
+        importNumpy()
+        self.x = np.asarray(x, dtype=np.float32)
+        self.y = np.asarray(y, dtype=np.float32)
+        self.width = np.asarray(width, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.precision = None if precision is None else np.asarray(precision, dtype=np.int8)
+        self.computeBoxes()
+
+    def computeBoxes(self):
+        """ computeBoxes()
+Computes the bounding boxes of the strokes (see segmentedBounds).
+        """
+
+        self.minX, self.maxX = segmentedBounds(self.x, self.offsets)
+        self.minY, self.maxY = segmentedBounds(self.y, self.offsets)
+
+    def layout(self):
+        """ layout()
+Returns the (header, chunks, dataStart) of the binary form of the set (see
+packArrays).
+        """
+
+        return packArrays(STROKESET_MAGIC, STROKESET_VERSION, self.namedArrays())
+
+    def namedArrays(self):
+        """ namedArrays()
+Returns the list of (name, dtype, array) of ARRAYS (without the precision if it
+is not known).
+        """
+
+        return [(name, dtype, getattr(self, name)) for name, dtype in self.ARRAYS if getattr(self, name) is not None]
+
+    def toBytes(self):
+        """ toBytes()
+Returns the compact binary form of the set (see save).
+        """
+
+        return arraysToBytes(STROKESET_MAGIC, STROKESET_VERSION, self.namedArrays())
+
+    def save(self, fileName):
+        """ save(fileName)
+Writes the set in a compact binary form: a small JSON header followed by the
+flat offsets, x, y, width, bounding box and precision arrays (the precision is
+missing before version 3, and then None), which StrokeSet.load maps
+back without decoding or copying anything.
+
+fileName : name of the file (.strokes)
+        """
+
+        writeArrays(fileName, STROKESET_MAGIC, STROKESET_VERSION, self.namedArrays())
+
+    @classmethod
+    def fromBuffer(cls, buffer):
+        """ StrokeSet.fromBuffer(buffer)
+Builds the set from its binary form (see save). The arrays are read-only
+views of buffer made with numpy.frombuffer, nothing is copied.
+
+buffer : bytes-like object (bytes, mmap, memoryview)
+        """
+
+        version, arrays = unpackArrays(buffer, STROKESET_MAGIC, STROKESET_VERSION)
+
+        strokes = cls.__new__(cls)
+        for name, dtype in cls.ARRAYS:
+            setattr(strokes, name, arrays.get(name))
+        if strokes.minX is None:        # version 1, without the boxes
+            strokes.computeBoxes()
+
+        return strokes
+
+    @classmethod
+    def load(cls, fileName, useMmap=True):
+        """ StrokeSet.load(fileName, useMmap=True)
+Loads a set written by save. With useMmap the file is memory mapped and the
+arrays are read-only views of the mapping, so loading costs microseconds and
+only the pages that are used are read.
+
+fileName : name of the file (.strokes)
+useMmap  : map the file instead of reading it
+        """
+
+        return cls.fromBuffer(mapFile(fileName, useMmap))
+
+    @classmethod
+    def fromArrays(cls, strokes, precision=None):
+        """ StrokeSet.fromArrays(strokes, precision=None)
+Builds the set from a sequence of (x, y, width) arrays, one per stroke, as the
+ones returned by decodeMessagePacket(messageBytes, asArrays=True). Raises
+ValueError if the three arrays of a stroke do not have the same length.
+
+strokes   : sequence of (x, y, width) tuples
+precision : decimal precision of the coordinates of each stroke, or None
+        """
+
+        importNumpy()
+
+        strokes = list(strokes)
+        for n, (x, y, width) in enumerate(strokes):
+            if not len(x) == len(y) == len(width):
+                raise ValueError(f'Stroke {n} has {len(x)} x, {len(y)} y and {len(width)} widths.')
+        offsets = np.zeros(len(strokes)+1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(x) for x, y, width in strokes])
+        if not strokes:
+            return cls([], [], [], offsets, precision)
+
+        return cls(np.concatenate([x for x, y, width in strokes]),
+                   np.concatenate([y for x, y, width in strokes]),
+                   np.concatenate([width for x, y, width in strokes]),
+                   offsets, precision)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        """ (x, y, width) views of the points of stroke i """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('stroke index out of range')
+        start, stop = self.offsets[i], self.offsets[i+1]
+        
+        return (self.x[start:stop], self.y[start:stop], self.width[start:stop])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def numPoints(self):
+        return len(self.x)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name, dtype in self.ARRAYS)
+
+    def boundingBox(self, strokeIndexes=None):
+        """ boundingBox(strokeIndexes=None)
+Returns the (minX, minY, maxX, maxY) of the strokes, reduced from their
+bounding boxes ((inf, inf, -inf, -inf) if there is no point).
+
+strokeIndexes : indexes (or boolean mask) of the strokes to include, default
+                all
+        """
+
+        if strokeIndexes is None:
+            strokeIndexes = slice(None)
+        boxes = [getattr(self, name)[strokeIndexes] for name in ('minX', 'minY', 'maxX', 'maxY')]
+        if not len(boxes[0]):
+            return (float('inf'), float('inf'), float('-inf'), float('-inf'))
+
+        return (float(boxes[0].min()), float(boxes[1].min()), float(boxes[2].max()), float(boxes[3].max()))
+
+    def select(self, mask):
+        """ select(mask)
+Returns a new set with only the points where mask is True, the strokes keep
+their order (strokes with no point left become empty).
+
+mask : boolean array with one value per point
+        """
+
+        mask = np.asarray(mask, dtype=bool)
+        offsets = np.concatenate(([0], np.cumsum(mask)))[self.offsets]
+
+        return StrokeSet(self.x[mask], self.y[mask], self.width[mask], offsets, self.precision)
+
+    def lineWidths(self):
+        """ lineWidths()
+Returns the mean linewidth of each stroke, as processBuffer does.
+        """
+
+        counts = np.diff(self.offsets)
+        # differences of the cumulative sum, which are also right for the empty
+        # strokes (reduceat is not)
+        total = np.zeros(self.numPoints+1)
+        np.cumsum(self.width, dtype=np.float64, out=total[1:])
+        sums = total[self.offsets[1:]] - total[self.offsets[:-1]]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, STROKE_WIDTH_SCALE*sums/counts, STROKE_WIDTH_SCALE*DEFAULT_STROKE_WIDTH)
+
+    def toXYLineData(self):
+        """ toXYLineData()
+Returns the (xData, yData, lineData) triple used by plotXYLineData and
+XYLineDataToSVG. xData and yData are lists of views into the set arrays.
+        """
+
+        xData = [self.x[start:stop] for start, stop in zip(self.offsets[:-1], self.offsets[1:])]
+        yData = [self.y[start:stop] for start, stop in zip(self.offsets[:-1], self.offsets[1:])]
+
+        return (xData, yData, self.lineWidths().tolist())
+
+
+def decodeStrokeArrays(precisions, pointChunks, widthChunks):
+    """ decodeStrokeArrays(precisions, pointChunks, widthChunks)
+Decodes the packed points and stroke widths of many strokes together, in a few
+numpy passes over all of them (see decodeVarintArraysNumpy), and returns
+(x, y, width, offsets, lineWidths): the float64 coordinates and stroke widths
+of all the points, the len(strokes)+1 offsets of the points of each stroke and
+the mean linewidth of each stroke. The values are the ones decodeMessagePacket
+returns for each stroke, with asArrays for the widths of the points and without
+for the linewidths. Requires numpy.
+
+precisions  : decimal precision of the coordinates of each stroke
+pointChunks : packed points field of each stroke
+widthChunks : packed strokeWidths field of each stroke
+    """
+
+    importNumpy()
+
+    xy, xyOffsets = decodeVarintArraysNumpy(pointChunks)
+    odd = np.diff(xyOffsets) % 2 == 1
+    if np.any(odd):
+        # the trailing x without its y is dropped
+        keep = np.ones(len(xy), dtype=bool)
+        keep[xyOffsets[1:][odd] - 1] = False
+        xy = xy[keep]
+        xyOffsets = xyOffsets - np.concatenate(([0], np.cumsum(odd)))
+    offsets = xyOffsets//2
+    counts = np.diff(offsets)
+    factors = np.repeat(10.0**np.asarray(precisions, dtype=np.float64), counts)
+    x = segmentedCumsum(xy[0::2], offsets)/factors
+    y = segmentedCumsum(xy[1::2], offsets)/factors
+
+    widths, widthOffsets = decodeVarintArraysNumpy(widthChunks)
+    widths = segmentedCumsum(widths, widthOffsets).astype(np.float64)
+    widthCounts = np.diff(widthOffsets)
+    total = np.zeros(len(widths)+1)
+    np.cumsum(widths, out=total[1:])
+    sums = total[widthOffsets[1:]] - total[widthOffsets[:-1]]
+
+    # the strokes without widths have DEFAULT_STROKE_WIDTH at every point
+    missing = widthCounts == 0
+    sums[missing] = DEFAULT_STROKE_WIDTH*counts[missing]
+    widthCounts = np.where(missing, counts, widthCounts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lineWidths = np.where(widthCounts > 0, STROKE_WIDTH_SCALE*sums/widthCounts, STROKE_WIDTH_SCALE*DEFAULT_STROKE_WIDTH)
+        means = sums/widthCounts
+
+    matching = widthCounts == counts
+    if np.all(matching) and not np.any(missing):
+        width = widths
+    else:
+        width = np.repeat(means, counts)
+        points = np.repeat(matching & ~missing, counts)
+        width[points] = widths[np.repeat(matching & ~missing, np.diff(widthOffsets))]
+
+    return (x, y, width, offsets, lineWidths)
+
+
+def decodeStrokeSet(buffer):
+    """ decodeStrokeSet(buffer)
+Same as processBuffer, but returns the strokes as a StrokeSet instead of the
+lists of lists xData, yData and lineData. Only the geometry fields are
+decoded, and the packed arrays of all the strokes are decoded together in a few
+numpy passes. Requires numpy.
+
+buffer : Whole protobuffer read from the WILL file.
+    """
+
+    importNumpy()
+
+    precisions = []
+    pointChunks = []
+    widthChunks = []
+    for messageBytes in iter_messages(buffer):
+        values = decodeStrokeFields(messageBytes, GEOMETRY_FIELDS)
+        precisions.append(values['decimalPrecision'])
+        pointChunks.append(values['points'])
+        widthChunks.append(values['strokeWidths'])
+
+    # all the packed arrays of the document are decoded at once
+    x, y, width, offsets, lineWidths = decodeStrokeArrays(precisions, pointChunks, widthChunks)
+    if STATS is not None:
+        STATS.count('messages', len(precisions))
+        STATS.count('bytes', len(buffer))
+        STATS.count('points', int(offsets[-1]))
+
+    return StrokeSet(x, y, width, offsets, precisions)
+
+
+PATHS_MEMBER = 'sections/media/paths.protobuf'
+
+# members of the pages of a .will file (see listWillProtobuffs)
+PAGES_PATTERN = 'sections/media/*.protobuf'
+
+# bump when the SVG output or the state format of convertFileIncremental change
+INCREMENTAL_STATE_VERSION = 2
+
+# size of the blocks read from compressed members
+STREAM_CHUNK_SIZE = 64*1024
+
+# local file header of a zip member (signature ... file name length, extra
+# field length), followed by the file name and the extra field
+ZIP_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+
+
+class BufferFile(io.RawIOBase):
+    """ BufferFile(buffer)
+Read-only seekable binary file over a bytes-like object, without copying it
+(io.BytesIO copies anything but bytes). ZipFile only reads its directory and
+the members it is asked for.
+
+buffer : bytes-like object (bytes, bytearray, memoryview, mmap)
+    """
+
+    def __init__(self, buffer):
+        self.buffer = memoryview(buffer).cast('B')
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.buffer)
+        if offset < 0:
+            # as a real file, so ZipFile reports a too short input as BadZipFile
+            raise OSError(errno.EINVAL, 'Invalid argument')
+        self.position = offset
+
+        return offset
+
+    def readinto(self, b):
+        data = self.buffer[self.position:self.position+len(b)]
+        b[:len(data)] = data
+        self.position += len(data)
+
+        return len(data)
+
+
+def archiveBuffer(inputFile):
+    """ archiveBuffer(inputFile)
+Returns a memoryview of the whole .will archive when it is held in memory:
+a bytes-like object itself, or the buffer of an io.BytesIO. Returns None for
+file names and other file-like objects.
+
+inputFile : .will file (name, bytes-like object or binary file-like object)
+    """
+
+    if isinstance(inputFile, (bytes, bytearray, memoryview, mmap.mmap)):
+        return memoryview(inputFile).cast('B')
+    if isinstance(inputFile, io.BytesIO):
+        return inputFile.getbuffer()
+
+    return None
+
+
+def openWillArchive(inputFile):
+    """ openWillArchive(inputFile)
+Returns the ZipFile of the .will archive, which can be given by its name, as a
+binary file-like object or as a bytes-like object (read in place, see
+BufferFile).
+
+inputFile : .will file (name, bytes-like object or binary file-like object)
+    """
+
+    buffer = archiveBuffer(inputFile)
+
+    return ZipFile(BufferFile(buffer) if buffer is not None else inputFile)
+
+
+def listWillProtobuffs(inputFile):
+    """ listWillProtobuffs(inputFile)
+Returns the names of the sections/media/*.protobuf members (one per page) of
+the will file, in the order they are stored in the archive. The tools writing
+one file per page (file_00, file_01...) number the pages in this order.
+
+inputFile : .will file (name, bytes-like object or binary file-like object)
+    """
+
+    with openWillArchive(inputFile) as input_zip:
+        return fnmatch.filter(input_zip.namelist(), PAGES_PATTERN)
+
+
 def readWillProtobuff(inputFile):
     """ readWillProtobuff(inputFile)
 Reads the content of the paths.protobuf in the will filesystem at the file
@@ -319,13 +1518,552 @@ It uncompresses the will file (yes, its a simple zip file) and reads the
 content of the file at sections/media/paths.protobuf. It them returns the whole
 bytes buffer 
 
-inputFile : string with the .will file.
+inputFile : string with the .will file (or its bytes, or a binary file-like
+            object, see openWillArchive)
     """
 
-    input_zip=ZipFile(inputFile)
-    
-    return input_zip.read('sections/media/paths.protobuf')
+    with stageTimer('read'):
+        with openWillArchive(inputFile) as input_zip:
+            return input_zip.read(PATHS_MEMBER)
+
+
+def mapWillProtobuff(inputFile, member=PATHS_MEMBER):
+    """ mapWillProtobuff(inputFile, member=PATHS_MEMBER)
+Returns a memoryview of the member data taken straight from a read-only mmap of
+the archive, or from the archive itself when it is in memory (see
+archiveBuffer), without copying it. Returns None when the member is compressed
+or encrypted (it has to be inflated, see iterWillMessages), or when the archive
+is a file-like object that is not in memory.
+
+inputFile : .will file (name, bytes-like object or binary file-like object)
+member    : name of the protobuf member in the archive
+    """
+
+    buffer = archiveBuffer(inputFile)
+    if buffer is None and not isinstance(inputFile, (str, os.PathLike)):
+        return None
+
+    with openWillArchive(inputFile) as input_zip:
+        info = input_zip.getinfo(member)
+    if info.compress_type != ZIP_STORED or info.flag_bits & 0x1 or info.file_size == 0:
+        return None
+
+    if buffer is None:
+        with open(inputFile, 'rb') as f:
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    header = ZIP_LOCAL_HEADER.unpack_from(buffer, info.header_offset)
+    if header[0] != b'PK\x03\x04':
+        raise ValueError(f'Bad zip local header for {member}.')
+    dataStart = info.header_offset + ZIP_LOCAL_HEADER.size + header[10] + header[11]
+
+    return buffer[dataStart:dataStart+info.file_size]
+
+
+def iterStreamMessages(f, chunkSize=STREAM_CHUNK_SIZE):
+    """ iterStreamMessages(f, chunkSize=STREAM_CHUNK_SIZE)
+Generator that yields the bytes of each message packet read from the binary
+file-like object f, chunkSize bytes at a time. The length prefixes are parsed
+across chunk boundaries, so only the current chunk and the current message are
+kept in memory.
+
+f         : binary file-like object, e.g. ZipFile.open(PATHS_MEMBER)
+chunkSize : number of bytes read at a time
+    """
+
+    buffer = b''
+    buffPos = 0
+    while True:
+        # complete length prefix and message in the buffer?
+        prefixEnd = buffPos
+        while prefixEnd < len(buffer) and buffer[prefixEnd] & 0x80:
+            prefixEnd += 1
+        if prefixEnd < len(buffer):
+            messageLength, messageStart = decodeVarint32(buffer, buffPos)
+            if messageStart + messageLength <= len(buffer):
+                buffPos = messageStart + messageLength
+                yield buffer[messageStart:buffPos]
+                continue
+            needed = messageStart + messageLength - len(buffer)
+        else:
+            needed = 1
+
+        chunk = f.read(max(chunkSize, needed))
+        if not chunk:
+            if buffPos < len(buffer):
+                raise ValueError('Truncated message at the end of the stream.')
+            return
+        buffer = buffer[buffPos:] + chunk
+        buffPos = 0
+
+
+def iterWillMessages(inputFile, member=PATHS_MEMBER, chunkSize=STREAM_CHUNK_SIZE):
+    """ iterWillMessages(inputFile, member=PATHS_MEMBER, chunkSize=STREAM_CHUNK_SIZE)
+Generator that yields the message packets of a protobuf member of the .will
+file without reading the whole member first. Stored members are parsed
+straight off an mmap of the archive (the messages are memoryviews), compressed
+ones are inflated chunk by chunk through ZipFile.open. Either way the memory
+used is bounded by the largest message, not by the document.
+
+inputFile : string with the .will file (or its bytes, which are parsed in
+            place like a mapped file, or a binary file-like object, which is
+            always streamed unless it is an io.BytesIO)
+member    : name of the protobuf member in the archive
+chunkSize : number of bytes inflated at a time
+    """
+
+    buffer = mapWillProtobuff(inputFile, member)
+    if buffer is not None:
+        yield from iter_messages(buffer)
+        return
+
+    with openWillArchive(inputFile) as input_zip:
+        with input_zip.open(member) as f:
+            yield from iterStreamMessages(f, chunkSize)
+
+
+
+def decodeWillStrokeSet(inputFile, cache=None, protobufHash=None):
+    """ decodeWillStrokeSet(inputFile, cache=None, protobufHash=None)
+Returns the StrokeSet of the paths.protobuf of the .will file. With a cache,
+the decoded set is stored in it in binary form (see StrokeSet.save) and later
+calls just map it back instead of decoding the file again.
+
+inputFile    : string with the .will file.
+cache        : will_cache.ConversionCache, or None
+protobufHash : hash of the paths.protobuf if the caller already computed it
+               (see will_cache.hashWillProtobuff), or None
+    """
+
+    if cache is None:
+        return decodeStrokeSet(readWillProtobuff(inputFile))
+
+    if protobufHash is None:
+        from will_cache import hashWillProtobuff
+        protobufHash = hashWillProtobuff(inputFile, PATHS_MEMBER)
+    cacheKey = cache.key(protobufHash, {'format': 'strokes', 'version': STROKESET_VERSION})
+    entry = cache.get(cacheKey, '.strokes')
+    if entry is not None:
+        try:
+            return StrokeSet.load(entry[0])
+        except OSError:
+            # evicted by another process since get
+            cache.miss()
+
+    strokes = decodeStrokeSet(readWillProtobuff(inputFile))
+    cache.store(cacheKey, lambda f: f.write(strokes.toBytes()), {'strokes': len(strokes), 'points': strokes.numPoints}, '.strokes')
+
+    return strokes
+
+
+def svgBoundingBox(x, y, width, offsets, simplifier=None, outline=False):
+    """ svgBoundingBox(x, y, width, offsets, simplifier=None, outline=False)
+Returns the (minX, minY, maxX, maxY) that SVGWriter finds for the decoded
+strokes (see decodeMessageArrays), with a few numpy passes over all of them,
+so the header of a document can be written before its strokes are converted
+(see streamSVG). The points are simplified and widened by half the width of
+the points as streamSVG does, so the box is the same. Requires numpy.
+
+x, y, width, offsets : decoded points of the strokes
+simplifier           : will_simplify.StrokeSimplifier of the conversion, or
+                       None (only its tolerance is used, it does not count
+                       these points)
+outline              : the strokes are written as filled outlines
+    """
+
+    importNumpy()
+
+    if simplifier is not None:
+        from will_simplify import simplifyMask
+        keep = simplifyMask(x, y, offsets, simplifier.tolerance)
+        x, y, width = x[keep], y[keep], width[keep]
+        offsets = np.concatenate(([0], np.cumsum(keep)))[offsets]
 
+    minX, maxX = segmentedBounds(x, offsets)
+    minY, maxY = segmentedBounds(y, offsets)
+    if outline:
+        # the outline is at most half a width away from the points
+        margins = 0.5*(segmentedBounds(width, offsets)[1]*STROKE_WIDTH_SCALE)
+        minX, maxX, minY, maxY = minX - margins, maxX + margins, minY - margins, maxY + margins
+    nonEmpty = np.diff(offsets) > 0
+    if not np.any(nonEmpty):
+        return (float('inf'), float('inf'), float('-inf'), float('-inf'))
+
+    return (float(minX[nonEmpty].min()), float(minY[nonEmpty].min()), float(maxX[nonEmpty].max()), float(maxY[nonEmpty].max()))
+
+
+def decodeMessageArrays(messages):
+    """ decodeMessageArrays(messages)
+Decodes the list of message packets together (see decodeStrokeArrays) and
+returns their (x, y, width, offsets, lineWidths, precisions), precisions being
+the list of the decimal precision of each stroke. Requires numpy.
+
+messages : list of message packets
+    """
+
+    values = [decodeStrokeFields(messageBytes, GEOMETRY_FIELDS) for messageBytes in messages]
+    precisions = [value['decimalPrecision'] for value in values]
+    x, y, width, offsets, lineWidths = decodeStrokeArrays(precisions, [value['points'] for value in values],
+                                                          [value['strokeWidths'] for value in values])
+    if STATS is not None:
+        STATS.count('messages', len(messages))
+        STATS.count('bytes', sum(len(messageBytes) for messageBytes in messages))
+        STATS.count('points', int(offsets[-1]))
+
+    return (x, y, width, offsets, lineWidths, precisions)
+
+
+def splitStrokeArrays(x, y, width, offsets, lineWidths, precisions, asArrays=False):
+    """ splitStrokeArrays(x, y, width, offsets, lineWidths, precisions, asArrays=False)
+Returns the list of the (x, y, lineWidth, precision) of each stroke of the
+arrays returned by decodeMessageArrays, the same as
+decodeMessagePacket(messageBytes, asArrays, withPrecision=True) returns for
+each of them.
+    """
+
+    bounds = offsets.tolist()
+    if asArrays:
+        return [(x[start:stop], y[start:stop], width[start:stop], precision)
+                for start, stop, precision in zip(bounds, bounds[1:], precisions)]
+
+    x, y = x.tolist(), y.tolist()
+    return [(x[start:stop], y[start:stop], lineWidth, precision)
+            for start, stop, lineWidth, precision in zip(bounds, bounds[1:], lineWidths.tolist(), precisions)]
+
+
+def decodeMessageBatch(messages, asArrays=False):
+    """ decodeMessageBatch(messages, asArrays=False)
+Decodes the list of message packets together and returns the list of their
+(x, y, lineWidth, precision) (see decodeMessageArrays and splitStrokeArrays).
+Requires numpy.
+
+messages : list of message packets
+asArrays : x, y and the widths of the points as numpy arrays (see
+           decodeMessagePacket)
+    """
+
+    importNumpy()
+
+    return splitStrokeArrays(*decodeMessageArrays(messages), asArrays)
+
+
+def decodeMessages(messages, asArrays=False):
+    """ decodeMessages(messages, asArrays=False)
+Generator that yields the (x, y, lineWidth, precision) of each message of the
+iterable messages (see decodeMessagePacket), timing the decode stage. The
+messages are decoded DECODE_BATCH_SIZE at a time with the vectorized decoder
+(see decodeMessageBatch) once numpy is imported, which happens after the first
+NUMPY_DECODE_BYTES of messages, so small documents are decoded in python
+without paying for the import. With asArrays, x, y and the widths of the points
+are numpy arrays (as needed by the outline mode of SVGWriter).
+    """
+
+    messages = iter(messages)
+    numBytes = 0
+    while True:
+        batch = list(itertools.islice(messages, DECODE_BATCH_SIZE))
+        if not batch:
+            return
+        vectorized = not VERBOSE and (asArrays or np is not None or numBytes >= NUMPY_DECODE_BYTES) and importNumpy() is not None
+        with stageTimer('decode'):
+            if vectorized:
+                strokes = decodeMessageBatch(batch, asArrays)
+            else:
+                strokes = [decodeMessagePacket(messageBytes, asArrays, withPrecision=True) for messageBytes in batch]
+                numBytes += sum(len(messageBytes) for messageBytes in batch)
+        yield from strokes
+
+
+def simplifyStrokes(strokes, simplifier):
+    """ simplifyStrokes(strokes, simplifier)
+Generator that yields the (x, y, lineWidth, ...) of the strokes simplified by
+simplifier (a will_simplify.StrokeSimplifier), batchSize strokes at a time,
+timing the simplify stage and counting the removed points.
+    """
+
+    strokes = iter(strokes)
+    while True:
+        batch = list(itertools.islice(strokes, simplifier.batchSize))
+        if not batch:
+            return
+        numRemoved = simplifier.numRemoved
+        with stageTimer('simplify'):
+            batch = simplifier.simplifyBatch(batch)
+        if STATS is not None:
+            STATS.count('points_removed', simplifier.numRemoved - numRemoved)
+        yield from batch
+
+
+def streamSVG(inputFile, f, poly=False, simplifier=None, fit=None, relative=False, outline=False, boundingBox=None, decodeFirst=False):
+    """ streamSVG(inputFile, f, poly=False, simplifier=None, fit=None, relative=False, outline=False, boundingBox=None, decodeFirst=False)
+Converts the .will file to SVG, streaming each stroke from the archive (see
+iterWillMessages) to the text file-like object f as it is decoded. Nothing is
+written to the filesystem, so the .will file can be given as bytes (e.g. an
+upload), which are read in place: a stored paths.protobuf is decoded from a
+memoryview of them, without any copy. Returns the number of strokes and
+points written.
+On outputs that are not seekable, SVGWriter keeps the paths until the end
+unless the bounding box is known: given, or with decodeFirst, where all the
+strokes are decoded together before anything is written and the box is
+computed from them (see svgBoundingBox), so the paths are written as they are
+converted.
+
+inputFile   : .will file (name, bytes-like object or binary file-like object)
+f           : text file-like object
+poly        : create polygonal paths instead of Bezier curves
+simplifier  : will_simplify.StrokeSimplifier applied to the strokes, or None
+fit         : fit the strokes with Bezier curves with this tolerance, or None
+relative    : use relative path commands
+outline     : write the strokes as filled outlines
+boundingBox : bounding box of the header (see SVGWriter), or None
+decodeFirst : decode the strokes and compute the bounding box before writing
+              (requires numpy)
+    """
+
+    messages = iterWillMessages(inputFile)
+    if STATS is not None:
+        messages = STATS.timeIterator('read', messages)
+    if decodeFirst:
+        importNumpy()
+        messages = list(messages)
+        with stageTimer('decode'):
+            x, y, width, offsets, lineWidths, precisions = decodeMessageArrays(messages)
+        with stageTimer('bbox'):
+            boundingBox = svgBoundingBox(x, y, width, offsets, simplifier, outline)
+        strokes = splitStrokeArrays(x, y, width, offsets, lineWidths, precisions, outline)
+    else:
+        strokes = decodeMessages(messages, outline)
+
+    numStrokes = 0
+    numPoints = 0
+    with SVGWriter(f, poly, fit, relative, boundingBox, outline) as writer:
+        if simplifier is not None:
+            strokes = simplifyStrokes(strokes, simplifier)
+        for stroke in strokes:
+            with stageTimer('svg'):
+                writer.writeStroke(*stroke)
+            numStrokes += 1
+            numPoints += len(stroke[0])
+
+    return (numStrokes, numPoints)
+
+
+def convertBytes(data, poly=False, simplifier=None, fit=None, relative=False, outline=False):
+    """ convertBytes(data, poly=False, simplifier=None, fit=None, relative=False, outline=False)
+Returns the SVG document of the .will file as a string (see streamSVG).
+
+data : .will file (bytes-like object or binary file-like object, or name)
+poly, simplifier, fit, relative, outline : see streamSVG
+    """
+
+    f = io.StringIO()
+    streamSVG(data, f, poly, simplifier, fit, relative, outline)
+
+    return f.getvalue()
+
+
+def convertFile(inputFile, outputFile=None, poly=False, cache=None, simplifier=None, fit=None, relative=False, outline=False):
+    """ convertFile(inputFile, outputFile=None, poly=False, cache=None, simplifier=None, fit=None, relative=False, outline=False)
+Converts the .will file inputFile to the SVG file outputFile, streaming each
+stroke from the archive to the output as it is decoded (see streamSVG).
+The coordinates are written at the decimal precision of each stroke.
+Returns the number of strokes and points written.
+With a cache, the SVG is copied from it when the paths.protobuf of the file
+and the options were already converted, and stored in it otherwise.
+
+inputFile  : string with the .will file.
+outputFile : string with the .svg file (default: inputFile with .svg extension)
+poly       : create polygonal paths instead of Bezier curves
+cache      : will_cache.ConversionCache, or None
+simplifier : will_simplify.StrokeSimplifier applied to the strokes before
+             writing them, or None (its counts are updated, also on cache hits)
+fit        : fit the strokes with Bezier curves with this tolerance (see
+             SVGWriter), or None
+relative   : use relative path commands
+outline    : write the strokes as filled outlines following the width of the
+             pen (see SVGWriter)
+    """
+
+    if outputFile is None:
+        outputFile = os.path.splitext(inputFile)[0] + '.svg'
+
+    if cache is not None:
+        from will_cache import hashWillProtobuff
+        options = {'poly': poly}
+        if simplifier is not None:
+            options['simplify'] = simplifier.tolerance
+        if fit is not None:
+            options['fit'] = fit
+        if relative:
+            options['relative'] = True
+        if outline:
+            options['outline'] = True
+        cacheKey = cache.key(hashWillProtobuff(inputFile, PATHS_MEMBER), options)
+        metadata = cache.copyTo(cacheKey, outputFile)
+        if metadata is not None:
+            if simplifier is not None:
+                simplifier.count(metadata['points'] + metadata['removed'], metadata['removed'])
+            return (metadata['strokes'], metadata['points'])
+
+    numRemoved = simplifier.numRemoved if simplifier is not None else 0
+    with open(outputFile, 'wt') as f:
+        numStrokes, numPoints = streamSVG(inputFile, f, poly, simplifier, fit, relative, outline)
+
+    if cache is not None:
+        metadata = {'strokes': numStrokes, 'points': numPoints}
+        if simplifier is not None:
+            metadata['removed'] = simplifier.numRemoved - numRemoved
+        cache.put(cacheKey, outputFile, metadata)
+
+    return (numStrokes, numPoints)
+
+
+
+def convertRegion(inputFile, outputFile, region, poly=False, cache=None, simplifier=None, fit=None, relative=False, outline=False):
+    """ convertRegion(inputFile, outputFile, region, poly=False, cache=None, simplifier=None, fit=None, relative=False, outline=False)
+Converts only the strokes of the .will file inputFile whose bounding box
+intersects region to the SVG file outputFile, whose viewBox is the region (the
+strokes are not cut, the viewer clips them). The strokes are found with the
+spatial index of will_index and written from the StrokeSet the index was built
+from, so nothing is decoded twice. With a cache, the decoded strokes and the
+index are kept in it (see will_index.loadStrokeIndex), so other regions of the
+same file are converted without decoding it again. Returns the number of
+strokes and points written.
+
+inputFile  : string with the .will file.
+outputFile : string with the .svg file
+region     : (minX, minY, maxX, maxY) of the region
+poly       : create polygonal paths instead of Bezier curves
+cache      : will_cache.ConversionCache, or None
+simplifier : will_simplify.StrokeSimplifier applied to the strokes, or None
+fit        : fit the strokes with Bezier curves with this tolerance, or None
+relative   : use relative path commands
+outline    : write the strokes as filled outlines
+    """
+
+    from will_index import loadStrokeIndex
+    importNumpy()
+
+    with stageTimer('index'):
+        strokeSet, index = loadStrokeIndex(inputFile, cache)
+        selected = index.query(*region)
+
+    # the widths of the points for the outlines, else the mean linewidth; the
+    # sets written before the precision was stored give None (full floats)
+    lineWidths = None if outline else strokeSet.lineWidths()
+    precisions = [None]*len(strokeSet) if strokeSet.precision is None else strokeSet.precision.tolist()
+
+    def selectedStrokes():
+        for i in selected:
+            x, y, width = strokeSet[i]
+            if precisions[i] is not None:
+                # back from float32 to the decoded values, which are integers
+                # divided by 10**precision
+                factor = 10.0**precisions[i]
+                x = np.rint(x*np.float64(factor))/factor
+                y = np.rint(y*np.float64(factor))/factor
+            if outline:
+                yield (x, y, width.astype(np.float64), precisions[i])
+            else:
+                yield (x.tolist(), y.tolist(), float(lineWidths[i]), precisions[i])
+
+    numStrokes = 0
+    numPoints = 0
+    with open(outputFile, 'wt') as f:
+        with SVGWriter(f, poly, fit, relative, region, outline) as writer:
+            strokes = selectedStrokes()
+            if simplifier is not None:
+                strokes = simplifyStrokes(strokes, simplifier)
+            for stroke in strokes:
+                with stageTimer('svg'):
+                    writer.writeStroke(*stroke)
+                numStrokes += 1
+                numPoints += len(stroke[0])
+
+    return (numStrokes, numPoints)
+
+
+
+def convertFileIncremental(inputFile, outputFile=None, poly=False, simplifier=None, fit=None, relative=False, outline=False):
+    """ convertFileIncremental(inputFile, outputFile=None, poly=False, simplifier=None, fit=None, relative=False, outline=False)
+Converts the .will file inputFile to the SVG file outputFile, reusing the
+previous conversion when the strokes were only appended to. The byte offset,
+stroke count and hash of the converted part of paths.protobuf are kept in
+outputFile + '.state'. If the new paths.protobuf starts with that same prefix,
+only the messages after it are decoded and their paths appended to the
+existing SVG (the header is patched with the new bounding box); otherwise the
+whole file is converted. Returns (numStrokes, numPoints, numNewStrokes).
+
+inputFile  : string with the .will file.
+outputFile : string with the .svg file (default: inputFile with .svg extension)
+poly       : create polygonal paths instead of Bezier curves
+simplifier : will_simplify.StrokeSimplifier applied to the new strokes, or None
+fit        : fit the strokes with Bezier curves with this tolerance, or None
+relative   : use relative path commands
+outline    : write the strokes as filled outlines
+    """
+
+    if outputFile is None:
+        outputFile = os.path.splitext(inputFile)[0] + '.svg'
+    tolerance = simplifier.tolerance if simplifier is not None else None
+    stateFile = outputFile + '.state'
+
+    buffer = readWillProtobuff(inputFile)
+
+    try:
+        with open(stateFile) as f:
+            state = json.load(f)
+        valid = (state['version'] == INCREMENTAL_STATE_VERSION and state['poly'] == poly
+                 and state['simplify'] == tolerance
+                 and state['fit'] == fit
+                 and state['relative'] == relative
+                 and state['outline'] == outline
+                 and state['offset'] <= len(buffer)
+                 and os.path.getsize(outputFile) == state['svgSize']
+                 and hashlib.sha256(buffer[:state['offset']]).hexdigest() == state['prefixHash'])
+    except (OSError, ValueError, KeyError):
+        valid = False
+
+    if valid:
+        numStrokes, numPoints, offset = state['strokes'], state['points'], state['offset']
+        if offset == len(buffer):
+            return (numStrokes, numPoints, 0)
+        f = open(outputFile, 'r+')
+        writer = SVGWriter.resume(f, state['boundingBox'], poly, fit, relative, outline)
+    else:
+        numStrokes, numPoints, offset = 0, 0, 0
+        f = open(outputFile, 'wt')
+        writer = SVGWriter(f, poly, fit, relative, outline=outline)
+
+    numNewStrokes = 0
+    with f:
+        with writer:
+            strokes = decodeMessages(iter_messages(buffer[offset:]), outline)
+            if simplifier is not None:
+                strokes = simplifyStrokes(strokes, simplifier)
+            for stroke in strokes:
+                writer.writeStroke(*stroke)
+                numNewStrokes += 1
+                numPoints += len(stroke[0])
+    numStrokes += numNewStrokes
+
+    state = {
+        'version': INCREMENTAL_STATE_VERSION,
+        'poly': poly,
+        'simplify': tolerance,
+        'fit': fit,
+        'relative': relative,
+        'outline': outline,
+        'offset': len(buffer),
+        'strokes': numStrokes,
+        'points': numPoints,
+        'prefixHash': hashlib.sha256(buffer).hexdigest(),
+        'boundingBox': writer.boundingBox(),
+        'svgSize': os.path.getsize(outputFile),
+    }
+    with open(stateFile, 'wt') as f:
+        json.dump(state, f)
+
+    return (numStrokes, numPoints, numNewStrokes)
 
 
 
@@ -334,25 +2072,84 @@ if __name__=='__main__':
     parser = argparse.ArgumentParser(description='Convert Wacom WILL file to SVG.\n\nNote: The SVG will be overitten without warning.',formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument('-p', '--poly', action='store_true', default=False, help='create polygonal path instead of Bezier curve')
     parser.add_argument('-v', '--verbose', action='store_true', default=False, help='show verbose debugging info')
-    parser.add_argument( dest='filename',default=False, help="name of the WILL file with or without the extension", type=str)
+    parser.add_argument('--plot', action='store_true', default=False, help='show a matplotlib preview of the strokes')
+    parser.add_argument('--plot-file', default=None, help='save a matplotlib plot of the strokes to PLOT_FILE (e.g. preview.png)')
+    parser.add_argument('--stats', default=None, help='write counters and stage timings to STATS (JSON, or cProfile/pstats format if it ends in .prof or .pstats)')
+    parser.add_argument('--profile', default=None, help='run the conversion under cProfile and write the profile to PROFILE')
+    parser.add_argument('--cache', default=None, help='directory of the conversion cache (reuses the SVG when the strokes did not change)')
+    parser.add_argument('--export-strokes', default=None, help='also write the decoded strokes to EXPORT_STROKES in binary form (see StrokeSet.save)')
+    parser.add_argument('-s', '--simplify', type=float, default=None, metavar='TOL', help='simplify the strokes (Ramer-Douglas-Peucker): remove the points closer than TOL to the simplified stroke, and report how many')
+    parser.add_argument('-f', '--fit', type=float, default=None, metavar='TOL', help='fit the strokes with cubic Bezier curves passing within TOL of every sample (instead of using the samples as control points)')
+    parser.add_argument('-r', '--relative', action='store_true', default=False, help='use relative path commands (shorter numbers)')
+    parser.add_argument('-o', '--outline', action='store_true', default=False, help='draw the strokes as filled outlines that follow the pen pressure (ignores -p and -f)')
+    parser.add_argument('-i', '--incremental', action='store_true', default=False, help='only convert the strokes appended since the last conversion (state kept in file.svg.state)')
+    parser.add_argument('--crop', type=float, nargs=4, default=None, metavar=('MINX', 'MINY', 'MAXX', 'MAXY'), help='only convert the strokes that cross the rectangle, which becomes the viewBox\n(found with a spatial index of the strokes, kept in the cache with --cache)')
+    parser.add_argument('--output', default=None, help='name of the SVG file (default: the name of the WILL file with the .svg extension), - for stdout')
+    parser.add_argument( dest='filename',default=False, help="name of the WILL file with or without the extension, - to read it from stdin\n(the SVG is then written to stdout)", type=str)
 
     try:
         args, unknownargs = parser.parse_known_args()
 
         VERBOSE = args.verbose
         fileName = args.filename
+        if fileName.endswith('.will'):
+            fileName = fileName[:-len('.will')]
+        inputFile = sys.stdin.buffer.read() if fileName == '-' else fileName + '.will'
+        outputFile = args.output or ('-' if fileName == '-' else fileName + '.svg')
+        if (fileName == '-' or outputFile == '-') and (args.crop or args.incremental or args.cache or args.plot or args.plot_file or args.export_strokes):
+            parser.error('the options of files (--crop, -i, --cache, --plot, --plot-file, --export-strokes) need named input and output files')
+        option = missingNumpy([('--outline', args.outline), ('--fit', args.fit is not None), ('--simplify', args.simplify is not None),
+                               ('--crop', args.crop), ('--export-strokes', args.export_strokes)])
+        if option is not None:
+            parser.error(f'{option} requires numpy, which is not installed')
+        if args.stats:
+            enableStats()
+        if args.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
         
-        buffer = readWillProtobuff(fileName + '.will')
-     
-        (xData, yData, lineData) = processBuffer(buffer)
-     
-        plotXYLineData(xData, yData, lineData)
-        poly=True
-        svgStr = XYLineDataToSVG(xData, yData, lineData, args.poly)
-        
-        with open(fileName + '.svg','wt') as f:
-            f.write(svgStr)
+        simplifier = None
+        if args.simplify is not None:
+            from will_simplify import StrokeSimplifier
+            simplifier = StrokeSimplifier(args.simplify)
+
+        if args.plot or args.plot_file:
+            buffer = readWillProtobuff(inputFile)
+         
+            (xData, yData, lineData) = processBuffer(buffer)
+         
+            plotXYLineData(xData, yData, lineData, args.plot_file, args.plot)
+
+        cache = None
+        if args.cache:
+            from will_cache import ConversionCache
+            cache = ConversionCache(args.cache)
+
+        if args.crop:
+            convertRegion(inputFile, outputFile, args.crop, args.poly, cache, simplifier, args.fit, args.relative, args.outline)
+        elif args.incremental:
+            convertFileIncremental(inputFile, outputFile, args.poly, simplifier, args.fit, args.relative, args.outline)
+        elif outputFile == '-':
+            streamSVG(inputFile, sys.stdout, args.poly, simplifier, args.fit, args.relative, args.outline)
+        else:
+            convertFile(inputFile, outputFile, args.poly, cache, simplifier, args.fit, args.relative, args.outline)
+
+        if simplifier is not None:
+            print(f'{fileName}: {simplifier.report()}', file=sys.stderr if outputFile == '-' else sys.stdout)
+
+        if args.export_strokes:
+            decodeStrokeSet(readWillProtobuff(inputFile)).save(args.export_strokes)
+
+        if args.profile:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if args.stats:
+            if os.path.splitext(args.stats)[1] in ('.prof', '.pstats'):
+                STATS.dumpStats(args.stats)
+            else:
+                STATS.writeJSON(args.stats)
         
-    except BaseException as e:
-        pass
-    
\ No newline at end of file
+    except Exception as e:
+        print(f'{fileName}: {type(e).__name__}: {e}', file=sys.stderr)
+        sys.exit(1)
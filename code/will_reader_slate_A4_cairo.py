@@ -5,16 +5,15 @@ Created on Fri Aug 10 11:09:11 2018
 
 @author: ninguem
 """
-from matplotlib import pyplot as plt
 from zipfile import ZipFile
-from google.protobuf.internal.decoder import _DecodeVarint32
-from google.protobuf.internal.decoder import wire_format
-from google.protobuf.internal.decoder import struct
+from will_wire import decodeVarint32, decodeFloat, decodeLengthDelimited, decodePackedVarints, unpackTag
+import will_reader
+import will_reader_slate_A4
 import os
 import sys
-import fnmatch
+import argparse
 from cairosvg import svg2svg
-from subprocess import run
+from will_ipe import writeIPE
 
 # sudo apt-get install   python3-matplotlib    python3-tk   cairosvg
 
@@ -61,32 +60,46 @@ yData    : array with arrays of y coordinates
 lineData : array with arrays of lineWhidths
     """
 
+    from matplotlib import pyplot as plt    # imported only when plotting
+
     for x, y, lineWidth in zip(xData, yData, lineData):
         plt.plot(x,[-y for y in y],'k', linewidth=(lineWidth**5)/20)
     
     plt.axis('equal')
 
 
-def XYLineDataToSVG(xData, yData, lineData):
-    """ XYLineDataToSVG(xData, yData, lineData)
+def pageBoundingBox(boxes):
+    """ pageBoundingBox(boxes)
+Returns the (minX, minY, maxX, maxY) of a page, reduced from the bounding boxes
+of its strokes (see decodeMessagePacket), without looking at the points.
+(0, 0, 0, 0) if there is no point.
+
+boxes : array with the bounding box of each stroke (None for the empty ones)
+    """
+
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return (0, 0, 0, 0)
+
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes), max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+
+def XYLineDataToSVG(xData, yData, lineData, boundingBox=None):
+    """ XYLineDataToSVG(xData, yData, lineData, boundingBox=None)
 Generates the SVG spline data for the array of arrays xData, yData and lineData 
 Currently it ignores the linewidth so it generates constant width paths
 
-xData    : array with arrays of x coordinates
-yData    : array with arrays of y coordinates
-lineData : array with arrays of lineWhidths
-skips    : number of spline control points to skip
+xData       : array with arrays of x coordinates
+yData       : array with arrays of y coordinates
+lineData    : array with arrays of lineWhidths
+boundingBox : (minX, minY, maxX, maxY) of the page, see pageBoundingBox
+              (default: computed from the points)
 
 TODO: Take linewidhts into consideration    
     """
 
     svgStr = f''
     
-    minX = 10000
-    minY = 10000
-    maxX = -10000
-    maxY = -10000
-    
     for arrayX, arrayY in zip(xData, yData):
         svgStr += f'<path stroke="black" fill="none" d="M{arrayX[0]},{arrayY[0]} '
         idxr = range(len(arrayX))
@@ -95,16 +108,15 @@ TODO: Take linewidhts into consideration
             
             svgStr += f'{x} {y},'
     
-            minX = x if minX>x else minX
-            minY = y if minY>y else minY
-            maxX = x if maxX<x else maxX
-            maxY = y if maxY<y else maxY
-    
         svgStr = svgStr[:-1] + '"/>\n'
     
+    if boundingBox is None:
+        boundingBox = pageBoundingBox([strokeBoundingBox(arrayX, arrayY) for arrayX, arrayY in zip(xData, yData)])
+    minX, minY, maxX, maxY = boundingBox
+    
     svgWidth = maxX-minX
     svgHeight = maxY-minY
-    svgStr = f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{svgWidth}mm" height="{svgHeight}mm" viewBox="{minX} {minY} {maxX} {maxY}"> ' + svgStr + '</svg>'
+    svgStr = f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{svgWidth}mm" height="{svgHeight}mm" viewBox="{minX} {minY} {svgWidth} {svgHeight}"> ' + svgStr + '</svg>'
         
     return svgStr
 
@@ -137,14 +149,7 @@ the array and returns an array of signed integers.
 strBytes : array to unpack
     """
 
-    values = []
-    
-    nextPos = 0
-    while nextPos < len(strBytes):
-        value, nextPos = _DecodeVarint32(strBytes, nextPos)
-        values.append(value)
-        
-    return [unzigzag(v) for v in values]
+    return [unzigzag(v) for v in decodePackedVarints(strBytes)]
         
 
 
@@ -155,10 +160,23 @@ strBytes : array to unpack
 #
     
 
+def strokeBoundingBox(x, y):
+    """ strokeBoundingBox(x, y)
+Returns the (minX, minY, maxX, maxY) of the points of a stroke, or None if it
+has no point.
+    """
+
+    if not x:
+        return None
+
+    return (min(x), min(y), max(x), max(y))
+
+
 def decodeMessagePacket(messageBytes):
     """ decodeMessagePacket(messageBytes):
     Decodes the message package in the WILL format and returns the vector of
-    location ponts x, y and the linewidths.
+    location ponts x, y, the linewidths and the bounding box of the stroke
+    (computed once here, see strokeBoundingBox).
     It assumes that the message is in the format specified in the WILL file format
     form Wacom. 
     Future versions might break this code, since its based on the format from 2018.
@@ -171,11 +189,10 @@ def decodeMessagePacket(messageBytes):
     
     # startParameter  [FLOAT]
     #  (varint header)
-    msgVarintIdentifier, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    field, wireType = wire_format.UnpackTag(msgVarintIdentifier)
+    msgVarintIdentifier, nextPos = decodeVarint32(messageBytes, nextPos)
+    field, wireType = unpackTag(msgVarintIdentifier)
     #  value
-    startParameter =struct.unpack('f',messageBytes[nextPos:nextPos+4])[0]
-    nextPos += 4
+    startParameter, nextPos = decodeFloat(messageBytes, nextPos)
 
     debugPrint(f'field: {field}, wire type:{wireType}')
     debugPrint(f'startParameter: {startParameter}')
@@ -183,11 +200,10 @@ def decodeMessagePacket(messageBytes):
 
     # stopParameter  [FLOAT]
     #  (varint header)
-    msgVarintIdentifier, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    field, wireType = wire_format.UnpackTag(msgVarintIdentifier)
+    msgVarintIdentifier, nextPos = decodeVarint32(messageBytes, nextPos)
+    field, wireType = unpackTag(msgVarintIdentifier)
     #  value
-    stopParameter = struct.unpack('f',messageBytes[nextPos:nextPos+4])[0]
-    nextPos += 4
+    stopParameter, nextPos = decodeFloat(messageBytes, nextPos)
 
     debugPrint(f'field: {field}, wire type:{wireType}')
     debugPrint(f'stopParameter: {stopParameter}')
@@ -195,10 +211,10 @@ def decodeMessagePacket(messageBytes):
     
     # decimalPrecision  [VARIANT]
     #  (varint header)
-    msgVarintIdentifier, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    field, wireType = wire_format.UnpackTag(msgVarintIdentifier)
+    msgVarintIdentifier, nextPos = decodeVarint32(messageBytes, nextPos)
+    field, wireType = unpackTag(msgVarintIdentifier)
     #  value
-    decimalPrecision, nextPos = _DecodeVarint32(messageBytes, nextPos)
+    decimalPrecision, nextPos = decodeVarint32(messageBytes, nextPos)
 
     debugPrint(f'field: {field}, wire type:{wireType}')
     debugPrint(f'decimalPrecision: {decimalPrecision}')
@@ -206,12 +222,11 @@ def decodeMessagePacket(messageBytes):
 
     # x,y sequence  [BYTE STRING]
     #  (varint header)
-    msgVarintIdentifier, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    field, wireType = wire_format.UnpackTag(msgVarintIdentifier)
+    msgVarintIdentifier, nextPos = decodeVarint32(messageBytes, nextPos)
+    field, wireType = unpackTag(msgVarintIdentifier)
     #  value
-    strLen, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    xyBytes = messageBytes[nextPos:nextPos+strLen]
-    nextPos += strLen
+    xyBytes, nextPos = decodeLengthDelimited(messageBytes, nextPos)
+    strLen = len(xyBytes)
     xyList = decodeVarintArray(xyBytes)
     
     dx = xyList[0::2]
@@ -232,12 +247,11 @@ def decodeMessagePacket(messageBytes):
 
     # stroke width  [BYTE STRING]
     #  (varint header)
-    msgVarintIdentifier, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    field, wireType = wire_format.UnpackTag(msgVarintIdentifier)
+    msgVarintIdentifier, nextPos = decodeVarint32(messageBytes, nextPos)
+    field, wireType = unpackTag(msgVarintIdentifier)
     #  value
-    strLen, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    strokeWidthBytes = messageBytes[nextPos:nextPos+strLen]
-    nextPos += strLen
+    strokeWidthBytes, nextPos = decodeLengthDelimited(messageBytes, nextPos)
+    strLen = len(strokeWidthBytes)
     strokeWidthList = decodeVarintArray(strokeWidthBytes)
     
     strokeWidths = cumsum(strokeWidthList, 1.0)
@@ -249,12 +263,11 @@ def decodeMessagePacket(messageBytes):
 
     # color values  [BYTE STRING]
     #  (varint header)
-    msgVarintIdentifier, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    field, wireType = wire_format.UnpackTag(msgVarintIdentifier)
+    msgVarintIdentifier, nextPos = decodeVarint32(messageBytes, nextPos)
+    field, wireType = unpackTag(msgVarintIdentifier)
     #  value
-    strLen, nextPos = _DecodeVarint32(messageBytes, nextPos)
-    colorValuesBytes = messageBytes[nextPos:nextPos+strLen]
-    nextPos += strLen
+    colorValuesBytes, nextPos = decodeLengthDelimited(messageBytes, nextPos)
+    strLen = len(colorValuesBytes)
     colorValueList = decodeVarintArray(colorValuesBytes)
     
     debugPrint(f'field: {field}, wire type:{wireType}')
@@ -263,7 +276,7 @@ def decodeMessagePacket(messageBytes):
 
     debugPrint()
     
-    debugPrint(struct.unpack('B'*len(messageBytes[nextPos:]),messageBytes[nextPos:]))
+    debugPrint(tuple(messageBytes[nextPos:]))
 
     lineWidth = 0.01*sum(strokeWidths)/len(strokeWidths)
     
@@ -271,13 +284,13 @@ def decodeMessagePacket(messageBytes):
 
     #plt.axis('equal')
     
-    return (x, y, lineWidth)
+    return (x, y, lineWidth, strokeBoundingBox(x, y))
 
 
 def processBuffer(buffer):
     """ processBuffer(buffer)
 Process each message packet in WILL format and return an array of arrays of
-x,y, lineWidth values.
+x,y, lineWidth values, and the array of the bounding boxes of the strokes.
 The buffer should be the paths.protobuf file in the WILL mini filesystem.
 This function walks through each message packet and decodifies it, assembling
 the array of vectors x, y and linewidth
@@ -288,14 +301,11 @@ buffer : Whole protobuffer read from the WILL file.
     xData = []
     yData = []
     lineData = []
-    minX = 10000
-    maxX = -10000
-    minY = 10000
-    maxY = -10000
+    boxes = []
     
     buffPos = 0
     while buffPos < len(buffer):
-        messageLength, buffPos = _DecodeVarint32(buffer, buffPos)
+        messageLength, buffPos = decodeVarint32(buffer, buffPos)
         messageBytes = buffer[buffPos:buffPos+messageLength]
         buffPos += messageLength
         
@@ -303,14 +313,15 @@ buffer : Whole protobuffer read from the WILL file.
         #print('messageBytes:')
         #print(messageBytes)
         
-        (x, y, lineWidth) = decodeMessagePacket(messageBytes)
+        (x, y, lineWidth, box) = decodeMessagePacket(messageBytes)
         
         xData.append(x)
         yData.append(y)
         lineData.append(lineWidth)
+        boxes.append(box)
 
         
-    return (xData, yData, lineData)
+    return (xData, yData, lineData, boxes)
 
         
    
@@ -327,48 +338,60 @@ bytes buffer
 inputFile : string with the .will file.
     """
     
+    strokes_protobuf=will_reader.listWillProtobuffs(inputFile)
     input_zip=ZipFile(inputFile)
-    zip_namelist=input_zip.namelist()
-    strokes_protobuf=fnmatch.filter(zip_namelist,'sections/media/*.protobuf')
     debugPrint(strokes_protobuf[0])
 
     # return input_zip.read(strokes_protobuf[0])
     return map(input_zip.read, strokes_protobuf)
 
 
+def convertPage(member, outputFile):
+    """ convertPage(member, outputFile)
+Decodes one page (protobuf member) of the archive opened by
+will_reader_slate_A4.openWorkerArchive, writes its SVG through cairosvg to
+outputFile and its Ipe document next to it (.ipe instead of .svg). Returns the
+number of strokes.
 
+member     : name of the protobuf member of the page
+outputFile : string with the .svg file
+    """
 
-if __name__=='__main__':
+    (xData, yData, lineData, boxes) = processBuffer(will_reader_slate_A4.workerZip.read(member))
+
+    boundingBox = pageBoundingBox(boxes)
+    svgStr = XYLineDataToSVG(xData, yData, lineData, boundingBox)
 
-    if not len(sys.argv) == 2:
-        print('Usage: will_reader.py [filename]\n where filename is the name of the WILL file without the extension.\n\n Obs.: the file.svg will be overitten')
-    else:
-        fileName = sys.argv[1]
+    svg2svg(bytestring=svgStr, write_to=outputFile)
 
-        buffer=readWillProtobuff(fileName + '.will')
-        for i,n in zip(buffer,range(99)):
-            print(n)
-            (xData, yData, lineData) = processBuffer(i)
+    # the Ipe document is written from the same strokes, instead of
+    # running svgtoipe on the SVG
+    with open(os.path.splitext(outputFile)[0] + '.ipe','wt') as f:
+        writeIPE(f, xData, yData, lineData, boundingBox)
 
-            plotXYLineData(xData, yData, lineData)
+    return len(xData)
 
-            svgStr = XYLineDataToSVG(xData, yData, lineData)
 
-            datei_name=fileName +'_'+str(n).zfill(2)+ '.svg'
 
-            svg2svg(bytestring=svgStr, write_to=datei_name)
-            run(['svgtoipe',datei_name],shell=False)
 
+if __name__=='__main__':
+
+    parser = argparse.ArgumentParser(description='Convert each page of a Wacom Bamboo Slate WILL file to SVG through cairosvg and to Ipe (file_00.svg, file_00.ipe, ...).\n\nNote: The files will be overitten without warning.',formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument( dest='filename',default=False, help="name of the WILL file without the extension", type=str)
+
+    args = parser.parse_args()
 
-            # with open(fileName +'_'+str(n).zfill(2)+ '.svg','wt') as f:
-            #     f.write(svgStr)
+    # same pool and page names as will_reader_slate_A4, every page is written
+    for n, outputFile, numStrokes in will_reader_slate_A4.convertPages(args.filename, args.jobs, convertPage):
+        print(n)
 
 
 
 #        buffer = readWillProtobuff(fileName + '.will')
 #    
 #    
-#        (xData, yData, lineData) = processBuffer(buffer)
+#        (xData, yData, lineData, boxes) = processBuffer(buffer)
 #    
 #    
 #        plotXYLineData(xData, yData, lineData)
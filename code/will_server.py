@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP service converting uploaded Wacom WILL files to SVG.
+
+A long running asyncio server, so the modules are imported once instead of
+once per conversion. The .will file is the body of a POST /convert request,
+the options are in the query string (?poly=1&simplify=0.05&fit=0.5&relative=1
+&outline=1, as the options of will_reader.py). The upload is converted in
+memory (see will_reader.streamSVG) by a pool of worker processes, so the event
+loop never decodes anything; nothing is written to disk. The worker decodes
+all the strokes at once, so the header of the SVG is written first (see the
+decodeFirst option of will_reader.streamSVG), and sends the document in
+chunks through a queue as it is written, which the server forwards with the
+chunked transfer encoding as they arrive.
+Backpressure: at most maxPending requests are converted or sent at a time, the
+body of the other ones is not read until a slot is free (so the uploads wait
+in the sockets), every chunk of the response waits for the client to drain it,
+and a worker waits when QUEUE_CHUNKS of its chunks are not sent yet. The times
+of the request (waiting for a slot, upload, conversion and the stages of the
+worker, see will_stats) are only known at the end, so they are sent in a
+Server-Timing trailer, with the number of strokes and points in the X-Strokes
+and X-Points trailers. If a worker process dies, the pool is started again.
+
+@author: ninguem
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, parse_qs
+import multiprocessing
+import io
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+import will_reader
+
+DEFAULT_PORT = 8000
+
+# maximum size of an upload
+DEFAULT_MAX_UPLOAD = 64*1024*1024
+
+# maximum size of the request line and headers
+MAX_HEAD_SIZE = 16*1024
+
+# size of the chunks of the streamed responses
+RESPONSE_CHUNK_SIZE = 64*1024
+
+# chunks a worker can queue ahead of the client
+QUEUE_CHUNKS = 16
+
+# start method of the worker processes (see ConversionServer.startPool)
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 411: 'Length Required',
+                413: 'Payload Too Large', 422: 'Unprocessable Entity', 500: 'Internal Server Error'}
+
+
+def warmUp():
+    """ warmUp()
+Initializer of the worker processes: imports numpy (for the vectorized
+decoder, see will_reader.decodeMessages) and the modules of the optional
+stages, so the first requests do not pay for it.
+    """
+
+    will_reader.importNumpy()
+    try:
+        import will_fit, will_outline, will_simplify
+    except ImportError:     # no numpy, parseOptions refuses these stages
+        pass
+
+
+def parseOptions(query):
+    """ parseOptions(query)
+Returns the dictionary of the conversion options (poly, simplify, fit,
+relative, outline) of the query string of a request. Raises ValueError for
+unknown options or bad values, and for the options that need numpy when it is
+not installed.
+    """
+
+    options = {}
+    for name, values in parse_qs(query, keep_blank_values=True).items():
+        value = values[-1]
+        if name in ('poly', 'relative', 'outline'):
+            options[name] = value.lower() not in ('0', 'false', 'no')
+        elif name in ('simplify', 'fit'):
+            options[name] = float(value)
+        else:
+            raise ValueError(f'Unknown option {name}.')
+    option = will_reader.missingNumpy([('outline', options.get('outline', False)), ('fit', options.get('fit') is not None), ('simplify', options.get('simplify') is not None)])
+    if option is not None:
+        raise ValueError(f'The option {option} requires numpy, which is not installed.')
+
+    return options
+
+
+class ChunkWriter(io.TextIOBase):
+    """ ChunkWriter(chunks, chunkSize=RESPONSE_CHUNK_SIZE)
+Text file-like object that puts what is written to it on the queue chunks,
+encoded, in chunks of about chunkSize bytes. It is not seekable, so SVGWriter
+writes to it as it goes.
+
+chunks    : queue (e.g. of a multiprocessing.Manager)
+chunkSize : size of the chunks
+    """
+
+    def __init__(self, chunks, chunkSize=RESPONSE_CHUNK_SIZE):
+        self.chunks = chunks
+        self.chunkSize = chunkSize
+        self.pending = []
+        self.pendingSize = 0
+
+    def write(self, text):
+        self.pending.append(text)
+        self.pendingSize += len(text)
+        if self.pendingSize >= self.chunkSize:
+            self.flush()
+
+        return len(text)
+
+    def flush(self):
+        if self.pending:
+            self.chunks.put(''.join(self.pending).encode())
+            self.pending = []
+            self.pendingSize = 0
+
+
+def convertUpload(data, options, chunks):
+    """ convertUpload(data, options, chunks)
+Worker function: converts the bytes of a .will file to SVG in memory, putting
+the document on the queue chunks as it is written (see ChunkWriter), and
+returns (numStrokes, numPoints, stageTimes), stageTimes being the seconds
+spent in each stage of the conversion, without its nested stages (the self
+times of will_stats). Without numpy the
+strokes are not decoded first, and the document is only put on the queue at
+the end (see will_reader.streamSVG).
+
+data    : bytes of the .will file
+options : dictionary of the options (see parseOptions)
+chunks  : queue of the chunks
+    """
+
+    stats = will_reader.enableStats()
+    simplifier = None
+    if options.get('simplify') is not None:
+        from will_simplify import StrokeSimplifier
+        simplifier = StrokeSimplifier(options['simplify'])
+
+    f = ChunkWriter(chunks)
+    numStrokes, numPoints = will_reader.streamSVG(data, f, options.get('poly', False), simplifier, options.get('fit'), options.get('relative', False), options.get('outline', False),
+                                                  decodeFirst=will_reader.importNumpy() is not None)
+    f.flush()
+
+    return (numStrokes, numPoints, dict(stats.selfTimes))
+
+
+class ConversionServer:
+    """ ConversionServer(jobs=None, maxPending=None, maxUpload=DEFAULT_MAX_UPLOAD, log=sys.stderr)
+The HTTP service, see the module documentation.
+
+jobs       : number of worker processes (default: number of CPUs)
+maxPending : maximum number of requests converted or sent at a time
+             (default: twice the number of workers)
+maxUpload  : maximum size of an upload in bytes
+log        : text file-like object for the log of the requests, or None
+    """
+
+    def __init__(self, jobs=None, maxPending=None, maxUpload=DEFAULT_MAX_UPLOAD, log=sys.stderr):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.maxPending = maxPending or 2*self.jobs
+        self.maxUpload = maxUpload
+        self.log = log
+        self.executor = None
+        self.manager = None
+        self.readers = None
+        self.slots = None
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT):
+        """ serve(host='127.0.0.1', port=DEFAULT_PORT)
+Starts the worker pool and serves forever.
+        """
+
+        server = await self.start(host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.shutdown()
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        """ start(host='127.0.0.1', port=DEFAULT_PORT)
+Starts the worker pool and the listening socket, returns the asyncio.Server.
+The chunks come from the workers through queues of a multiprocessing.Manager,
+which are read (and ended) by a pool of threads, two per request.
+        """
+
+        self.executor = self.startPool()
+        self.manager = multiprocessing.get_context(POOL_START_METHOD).Manager()
+        self.readers = ThreadPoolExecutor(max_workers=2*self.maxPending)
+        self.slots = asyncio.Semaphore(self.maxPending)
+
+        return await asyncio.start_server(self.handleConnection, host, port, limit=MAX_HEAD_SIZE)
+
+    def shutdown(self):
+        """ shutdown()
+Stops the worker pool, the readers of the queues and their manager (the
+asyncio.Server returned by start is closed by the caller).
+        """
+
+        self.executor.shutdown()
+        self.readers.shutdown()
+        self.manager.shutdown()
+
+    async def handleConnection(self, reader, writer):
+        """ handleConnection(reader, writer)
+Handles one request of a connection, which is then closed.
+        """
+
+        startTime = time.perf_counter()
+        try:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+                method, target, headers = self.parseHead(head)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                await self.sendError(writer, 400, 'Bad request.')
+                return
+            await self.handleRequest(reader, writer, method, target, headers, startTime)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def parseHead(self, head):
+        """ parseHead(head)
+Returns (method, target, headers) of the request line and headers, the header
+names in lower case. Raises ValueError if they are malformed.
+        """
+
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, version = lines[0].split(' ')
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+        return (method, target, headers)
+
+    async def handleRequest(self, reader, writer, method, target, headers, startTime):
+        """ handleRequest(reader, writer, method, target, headers, startTime)
+Converts the upload of a POST /convert request and streams the SVG back.
+        """
+
+        url = urlsplit(target)
+        if url.path != '/convert':
+            await self.sendError(writer, 404, 'Not found, POST the .will file to /convert.')
+            return
+        if method != 'POST':
+            await self.sendError(writer, 405, 'Only POST is supported.', [('Allow', 'POST')])
+            return
+        try:
+            options = parseOptions(url.query)
+        except ValueError as e:
+            await self.sendError(writer, 400, str(e))
+            return
+        if not headers.get('content-length', '').isdigit():
+            await self.sendError(writer, 411, 'The Content-Length header is required.')
+            return
+        length = int(headers['content-length'])
+        if not 0 <= length <= self.maxUpload:
+            await self.sendError(writer, 413, f'Uploads are limited to {self.maxUpload} bytes.')
+            return
+
+        async with self.slots:
+            times = {'queue': time.perf_counter() - startTime}
+
+            uploadTime = time.perf_counter()
+            data = await reader.readexactly(length)
+            times['upload'] = time.perf_counter() - uploadTime
+
+            loop = asyncio.get_running_loop()
+            chunks = self.manager.Queue(QUEUE_CHUNKS)
+            executor = self.executor
+            convertTime = time.perf_counter()
+            try:
+                conversion = asyncio.wrap_future(executor.submit(convertUpload, data, options, chunks))
+            except BrokenProcessPool:
+                self.restartPool(executor)
+                await self.sendError(writer, 500, 'A worker process died, try again.')
+                self.logRequest(target, 'FAILED BrokenProcessPool', startTime)
+                return
+            del data
+            ending = asyncio.ensure_future(self.endChunks(conversion, chunks))
+
+            started = False
+            numBytes = 0
+            chunk = await loop.run_in_executor(self.readers, chunks.get)
+            try:
+                if chunk is None:
+                    # the conversion ended without writing anything
+                    await conversion
+                await self.sendHeaders(writer, 200, [('Content-Type', 'image/svg+xml'), ('Transfer-Encoding', 'chunked'),
+                                                     ('Trailer', 'Server-Timing, X-Strokes, X-Points')])
+                started = True
+                while chunk is not None:
+                    writer.write(b'%x\r\n%b\r\n' % (len(chunk), chunk))
+                    await writer.drain()
+                    numBytes += len(chunk)
+                    chunk = await loop.run_in_executor(self.readers, chunks.get)
+                numStrokes, numPoints, stageTimes = await conversion
+            except BrokenProcessPool:
+                self.restartPool(executor)
+                if not started:
+                    await self.sendError(writer, 500, 'A worker process died, try again.')
+                self.logRequest(target, 'FAILED BrokenProcessPool', startTime)
+                return
+            except ConnectionError:
+                raise
+            except Exception as e:
+                # once the response started, the client only sees it cut short
+                if not started:
+                    await self.sendError(writer, 422, f'{type(e).__name__}: {e}')
+                self.logRequest(target, f'FAILED {type(e).__name__}: {e}', startTime)
+                return
+            finally:
+                # the worker waits on a full queue, so the rest is read even if
+                # the client is gone
+                while chunk is not None:
+                    chunk = await loop.run_in_executor(self.readers, chunks.get)
+                await ending
+            times['convert'] = time.perf_counter() - convertTime
+            times.update(stageTimes)
+
+            serverTiming = ', '.join(f'{name};dur={seconds*1000:.2f}' for name, seconds in times.items())
+            trailers = f'Server-Timing: {serverTiming}\r\nX-Strokes: {numStrokes}\r\nX-Points: {numPoints}\r\n'
+            writer.write(b'0\r\n' + trailers.encode('latin-1') + b'\r\n')
+            await writer.drain()
+
+        self.logRequest(target, f'OK {numStrokes} strokes, {numPoints} points, {numBytes} bytes', startTime)
+
+    async def endChunks(self, conversion, chunks):
+        """ endChunks(conversion, chunks)
+Puts None on the queue chunks once the conversion is done, successfully or
+not (even if its worker process died), so the reader of the queue stops.
+        """
+
+        await asyncio.wait((conversion,))
+        await asyncio.get_running_loop().run_in_executor(self.readers, chunks.put, None)
+
+    def restartPool(self, executor):
+        """ restartPool(executor)
+Replaces the worker pool executor, broken because one of its processes died,
+unless another request already did.
+        """
+
+        if executor is self.executor:
+            executor.shutdown(wait=False)
+            self.executor = self.startPool()
+
+    def startPool(self):
+        """ startPool()
+Returns a new worker pool executor. The workers are started by a fork server
+(or spawned), not forked from the server: forked workers would inherit the
+sockets open at the time, and keep the connections of the clients open after
+the server closed them.
+        """
+
+        return ProcessPoolExecutor(max_workers=self.jobs, mp_context=multiprocessing.get_context(POOL_START_METHOD), initializer=warmUp)
+
+    async def sendHeaders(self, writer, status, headers):
+        """ sendHeaders(writer, status, headers)
+Writes the status line and the (name, value) headers of the response.
+        """
+
+        lines = [f'HTTP/1.1 {status} {HTTP_REASONS[status]}'] + [f'{name}: {value}' for name, value in headers] + ['Connection: close', '', '']
+        writer.write('\r\n'.join(lines).encode('latin-1'))
+        await writer.drain()
+
+    async def sendError(self, writer, status, message, headers=()):
+        """ sendError(writer, status, message, headers=())
+Writes a text response with the error message.
+        """
+
+        body = (message + '\n').encode()
+        await self.sendHeaders(writer, status, [('Content-Type', 'text/plain; charset=utf-8'), ('Content-Length', len(body))] + list(headers))
+        writer.write(body)
+        await writer.drain()
+
+    def logRequest(self, target, result, startTime):
+        """ logRequest(target, result, startTime)
+Prints one line for the request to the log.
+        """
+
+        if self.log is not None:
+            print(f'{target}: {result}, {(time.perf_counter() - startTime)*1000:.1f} ms', file=self.log, flush=True)
+
+
+if __name__=='__main__':
+
+    parser = argparse.ArgumentParser(description='Serve the conversion of Wacom WILL files to SVG over HTTP.\n\nPOST the .will file to /convert (options in the query string: poly, simplify,\nfit, relative, outline), e.g.\n  curl --data-binary @file.will "http://127.0.0.1:8000/convert?relative=1" -o file.svg',formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--max-pending', type=int, default=None, help='maximum number of requests converted at a time, the others wait (default: twice the workers)')
+    parser.add_argument('--max-upload', type=float, default=DEFAULT_MAX_UPLOAD/2**20, help=f'maximum size of an upload in MB (default: {DEFAULT_MAX_UPLOAD//2**20})')
+
+    args = parser.parse_args()
+
+    server = ConversionServer(args.jobs, args.max_pending, int(args.max_upload*2**20))
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Simplification of the strokes (Ramer-Douglas-Peucker).
+
+The tablet samples are dense, and many of them lie within a fraction of a
+unit of the line through their neighbours. The Ramer-Douglas-Peucker
+algorithm keeps the first and last points of each stroke and recursively the
+point farthest from the chord between two kept points, as long as it is
+farther than the tolerance. Here the recursion is replaced by a loop over the
+pending segments of all the strokes at once: every pass computes the
+distances of all the interior points of all the segments with a few numpy
+operations and splits the segments whose farthest point is out of tolerance,
+so the number of passes is the depth of the recursion, not the number of
+segments.
+Requires numpy.
+
+@author: ninguem
+"""
+import itertools
+
+import numpy as np
+
+
+def simplifyMask(x, y, offsets, tolerance):
+    """ simplifyMask(x, y, offsets, tolerance)
+Returns the boolean array of the points kept by the Ramer-Douglas-Peucker
+simplification of each stroke. The first and last points of every stroke are
+always kept.
+
+x         : x coordinates of all the points
+y         : y coordinates of all the points
+offsets   : array with len(strokes)+1 indexes of the start of each stroke
+tolerance : maximum distance of a removed point to the simplified stroke
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    keep = np.zeros(len(x), dtype=bool)
+    starts = offsets[:-1]
+    ends = offsets[1:] - 1
+    nonEmpty = ends >= starts
+    keep[starts[nonEmpty]] = True
+    keep[ends[nonEmpty]] = True
+
+    # segments (start, end) of kept points with points in between
+    pending = ends - starts >= 2
+    starts = starts[pending]
+    ends = ends[pending]
+    while len(starts):
+        lengths = ends - starts - 1
+        firsts = np.cumsum(lengths) - lengths
+        segment = np.repeat(np.arange(len(starts)), lengths)
+        interior = np.arange(lengths.sum()) + np.repeat(starts + 1 - firsts, lengths)
+
+        # distance of each interior point to the chord of its segment (to the
+        # start point when the chord is degenerate)
+        chordX = (x[ends] - x[starts])[segment]
+        chordY = (y[ends] - y[starts])[segment]
+        chordLength = np.hypot(chordX, chordY)
+        pointX = x[interior] - x[starts][segment]
+        pointY = y[interior] - y[starts][segment]
+        distance = np.where(chordLength > 0,
+                            np.abs(pointX*chordY - pointY*chordX)/np.where(chordLength > 0, chordLength, 1),
+                            np.hypot(pointX, pointY))
+
+        # first farthest point of each segment
+        maxDistance = np.maximum.reduceat(distance, firsts)
+        candidates = np.flatnonzero(distance == maxDistance[segment])
+        firstCandidates = candidates[np.concatenate(([True], np.diff(segment[candidates]) > 0))]
+        splits = interior[firstCandidates]
+
+        refine = maxDistance > tolerance
+        splits = splits[refine]
+        keep[splits] = True
+
+        starts = np.concatenate((starts[refine], splits))
+        ends = np.concatenate((splits, ends[refine]))
+        pending = ends - starts >= 2
+        starts = starts[pending]
+        ends = ends[pending]
+
+    return keep
+
+
+class StrokeSimplifier:
+    """ StrokeSimplifier(tolerance, batchSize=256)
+Applies simplifyMask to strokes, between the decoding and the SVG output, and
+counts the points it removes. The same object can be used for several
+documents, the counts add up.
+
+tolerance : maximum distance of a removed point to the simplified stroke, in
+            the units of the coordinates
+batchSize : number of strokes simplified together by simplify()
+    """
+
+    def __init__(self, tolerance, batchSize=256):
+        self.tolerance = tolerance
+        self.batchSize = batchSize
+        self.numPoints = 0
+        self.numRemoved = 0
+
+    def simplify(self, strokes):
+        """ simplify(strokes)
+Generator that yields the simplified (x, y, lineWidth) of each stroke, x and y
+being lists. The strokes are read and simplified batchSize at a time, so a
+stream of strokes is still processed in constant memory.
+
+strokes : iterable of (x, y, lineWidth) tuples, lineWidth being the scalar
+          linewidth of the stroke or the array of the widths of its points (as
+          returned by decodeMessagePacket, the widths of the removed points are
+          removed too); any other item after x and y (e.g. the decimal
+          precision) is kept
+        """
+
+        strokes = iter(strokes)
+        while True:
+            batch = list(itertools.islice(strokes, self.batchSize))
+            if not batch:
+                return
+            yield from self.simplifyBatch(batch)
+
+    def simplifyBatch(self, batch):
+        """ simplifyBatch(batch)
+Returns the list of the simplified (x, y, lineWidth) of the list of strokes
+batch.
+        """
+
+        offsets = np.zeros(len(batch)+1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(stroke[0]) for stroke in batch])
+        x = np.fromiter(itertools.chain.from_iterable(stroke[0] for stroke in batch), dtype=np.float64, count=offsets[-1])
+        y = np.fromiter(itertools.chain.from_iterable(stroke[1] for stroke in batch), dtype=np.float64, count=offsets[-1])
+
+        keep = simplifyMask(x, y, offsets, self.tolerance)
+        keptOffsets = np.concatenate(([0], np.cumsum(keep)))[offsets].tolist()
+        self.count(len(keep), len(keep) - keptOffsets[-1])
+
+        keptX = x[keep].tolist()
+        keptY = y[keep].tolist()
+
+        simplified = []
+        for start, stop, first, last, stroke in zip(keptOffsets[:-1], keptOffsets[1:], offsets[:-1], offsets[1:], batch):
+            if len(stroke) > 2 and np.ndim(stroke[2]) == 1:
+                # widths of the points
+                stroke = stroke[:2] + (np.asarray(stroke[2])[keep[first:last]],) + stroke[3:]
+            simplified.append((keptX[start:stop], keptY[start:stop]) + stroke[2:])
+
+        return simplified
+
+    def simplifyStrokeSet(self, strokes):
+        """ simplifyStrokeSet(strokes)
+Returns a new will_reader.StrokeSet with the points of strokes kept by the
+simplification (the widths of the kept points are kept too).
+        """
+
+        keep = simplifyMask(strokes.x, strokes.y, strokes.offsets, self.tolerance)
+        simplified = strokes.select(keep)
+        self.count(strokes.numPoints, strokes.numPoints - simplified.numPoints)
+
+        return simplified
+
+    def count(self, numPoints, numRemoved):
+        """ count(numPoints, numRemoved)
+Adds to the counts of input and removed points.
+        """
+
+        self.numPoints += numPoints
+        self.numRemoved += numRemoved
+
+    def report(self):
+        """ report()
+Returns a one line summary of the points removed.
+        """
+
+        percent = 100*self.numRemoved/self.numPoints if self.numPoints else 0
+
+        return f'simplification (tolerance {self.tolerance}): removed {self.numRemoved} of {self.numPoints} points ({percent:.1f}%)'
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the WILL readers: counters and per stage timers.
+
+The readers keep a module level STATS that is None when instrumentation is
+disabled, so the hot paths only pay for an `is None` test. When enabled, it
+holds a Stats object that accumulates counters (bytes, messages, points
+decoded) and the time spent in each stage, and can export them as JSON or in
+the pstats format of cProfile (readable with pstats, snakeviz, ...).
+
+@author: ninguem
+"""
+import time
+import json
+import marshal
+
+
+class Timer:
+    """ Timer(stats, name)
+Context manager that adds the time spent inside it to the stage name of stats.
+A new one is made for each `with`, so the stages can be nested or reentered.
+    """
+
+    __slots__ = ('stats', 'name', 'startTime', 'childTime')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.stats.startTimer(self)
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stats.stopTimer(self)
+
+
+class Stats:
+    """ Stats()
+Accumulates counters and stage timings. The stages timed inside another one
+(e.g. 'fit' inside 'svg') are nested: the time of a stage (times) includes
+the time of its nested stages, its self time (selfTimes) does not, so the self
+times add up to the time spent in the stages.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.times = {}
+        self.selfTimes = {}
+        self.calls = {}
+        # (outer stage, stage): [calls, self time, time] of the nested stages
+        self.nested = {}
+        # timers running, innermost last
+        self.running = []
+
+    def count(self, name, n=1):
+        """ count(name, n=1)
+Adds n to the counter name.
+        """
+
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def addTime(self, name, seconds, selfSeconds=None):
+        """ addTime(name, seconds, selfSeconds=None)
+Adds one call of the given duration to the stage name.
+
+name        : name of the stage
+seconds     : duration of the call
+selfSeconds : duration without the nested stages (default: seconds)
+        """
+
+        if selfSeconds is None:
+            selfSeconds = seconds
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        self.selfTimes[name] = self.selfTimes.get(name, 0.0) + selfSeconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def startTimer(self, timer):
+        """ startTimer(timer)
+Starts the Timer timer, nested in the innermost running one.
+        """
+
+        timer.childTime = 0.0
+        self.running.append(timer)
+        timer.startTime = time.perf_counter()
+
+    def stopTimer(self, timer):
+        """ stopTimer(timer)
+Stops the Timer timer (the innermost running one) and adds its time to its
+stage, and to the nested time of the outer one.
+        """
+
+        seconds = time.perf_counter() - timer.startTime
+        self.running.pop()
+        selfSeconds = seconds - timer.childTime
+        # a stage reentered inside itself is only counted once in times
+        if any(outer.name == timer.name for outer in self.running):
+            seconds = 0.0
+        self.addTime(timer.name, seconds, selfSeconds)
+        if self.running:
+            outer = self.running[-1]
+            outer.childTime += selfSeconds + timer.childTime
+            nested = self.nested.setdefault((outer.name, timer.name), [0, 0.0, 0.0])
+            nested[0] += 1
+            nested[1] += selfSeconds
+            nested[2] += seconds
+
+    def timer(self, name):
+        """ timer(name)
+Returns a new context manager that times the stage name.
+        """
+
+        return Timer(self, name)
+
+    def timeIterator(self, name, iterator):
+        """ timeIterator(name, iterator)
+Generator that yields the items of iterator, adding the time spent producing
+each one to the stage name (nested in the stage consuming the item, if any).
+        """
+
+        iterator = iter(iterator)
+        while True:
+            with Timer(self, name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def toDict(self):
+        """ toDict()
+Returns the counters and timers as a JSON serializable dictionary.
+        """
+
+        return {
+            'counters': dict(self.counters),
+            'stages': {name: {'seconds': seconds, 'self_seconds': self.selfTimes[name], 'calls': self.calls[name]} for name, seconds in self.times.items()},
+            'nested': [{'outer': outer, 'stage': name, 'calls': calls, 'self_seconds': selfSeconds, 'seconds': seconds}
+                       for (outer, name), (calls, selfSeconds, seconds) in self.nested.items()],
+        }
+
+    def writeJSON(self, fileName):
+        """ writeJSON(fileName)
+Writes toDict() to the file fileName.
+        """
+
+        with open(fileName, 'wt') as f:
+            json.dump(self.toDict(), f, indent=1)
+
+    def dumpStats(self, fileName):
+        """ dumpStats(fileName)
+Writes the stage timings in the format of cProfile.Profile.dump_stats, one
+pseudo function per stage, called by the stages it is nested in, so they can
+be read with pstats.Stats(fileName).
+        """
+
+        callers = {name: {} for name in self.times}
+        for (outer, name), (calls, selfSeconds, seconds) in self.nested.items():
+            callers[name][('will_reader', 0, outer)] = (calls, calls, selfSeconds, seconds)
+        stats = {('will_reader', 0, name): (self.calls[name], self.calls[name], self.selfTimes[name], seconds, callers[name])
+                 for name, seconds in self.times.items()}
+        with open(fileName, 'wb') as f:
+            marshal.dump(stats, f)
+
+    def nestedNames(self):
+        """ nestedNames()
+Returns the set of the stages that have nested stages.
+        """
+
+        return {outer for outer, name in self.nested}
+
+    def report(self):
+        """ report()
+Returns a human readable summary, with the self time of each stage and, when
+it differs, its time including the nested stages.
+        """
+
+        nestedNames = self.nestedNames()
+        lines = [f'{name:12s} {value}' for name, value in self.counters.items()]
+        for name, seconds in self.times.items():
+            total = f' ({seconds*1000:.2f} ms with nested stages)' if name in nestedNames else ''
+            lines.append(f'{name:12s} {self.selfTimes[name]*1000:10.2f} ms in {self.calls[name]} calls{total}')
+
+        return '\n'.join(lines)
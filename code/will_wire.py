@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Minimal protobuf wire format reader used by the WILL readers.
+
+It only implements what is needed to walk the paths.protobuf messages
+(varints, fixed32 floats, length-delimited fields and tags), so the readers do
+not depend on the private google.protobuf.internal modules, whose behaviour
+changes between protobuf releases and backends, and do not pay for importing
+protobuf at startup.
+
+All the functions take a bytes-like buffer (bytes, bytearray, memoryview or
+mmap) and a position, and return the decoded value and the next position, as
+protobuf's decoders do. A value running past the end of the buffer raises
+ValueError.
+
+@author: ninguem
+"""
+import struct
+
+
+WIRETYPE_VARINT = 0
+WIRETYPE_FIXED64 = 1
+WIRETYPE_LENGTH_DELIMITED = 2
+WIRETYPE_START_GROUP = 3
+WIRETYPE_END_GROUP = 4
+WIRETYPE_FIXED32 = 5
+
+_FLOAT = struct.Struct('<f')
+
+
+def decodeVarint(buffer, pos):
+    """ decodeVarint(buffer, pos)
+Decodes the unsigned varint starting at buffer[pos] and returns
+(value, nextPos). Single byte varints (the lengths and tags of most WILL
+fields) take a fast path.
+
+buffer : bytes-like object
+pos    : position of the first byte of the varint
+    """
+
+    try:
+        b = buffer[pos]
+    except IndexError:
+        raise ValueError('Truncated varint.') from None
+    if b < 0x80:
+        return (b, pos+1)
+
+    result = b & 0x7F
+    shift = 7
+    pos += 1
+    try:
+        while True:
+            b = buffer[pos]
+            pos += 1
+            result |= (b & 0x7F) << shift
+            if b < 0x80:
+                return (result, pos)
+            shift += 7
+            if shift >= 64:
+                raise ValueError('Too many bytes when decoding varint.')
+    except IndexError:
+        raise ValueError('Truncated varint.') from None
+
+
+def decodeVarint32(buffer, pos):
+    """ decodeVarint32(buffer, pos)
+Same as decodeVarint, with the value truncated to 32 bits (as protobuf's
+_DecodeVarint32 does).
+
+buffer : bytes-like object
+pos    : position of the first byte of the varint
+    """
+
+    try:
+        b = buffer[pos]
+    except IndexError:
+        raise ValueError('Truncated varint.') from None
+    if b < 0x80:
+        return (b, pos+1)
+
+    value, pos = decodeVarint(buffer, pos)
+
+    return (value & 0xFFFFFFFF, pos)
+
+
+def unpackTag(tag):
+    """ unpackTag(tag)
+Splits a field tag into its (fieldNumber, wireType).
+
+tag : decoded varint of the tag
+    """
+
+    return (tag >> 3, tag & 7)
+
+
+def decodeFloat(buffer, pos):
+    """ decodeFloat(buffer, pos)
+Decodes the little endian fixed32 float at buffer[pos] and returns
+(value, nextPos).
+
+buffer : bytes-like object
+pos    : position of the float
+    """
+
+    if pos + 4 > len(buffer):
+        raise ValueError('Truncated fixed32 field.')
+
+    return (_FLOAT.unpack_from(buffer, pos)[0], pos+4)
+
+
+def decodeLengthDelimited(buffer, pos):
+    """ decodeLengthDelimited(buffer, pos)
+Decodes the length prefix at buffer[pos] and returns (value, nextPos), where
+value is the slice of buffer with the field content (a view when buffer is a
+memoryview).
+
+buffer : bytes-like object
+pos    : position of the length prefix
+    """
+
+    length, pos = decodeVarint(buffer, pos)
+    end = pos + length
+    if end > len(buffer):
+        raise ValueError('Truncated length-delimited field.')
+
+    return (buffer[pos:end], end)
+
+
+def skipField(buffer, pos, wireType):
+    """ skipField(buffer, pos, wireType)
+Returns the position after the value of a field of the given wire type that
+starts at buffer[pos], without decoding it. Length-delimited fields are skipped
+using their length.
+
+buffer   : bytes-like object
+pos      : position of the field value (after the tag)
+wireType : wire type of the field
+    """
+
+    if wireType == WIRETYPE_VARINT:
+        return decodeVarint(buffer, pos)[1]
+    if wireType == WIRETYPE_FIXED32:
+        end = pos + 4
+    elif wireType == WIRETYPE_FIXED64:
+        end = pos + 8
+    elif wireType == WIRETYPE_LENGTH_DELIMITED:
+        length, pos = decodeVarint(buffer, pos)
+        end = pos + length
+    else:
+        raise ValueError(f'Unsupported wire type {wireType}.')
+    if end > len(buffer):
+        raise ValueError('Truncated field.')
+
+    return end
+
+
+def decodePackedVarints(buffer):
+    """ decodePackedVarints(buffer)
+Decodes a whole packed array of unsigned varints (truncated to 32 bits) into a
+list, in a single loop over the bytes.
+
+buffer : bytes-like object with the packed varints
+    """
+
+    values = []
+    append = values.append
+    result = 0
+    shift = 0
+    for b in buffer:
+        if b < 0x80:
+            append((result | (b << shift)) & 0xFFFFFFFF)
+            result = 0
+            shift = 0
+        else:
+            result |= (b & 0x7F) << shift
+            shift += 7
+            if shift >= 64:
+                raise ValueError('Too many bytes when decoding varint.')
+    if shift:
+        raise ValueError('Truncated varint.')
+
+    return values